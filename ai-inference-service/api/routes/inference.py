@@ -1,12 +1,13 @@
 from fastapi import APIRouter, File, UploadFile, Form
 from fastapi.responses import JSONResponse
 from typing import Optional
-import tempfile
-import os
 from services.inference_service import (
     analyze_image_service, 
     detect_realtime_service,
 )
+from core.config import settings
+from services.inference_executor import InferenceQueueFull, run_inference
+from utils.image_utils import decode_image_info
 
 router = APIRouter(tags=["inference"])
 
@@ -20,23 +21,30 @@ async def analyze_image(
             content={"error": "ประเภทไฟล์ไม่ถูกต้อง อนุญาตเฉพาะรูปภาพเท่านั้น"}
         )
         
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-        temp_path = temp.name
-        contents = await image.read()
-        temp.write(contents)
+    contents = await image.read()
+    
+    # ถอดรหัสภาพครั้งเดียวในหน่วยความจำ ที่ความละเอียดไม่เกิน DECODE_MAX_SIDE
+    try:
+        decoded = await run_inference(decode_image_info, contents, settings.DECODE_MAX_SIDE)
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "ไม่สามารถอ่านไฟล์รูปภาพได้"}
+        )
         
     try:
-        result = await analyze_image_service(temp_path)
+        # ส่ง DecodedImage เพื่อให้ตัดวัตถุสำหรับ classifier จากภาพความละเอียดเต็ม
+        result = await analyze_image_service(decoded, image.filename)
+        result["image_info"] = decoded.info()
         return result
         
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"ไม่สามารถประมวลผลรูปภาพได้: {str(e)}"}
         )
-    finally:
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
 
 @router.post("/detect")
 async def detect_realtime(
@@ -52,6 +60,8 @@ async def detect_realtime(
     try:
         result = await detect_realtime_service(contents, mode)
         return result
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -1,20 +1,15 @@
 from fastapi import APIRouter, UploadFile, File
+from core.config import settings
 from services.vector_service import create_vector_embedding
-import tempfile
-import os
-import shutil
+from services.inference_executor import run_inference
+from utils.image_utils import decode_image
 
 router = APIRouter()
 
 @router.post("/generate-vector")
 async def generate_vector_endpoint(file: UploadFile = File(...)):
     """สร้าง vector embedding จากรูปภาพยาเสพติด"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp:
-        shutil.copyfileobj(file.file, temp)
-        temp_path = temp.name
-    
-    try:
-        vector = create_vector_embedding(temp_path)
-        return {"vector": vector, "dimensions": len(vector) if vector else 0}
-    finally:
-        os.unlink(temp_path)
\ No newline at end of file
+    contents = await file.read()
+    image = await run_inference(decode_image, contents, settings.DECODE_MAX_SIDE)
+    vector = await run_inference(create_vector_embedding, image)
+    return {"vector": vector, "dimensions": len(vector) if vector else 0}
\ No newline at end of file
@@ -0,0 +1,34 @@
+from typing import List
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from core.config import settings
+from services.pill_engine import PillEngineUnavailable, get_pill_engine
+
+router = APIRouter(tags=["pill"])
+
+@router.post("/pill/predict")
+async def predict_pill(
+    files: List[UploadFile] = File(...),
+    threshold: float = Form(0.80)
+):
+    """
+    จำแนกเม็ดยาจากรูปภาพ (รันใน pill engine process แยก ซึ่งเริ่มเมื่อมี request แรก)
+
+    - **files**: รูปภาพเม็ดยา (ได้หลายไฟล์)
+    - **threshold**: ความมั่นใจขั้นต่ำ ถ้าต่ำกว่านี้ผลเป็น "Unknown"
+    """
+    if len(files) > settings.PILL_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {settings.PILL_MAX_FILES})")
+
+    contents = [await file.read() for file in files]
+    try:
+        results = await get_pill_engine().predict(contents, threshold)
+    except PillEngineUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Pill engine unavailable: {e}")
+
+    return {
+        "status": "success",
+        "results": [
+            {"filename": file.filename, **result} for file, result in zip(files, results)
+        ]
+    }
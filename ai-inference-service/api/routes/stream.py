@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from ml_managers.ai_model_manager import get_model_manager
+from services.inference_executor import InferenceQueueFull, run_inference
+from services.stream_service import StreamSession
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["stream"])
+
+@router.websocket("/stream/detect")
+async def stream_detect(websocket: WebSocket):
+    """
+    ตรวจจับอาวุธจากกล้องแบบ streaming
+
+    client ส่ง frame เป็น binary JPEG ต่อเนื่อง ถ้าโมเดลยังประมวลผล frame ก่อนหน้าอยู่
+    จะเก็บไว้เฉพาะ frame ล่าสุด (frame ที่ค้างจะถูกทิ้ง) และส่งกลับ delta ของ track เป็น JSON:
+    {"frame", "added", "updated", "removed", "dropped", "process_ms"}
+    """
+    await websocket.accept()
+
+    if get_model_manager().get_segmentation_model() is None:
+        await websocket.close(code=1013, reason="Detection models not loaded")
+        return
+
+    session = await asyncio.to_thread(StreamSession)
+    latest = {"frame": None, "dropped": 0}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        while True:
+            data = await websocket.receive_bytes()
+            if latest["frame"] is not None:
+                latest["dropped"] += 1
+            latest["frame"] = data
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            waiter = asyncio.create_task(frame_ready.wait())
+            done, _ = await asyncio.wait({waiter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                waiter.cancel()
+                # client ปิดการเชื่อมต่อหรือส่งข้อมูลที่ไม่ใช่ binary
+                receiver.result()
+                return
+
+            frame_ready.clear()
+            data, latest["frame"] = latest["frame"], None
+            dropped, latest["dropped"] = latest["dropped"], 0
+
+            try:
+                delta = await run_inference(session.process_frame, data)
+            except InferenceQueueFull:
+                # server ไม่ว่าง: ข้าม frame นี้ แล้วรอ frame ถัดไป
+                latest["dropped"] += dropped + 1
+                continue
+            except ValueError:
+                await websocket.send_json({"error": "Cannot decode frame"})
+                continue
+
+            delta["dropped"] = dropped
+            await websocket.send_json(delta)
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"❌ Stream detection failed: {e}")
+        await websocket.close(code=1011)
+    finally:
+        receiver.cancel()
+        logger.info(f"Stream closed after {session.frames} frames, {session.classified} classified tracks")
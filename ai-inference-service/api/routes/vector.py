@@ -1,12 +1,19 @@
+import asyncio
 import base64
 import numpy as np
+from typing import List
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from services.vector_service import VectorService, create_vector_embedding
+from fastapi.responses import Response
+from core.config import settings
+from services.vector_service import create_vector_embedding, detect_and_embed, encode_vector, get_vector_service
+from services.inference_executor import InferenceQueueFull, run_inference
+from services.result_cache import get_result_cache, make_cache_key
+from utils.image_utils import decode_image_info
 
 router = APIRouter(tags=["vectors"])
 
-vector_service = VectorService()
+vector_service = get_vector_service()
 
 @router.post("/convert")
 async def convert_image_to_vector(
@@ -17,20 +24,30 @@ async def convert_image_to_vector(
 ):
     try:
         contents = await file.read()
+        try:
+            decoded = await run_inference(decode_image_info, contents, settings.DECODE_MAX_SIDE)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cannot decode image")
+        image = decoded.image
         
-        # ใช้ create_vector_embedding โดยตรง
-        vector_result = create_vector_embedding(contents, segment_first=segment_first)
+        # ภาพเดียวกันที่ส่งซ้ำ (หรือส่งพร้อมกัน) ใช้ผลจาก cache ไม่ต้องสร้าง vector ใหม่
+        cache_key = await asyncio.to_thread(make_cache_key, "vector", image, segment_first=segment_first)
+        vector_result = await get_result_cache().get_or_compute(
+            cache_key, lambda: run_inference(create_vector_embedding, decoded, segment_first=segment_first)
+        )
         
         # เปลี่ยนรูปแบบการส่งคืนข้อมูลเป็น base64
         response = {
             "status": "success",
             "filename": file.filename,
+            "embedding_version": vector_result.get("embedding_version"),
             "vector_info": {
                 "dimensions": vector_result.get("vector_dimension", 0),
                 # ไม่ส่ง vector เป็น JSON array อีกต่อไป
             },
             "vector_base64": vector_result.get("vector_base64"),
-            "segmentation_info": vector_result.get("segmentation_result", {})
+            "segmentation_info": vector_result.get("segmentation_result", {}),
+            "image_info": decoded.info()
         }
         
         # ตรวจสอบมิติของ vector
@@ -38,12 +55,114 @@ async def convert_image_to_vector(
             print(f"Warning: Vector dimension mismatch. Expected {target_dim}, got {response['vector_info']['dimensions']}")
         
         return response
+    except (InferenceQueueFull, HTTPException):
+        raise
     except Exception as e:
         print(f"Error in convert_image_to_vector: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+@router.post("/convert-batch")
+async def convert_images_to_vectors(
+    files: List[UploadFile] = File(...),
+    segment_first: bool = Form(True),
+    output_format: str = Form("binary")
+):
+    """
+    แปลงรูปภาพหลายภาพเป็น vector ในการเรียกครั้งเดียว (สำหรับ re-index และ bulk upload)
+    
+    - **files**: รูปภาพหลายไฟล์
+    - **segment_first**: ตัดส่วนที่เป็นยาเสพติดก่อน (default: True เหมือน /convert)
+    - **output_format**: "binary" คืน float32 matrix (N x D) แบบ little-endian เรียงตามลำดับไฟล์
+      (แถวของไฟล์ที่ล้มเหลวเป็น 0 และระบุใน header X-Failed-Indices) หรือ "json" คืน base64 ต่อไฟล์
+    """
+    if output_format not in ("binary", "json"):
+        raise HTTPException(status_code=400, detail="output_format must be 'binary' or 'json'")
+    if len(files) > settings.VECTOR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.VECTOR_BATCH_MAX_FILES} files per request")
+    
+    try:
+        contents = [await file.read() for file in files]
+        vectors, errors = await run_inference(
+            vector_service.process_image_batch, contents, normalize=True, segment_first=segment_first
+        )
+        vectors_np = [vector_service.vector_to_numpy(v) if v is not None else None for v in vectors]
+        dimension = next((len(v) for v in vectors_np if v is not None), 0)
+        
+        if output_format == "json":
+            return {
+                "status": "success",
+                "embedding_version": vector_service.embedding_version,
+                "results": [
+                    {"filename": file.filename, **encode_vector(v)} if v is not None
+                    else {"filename": file.filename, "error": error}
+                    for file, v, error in zip(files, vectors_np, errors)
+                ]
+            }
+        
+        matrix = np.zeros((len(files), dimension), dtype="<f4")
+        for i, v in enumerate(vectors_np):
+            if v is not None:
+                matrix[i] = v
+        failed = [str(i) for i, v in enumerate(vectors_np) if v is None]
+        return Response(
+            content=matrix.tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Vector-Count": str(len(files)),
+                "X-Vector-Dimension": str(dimension),
+                "X-Embedding-Version": vector_service.embedding_version,
+                "X-Failed-Indices": ",".join(failed)
+            }
+        )
+    except InferenceQueueFull:
+        raise
+    except Exception as e:
+        print(f"Error in convert_images_to_vectors: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing images: {str(e)}")
+
+@router.post("/detect-embed")
+async def detect_and_embed_image(
+    file: UploadFile = File(...),
+    all_objects: bool = Form(False)
+):
+    """
+    segment รูปภาพครั้งเดียว แล้วคืน detections พร้อม embedding ของยาเสพติด
+    (แทนการเรียก segment แล้วตามด้วย /convert ที่ segment ภาพเดิมซ้ำ)
+    
+    - **file**: รูปภาพ
+    - **all_objects**: สร้าง embedding ให้ยาเสพติดทุกชิ้น (default: เฉพาะชิ้นที่มั่นใจที่สุด)
+    """
+    try:
+        contents = await file.read()
+        try:
+            decoded = await run_inference(decode_image_info, contents, settings.DECODE_MAX_SIDE)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cannot decode image")
+        image = decoded.image
+        
+        cache_key = await asyncio.to_thread(make_cache_key, "detect_embed", image, all_objects=all_objects)
+        result = await get_result_cache().get_or_compute(
+            cache_key, lambda: run_inference(detect_and_embed, decoded, all_objects=all_objects)
+        )
+        
+        # bbox ถูกตรวจบนภาพที่ย่อแล้ว แปลงกลับเป็นพิกัดของภาพต้นฉบับ
+        for detection in result["detections"]:
+            detection["bbox"] = decoded.to_original(detection["bbox"])
+        
+        return {
+            "status": "success",
+            "filename": file.filename,
+            "image_info": decoded.info(),
+            **result
+        }
+    except (InferenceQueueFull, HTTPException):
+        raise
+    except Exception as e:
+        print(f"Error in detect_and_embed_image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
 @router.post("/similarity")
 async def calculate_image_similarity(
     file1: UploadFile = File(...),
@@ -64,8 +183,8 @@ async def calculate_image_similarity(
         contents1 = await file1.read()
         contents2 = await file2.read()
         
-        vector1 = vector_service.image_to_vector(contents1, normalize)
-        vector2 = vector_service.image_to_vector(contents2, normalize)
+        vector1 = await run_inference(vector_service.image_to_vector, contents1, normalize)
+        vector2 = await run_inference(vector_service.image_to_vector, contents2, normalize)
         
         similarity = vector_service.calculate_similarity(vector1, vector2)
         
@@ -75,5 +194,7 @@ async def calculate_image_similarity(
             "file1": file1.filename,
             "file2": file2.filename
         }
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating similarity: {str(e)}")
\ No newline at end of file
@@ -1,11 +1,16 @@
 import uvicorn
 import logging
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from api.routes import inference, narcotic, vector
+from api.routes import inference, narcotic, pill, stream, vector
 from core.config import settings
 from core.logging_config import setup_logging
 from ml_managers.ai_model_manager import get_model_manager
+from services.batch_scheduler import get_batching_metrics
+from services.inference_executor import InferenceQueueFull, configure_torch_threads, get_inference_executor
+from services.pill_engine import get_pill_engine
+from services.result_cache import get_result_cache
 
 # Setup logging
 logger = setup_logging()
@@ -23,6 +28,7 @@ models_ready = False
 async def startup_event():
     global models_ready
     logger.info("🚀 Starting AI Inference Service...")
+    configure_torch_threads()
     
     try:
         # Initialize model manager (starts background loading)
@@ -51,6 +57,11 @@ async def startup_event():
         logger.error(f"💥 Error during startup: {e}")
         models_ready = False
 
+@app.on_event("shutdown")
+def shutdown_event():
+    # หยุด pill engine process (ถ้าเคยเริ่ม)
+    get_pill_engine().stop()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -85,10 +96,21 @@ async def check_readiness(request: Request, call_next):
     response = await call_next(request)
     return response
 
+@app.exception_handler(InferenceQueueFull)
+async def inference_queue_full_handler(request: Request, exc: InferenceQueueFull):
+    """คิว inference เต็ม: ให้ client ลองใหม่ภายหลัง"""
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Inference queue is full, please retry later"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Add routes
 app.include_router(inference.router, prefix="/api")
 app.include_router(narcotic.router, prefix="/api")
 app.include_router(vector.router, prefix="/api")
+app.include_router(stream.router, prefix="/api")
+app.include_router(pill.router, prefix="/api")
 
 # Enhanced health check endpoints
 @app.get("/health")
@@ -120,7 +142,12 @@ def detailed_status():
     
     return {
         "service_ready": models_ready,
-        "warmup_status": model_manager.get_warmup_status()
+        "warmup_status": model_manager.get_warmup_status(),
+        "model_registry": model_manager.get_model_registry(),
+        "batching": get_batching_metrics(),
+        "executor": get_inference_executor().get_metrics(),
+        "result_cache": get_result_cache().get_metrics(),
+        "pill_engine": get_pill_engine().get_status()
     }
 
 @app.post("/warmup")
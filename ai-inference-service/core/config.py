@@ -15,6 +15,64 @@ class Settings(BaseSettings):
     OBJECT_DETECTION_MODEL: str = os.path.join(MODEL_PATH, "best.pt")
     PILL_MODEL: str = os.path.join(MODEL_PATH, "pill_model.h5")
     PILL_PROTOTYPES: str = os.path.join(MODEL_PATH, "pill_prototypes.json")
+    # prototype store แบบ .npy (สร้างด้วย python manage_models.py prototypes build)
+    PILL_PROTOTYPE_STORE: str = os.environ.get("PILL_PROTOTYPE_STORE", os.path.join(MODEL_PATH, "pill_prototypes"))
+    # shape model ที่ serialize แล้ว (สร้างด้วย python manage_models.py pill-export)
+    PILL_SERIALIZED_MODEL: str = os.environ.get("PILL_SERIALIZED_MODEL", os.path.join(MODEL_PATH, "pill_shape_model.keras"))
+
+    # Pill engine (TensorFlow) รันใน process แยก เริ่มเมื่อมี request แรก
+    PILL_ENGINE_STARTUP_TIMEOUT: float = float(os.environ.get("PILL_ENGINE_STARTUP_TIMEOUT", 180))
+    PILL_ENGINE_REQUEST_TIMEOUT: float = float(os.environ.get("PILL_ENGINE_REQUEST_TIMEOUT", 60))
+    PILL_ENGINE_BATCH_SIZE: int = int(os.environ.get("PILL_ENGINE_BATCH_SIZE", 8))
+    PILL_ENGINE_THREADS: int = int(os.environ.get("PILL_ENGINE_THREADS", 0))  # 0 = ค่าเริ่มต้นของ TensorFlow
+    PILL_MAX_FILES: int = int(os.environ.get("PILL_MAX_FILES", 16))
+
+    # ด้านที่ยาวที่สุดของภาพหลังถอดรหัส (ภาพมือถือขนาดใหญ่ถูกถอดรหัสที่ความละเอียดลดลง)
+    DECODE_MAX_SIDE: int = int(os.environ.get("DECODE_MAX_SIDE", 1280))
+
+    # Micro-batching ของ request ที่ส่งเข้าโมเดล
+    BATCH_MAX_SIZE: int = int(os.environ.get("BATCH_MAX_SIZE", 8))
+    BATCH_MAX_WAIT_MS: float = float(os.environ.get("BATCH_MAX_WAIT_MS", 15))
+
+    # Thread pool สำหรับ inference (งานค้างเกิน INFERENCE_MAX_PENDING จะได้ 429)
+    INFERENCE_WORKERS: int = int(os.environ.get("INFERENCE_WORKERS", 2))
+    INFERENCE_MAX_PENDING: int = int(os.environ.get("INFERENCE_MAX_PENDING", 16))
+    TORCH_NUM_THREADS: int = int(os.environ.get("TORCH_NUM_THREADS", 0))  # 0 = CPU / INFERENCE_WORKERS
+
+    # Cache ของโมเดลจำแนกรุ่นปืนแยกตามยี่ห้อ (0 = ไม่จำกัด)
+    BRAND_MODEL_CACHE_SIZE: int = int(os.environ.get("BRAND_MODEL_CACHE_SIZE", 4))
+    BRAND_MODEL_CACHE_MAX_MB: int = int(os.environ.get("BRAND_MODEL_CACHE_MAX_MB", 0))
+    BRAND_MODEL_PINNED: str = os.environ.get("BRAND_MODEL_PINNED", "")  # เช่น "GLOCK,SIG"
+
+    # Backend สำหรับโมเดล segmentation/classification: pytorch, onnx หรือ openvino
+    # (ต้อง export ก่อนด้วย python manage_models.py export --format onnx)
+    INFERENCE_BACKEND: str = os.environ.get("INFERENCE_BACKEND", "pytorch").lower()
+
+    # ใช้ classifier (brand และรุ่นปืนแยกยี่ห้อ) แบบ INT8
+    # (สร้างด้วย python manage_models.py quantize --calibration <crops>)
+    INFERENCE_QUANTIZED: bool = os.environ.get("INFERENCE_QUANTIZED", "False").lower() == "true"
+    CALIBRATION_IMAGES_DIR: str = os.environ.get("CALIBRATION_IMAGES_DIR", os.path.join(MODEL_PATH, "calibration"))
+
+    # Embedding ของภาพยาเสพติด: v1 = 16000 มิติ (ตรงกับคอลัมน์ในฐานข้อมูล), v2 = GeM pooled
+    # (เทียบ recall@k ได้ด้วย python manage_models.py embedding-report --images <labelled dir>)
+    EMBEDDING_VERSION: str = os.environ.get("EMBEDDING_VERSION", "v1").lower()
+    EMBEDDING_IMGSZ: int = int(os.environ.get("EMBEDDING_IMGSZ", 224))
+    EMBEDDING_LAYERS: str = os.environ.get("EMBEDDING_LAYERS", "")  # index ของ layer คั่นด้วย "," (ว่าง = อัตโนมัติ)
+    EMBEDDING_GEM_P: float = float(os.environ.get("EMBEDDING_GEM_P", 3.0))
+    EMBEDDING_BATCH_SIZE: int = int(os.environ.get("EMBEDDING_BATCH_SIZE", 16))
+    VECTOR_BATCH_MAX_FILES: int = int(os.environ.get("VECTOR_BATCH_MAX_FILES", 64))
+
+    # Realtime detection (/api/detect fast mode และ WebSocket /api/stream/detect)
+    STREAM_IMGSZ: int = int(os.environ.get("STREAM_IMGSZ", 320))
+    STREAM_CONF: float = float(os.environ.get("STREAM_CONF", 0.3))
+    STREAM_TRACKER: str = os.environ.get("STREAM_TRACKER", "bytetrack.yaml")
+    STREAM_FRAME_RATE: int = int(os.environ.get("STREAM_FRAME_RATE", 15))
+    STREAM_TRACK_TTL: int = int(os.environ.get("STREAM_TRACK_TTL", 30))  # frame ที่ไม่เห็น track ก่อนส่ง removed
+
+    # Cache ผลลัพธ์ของ /api/analyze, /api/detect (accurate) และ /api/convert
+    RESULT_CACHE_MAX_MB: int = int(os.environ.get("RESULT_CACHE_MAX_MB", 64))
+    RESULT_CACHE_DIR: str = os.environ.get("RESULT_CACHE_DIR", "")  # ว่าง = ไม่ใช้ disk tier
+    RESULT_CACHE_DISK_MAX_MB: int = int(os.environ.get("RESULT_CACHE_DISK_MAX_MB", 1024))
 
     class Config:
         env_file = ".env"
@@ -1,75 +1,34 @@
 import os
+import sys
 import cv2
 import torch
 import json
 import pathlib
 import numpy as np
-import pandas as pd
 import torch.nn.functional as F
 import torchvision.transforms as transforms
 from PIL import Image
-from pathlib import Path
-from ultralytics import YOLO
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 backend_dir = os.path.dirname(os.path.dirname(current_dir))
 
-# 📁 Path หลักของ Model ต่าง ๆ
-path_model_5MSegment = os.path.join(backend_dir, "model", "Model V2", "5M_Segment", "best_v8.pt")
-path_model_CLS_Brand = os.path.join(backend_dir, "model", "Model V2", "Model-CLS-Brand V1", "best.pt")
-path_model_CLS_MGUN = os.path.join(backend_dir, "model", "Model V2", "Model-CLS-MGun-V1")
-path_model_CLS_MGUN = Path(path_model_CLS_MGUN)
+# ใช้ฟังก์ชันตัด mask และโมเดลชุดเดียวกับ service หลัก
+sys.path.append(backend_dir)
+from utils.image_utils import crop_masks_on_white
+from ml_managers.ai_model_manager import get_model_manager
 
-# เพิ่ม path ของ model สำหรับ narcotics
-narcotic_model_path = os.path.join(backend_dir, "model", "Model V2", "Narcotics", "best.pt")
-model_narcotic = YOLO(narcotic_model_path)
+# ===== Load Models (ผ่าน ModelManager เท่านั้น ไม่โหลด weights ซ้ำ) =====
+model_manager = get_model_manager()
+model_manager.wait_for_models()
 
-# ✅ Dictionary ของชื่อแบรนด์ (index -> brand)
-brand_map = {
-    0: 'BERETTA', 1: 'CZ', 2: 'Colt', 3: 'GLOCK', 4: 'Kimber', 5: 'LES BAER',
-    6: 'Mauser', 7: 'Norinco', 8: 'SIG', 9: 'Smith & wesson', 10: 'Sphinx', 11: 'Walther'
-}
-
-# 🔍 สร้าง mapping จากชื่อแบรนด์ → ชื่อโฟลเดอร์
-def find_model_path_for_brand(brand_name):
-    for folder in path_model_CLS_MGUN.iterdir():
-        if folder.is_dir() and brand_name.lower() in folder.name.lower():
-            model_path = folder / "best.pt"
-            if model_path.exists():
-                return str(model_path)
-    return None
-
-# ✅ สร้าง DataFrame
-records = []
-for idx, brand in brand_map.items():
-    path = find_model_path_for_brand(brand)
-    if path:
-        records.append({"index": idx, "brand": brand, "path": path})
-
-df_models = pd.DataFrame(records)
-
-# ===== Load Models =====
-model_segment = YOLO(path_model_5MSegment)
-model_brand = YOLO(path_model_CLS_Brand)
-model_map = {row['brand']: YOLO(row['path']) for _, row in df_models.iterrows()}
+model_narcotic = model_manager.get_narcotic_model()
+model_segment = model_manager.get_segmentation_model()
+model_brand = model_manager.get_brand_model()
 
 # ===== Class Map from Segment =====
 segment_classes = {0: 'BigGun', 1: 'Bullet', 2: 'Drug', 3: 'Magazine', 4: 'PackageDrug', 5: 'Pistol', 6: 'Revolver'}
 
 # ===== Utils =====
-def crop_mask_on_white(img, mask):
-    # Resize mask ให้ตรงกับ shape ของ image
-    if mask.shape != img.shape[:2]:
-        mask = cv2.resize(mask.astype(np.uint8), (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
-
-    white_bg = np.ones_like(img) * 255
-    mask = mask.astype(bool)
-
-    # Apply mask to each channel
-    for c in range(3):
-        white_bg[:, :, c][mask] = img[:, :, c][mask]
-    return white_bg
-
 def get_top3(pred, class_names):
     probs = pred.probs.data.cpu().numpy()
     top3 = probs.argsort()[-3:][::-1]
@@ -156,19 +115,20 @@ def process_image(image_path):
             "detected_objects": []
         }
     
-    results = model_segment(image)[0]
+    results = model_manager.segment(image)[0]
 
     objects = []
 
-    for i, mask in enumerate(results.masks.data):
+    # Create cropped objects on white background (mask resized once per image)
+    cropped_images = crop_masks_on_white(image, results.masks.data.cpu().numpy())
+
+    for i, cropped in enumerate(cropped_images):
         cls_id = int(results.boxes.cls[i].item())
         cls_name = segment_classes.get(cls_id, "Unknown")
 
         confidence = float(results.boxes.conf[i].item())
         confidence_percent = round(confidence, 2)
 
-        # Create cropped object on white background
-        cropped = crop_mask_on_white(image, mask.cpu().numpy())
         crop_path = f"cropped_object_{i}_{cls_name}.jpg"
         cv2.imwrite(crop_path, cropped)
 
@@ -180,15 +140,15 @@ def process_image(image_path):
         }
 
         if cls_name in ['GUN', 'Pistol']:
-            pred_brand = model_brand(cropped)[0]
+            pred_brand = model_manager.predict(model_brand, cropped)[0]
             brand_top3 = get_top3(pred_brand, model_brand.names)
             selected_brand = brand_top3[0]['label']
             obj_data["brand_top3"] = brand_top3
             obj_data["selected_brand"] = selected_brand
 
-            if selected_brand in model_map:
-                model_model = model_map[selected_brand]
-                pred_model = model_model(cropped)[0]
+            model_model = model_manager.get_brand_specific_model(selected_brand)
+            if model_model is not None:
+                pred_model = model_manager.predict(model_model, cropped)[0]
                 model_top3 = get_top3(pred_model, model_model.names)
                 selected_model = model_top3[0]['label']
                 obj_data["model_top3"] = model_top3
@@ -0,0 +1,104 @@
+"""
+Process แยกของระบบจำแนกเม็ดยา (TensorFlow)
+
+ไม่ import PyTorch/ultralytics และถูกเริ่มโดย services/pill_engine.py เมื่อมี request แรก
+
+    python -m inference.pill_engine_worker <unix socket path>
+
+รับงานผ่าน multiprocessing.connection (authkey จาก PILL_ENGINE_AUTHKEY)
+โดยข้อมูลภาพส่งผ่าน shared memory: {"shm", "sizes", "thresholds"}
+"""
+import logging
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Listener
+
+from core.config import settings
+from inference.prototype_store import PrototypeStore
+
+logger = logging.getLogger("pill_engine_worker")
+
+def read_images(shm_name, sizes):
+    """อ่านข้อมูลไฟล์รูปภาพจาก shared memory ที่ process หลักสร้างไว้"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # process หลักเป็นเจ้าของ block นี้ (unlink เอง) จึงไม่ให้ resource tracker ของ worker ลบ
+        resource_tracker.unregister(shm._name, "shared_memory")
+        images = []
+        offset = 0
+        for size in sizes:
+            images.append(bytes(shm.buf[offset:offset + size]))
+            offset += size
+        return images
+    finally:
+        shm.close()
+
+def apply_threshold(result, threshold):
+    top = result['details'][0] if result['details'] else None
+    result['prediction'] = top['pill_name'] if top and top['confidence'] >= threshold else 'Unknown'
+    return result
+
+def predict(system, images, thresholds):
+    """ทำนายเป็น batch เดียว ถ้าล้มเหลว (เช่น มีภาพเสีย) ทำนายทีละภาพเพื่อแยกภาพที่มีปัญหา"""
+    try:
+        results = system.predict_batch(images, threshold=0.0)
+    except Exception:
+        results = []
+        for image in images:
+            try:
+                results.append(system.predict_batch([image], threshold=0.0)[0])
+            except Exception as e:
+                results.append({'error': str(e)})
+    return [
+        result if 'error' in result else apply_threshold(result, threshold)
+        for result, threshold in zip(results, thresholds)
+    ]
+
+def load_system():
+    import tensorflow as tf
+    from inference.pill_recognition import ImprovedPillRecognitionSystem
+
+    if settings.PILL_ENGINE_THREADS > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(settings.PILL_ENGINE_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    prototype_path = (
+        settings.PILL_PROTOTYPE_STORE if PrototypeStore.exists(settings.PILL_PROTOTYPE_STORE)
+        else settings.PILL_PROTOTYPES
+    )
+    if not os.path.exists(settings.PILL_SERIALIZED_MODEL):
+        logger.warning(f"⚠️ {settings.PILL_SERIALIZED_MODEL} not found, building the model from {settings.PILL_MODEL}")
+    return ImprovedPillRecognitionSystem(
+        model_path=settings.PILL_MODEL,
+        prototype_path=prototype_path,
+        serialized_path=settings.PILL_SERIALIZED_MODEL
+    )
+
+def main(address):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - pill-engine - %(levelname)s - %(message)s")
+    system = load_system()
+    logger.info(f"✅ Pill engine ready ({len(system.pill_names)} classes)")
+
+    # เปิด socket หลังโหลดโมเดลเสร็จ: process หลักเชื่อมต่อได้เมื่อพร้อมรับงานแล้วเท่านั้น
+    authkey = bytes.fromhex(os.environ["PILL_ENGINE_AUTHKEY"])
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        with listener.accept() as conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    logger.info("Pill engine connection closed")
+                    return 0
+                try:
+                    # prototype store ถูกแก้ไข (prototypes add/remove): ใช้ version ใหม่โดยไม่ต้องเริ่ม process ใหม่
+                    if system.refresh_prototypes():
+                        logger.info(f"🔄 Reloaded prototypes ({len(system.pill_names)} classes)")
+                    images = read_images(message["shm"], message["sizes"])
+                    conn.send({"results": predict(system, images, message["thresholds"])})
+                except Exception as e:
+                    logger.error(f"❌ Pill engine request failed: {e}")
+                    conn.send({"error": str(e)})
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1]))
@@ -1,39 +1,76 @@
 import os
-import json
 import numpy as np
-import cv2
 from PIL import Image
 import tensorflow as tf
 from keras.api.applications import EfficientNetB4
 from keras.api import layers, Model
 from keras.src.utils.image_utils import img_to_array
-from sklearn.preprocessing import normalize
+from inference.prototype_store import PrototypeStore, _normalize_rows, load_json_prototypes
+from inference.stamp_features import extract_stamp_features
+from utils.image_utils import load_pil_image
+
+# TTA แบบกำหนดตายตัว: เม็ดยาไม่มีทิศทาง จึงใช้การพลิก/หมุน 90 องศา (ผลลัพธ์เหมือนเดิมทุกครั้ง)
+FIXED_TTA_TRANSFORMS = [
+    lambda img: img,
+    lambda img: img[:, ::-1],
+    lambda img: np.rot90(img, 1),
+    lambda img: np.rot90(img, 2),
+    lambda img: np.rot90(img, 3),
+    lambda img: img[::-1, :],
+]
 
 class ImprovedPillRecognitionSystem:
-    def __init__(self, model_path=None, prototype_path=None):
+    def __init__(self, model_path=None, prototype_path=None, tta_views=1, tta_mode="fixed", tta_seed=42,
+                 serialized_path=None):
+        """
+        Args:
+            serialized_path: ไฟล์ .keras ของ shape model ที่ serialize ไว้ทั้งหมด (โหลดแบบ offline
+                ไม่ต้องสร้าง EfficientNetB4 ใหม่หรือดาวน์โหลด weights ของ imagenet)
+            tta_views: จำนวนภาพ test-time augmentation ต่อเม็ดยา (1 = ไม่ทำ TTA)
+            tta_mode: "fixed" (พลิก/หมุนตายตัว) หรือ "random" (augmentation layer แบบกำหนด seed)
+            tta_seed: seed ของ augmentation layer สำหรับ tta_mode="random"
+        """
         self.image_size = (224, 224)
         self.prototypes = {}
+        self.tta_views = max(1, tta_views)
+        self.tta_mode = tta_mode
+        
+        # prototype ในรูป matrix ที่ normalize แล้ว (สร้างใหม่ทุกครั้งที่โหลด prototypes)
+        self.pill_names = []
+        self.shape_matrix = np.zeros((0, 0), dtype=np.float32)
+        self.stamp_matrix = np.zeros((0, 0), dtype=np.float32)
+        self.prototype_path = None
+        self.prototype_version = None
         
         # เพิ่ม data augmentation layer
         self.augmentation = tf.keras.Sequential([
-            layers.RandomRotation(0.2),
-            layers.RandomFlip("horizontal"),
-            layers.RandomContrast(0.2),
-            layers.RandomBrightness(0.2),
+            layers.RandomRotation(0.2, seed=tta_seed),
+            layers.RandomFlip("horizontal", seed=tta_seed),
+            layers.RandomContrast(0.2, seed=tta_seed),
+            layers.RandomBrightness(0.2, seed=tta_seed),
         ])
         
-        self.full_model, self.shape_model, self.stamp_model = self.create_model()
+        if serialized_path and os.path.exists(serialized_path):
+            # ใช้เฉพาะ shape model ในการทำนาย (stamp ใช้ feature จาก OpenCV)
+            self.full_model = self.stamp_model = None
+            self.shape_model = tf.keras.models.load_model(serialized_path, compile=False)
+            self.load_prototypes(prototype_path)
+            return
+        
+        # weights ของ imagenet จำเป็นเฉพาะตอนเริ่ม train ใหม่ (ถ้ามีไฟล์โมเดลจะถูกแทนที่ด้วย load_weights)
+        has_weights = bool(model_path and os.path.exists(model_path))
+        self.full_model, self.shape_model, self.stamp_model = self.create_model(pretrained=not has_weights)
         
-        if model_path and os.path.exists(model_path):
+        if has_weights:
             self.full_model.load_weights(model_path)
             self.load_prototypes(prototype_path)
             
-    def create_model(self):
+    def create_model(self, pretrained=True):
         """สร้างโมเดลที่ซับซ้อนขึ้นด้วย attention mechanism และ feature pyramid"""
         base_model = tf.keras.applications.EfficientNetB4(
             input_shape=(*self.image_size, 3),
             include_top=False,
-            weights='imagenet'
+            weights='imagenet' if pretrained else None
         )
         
         # Freeze บางส่วนของ base model
@@ -100,129 +137,80 @@ class ImprovedPillRecognitionSystem:
         return full_model, shape_embedding_model, stamp_embedding_model
 
     def extract_stamp_features(self, image_path):
-        """ปรับปรุงการสกัด stamp features ด้วยเทคนิคที่ซับซ้อนขึ้น"""
-        image = cv2.imread(image_path)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # ใช้ CLAHE เพื่อปรับปรุง contrast
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        gray = clahe.apply(gray)
-        
-        # Multi-scale processing
-        stamp_features = []
-        scales = [1.0, 0.75, 0.5]
-        
-        for scale in scales:
-            # Resize image
-            width = int(gray.shape[1] * scale)
-            height = int(gray.shape[0] * scale)
-            scaled_gray = cv2.resize(gray, (width, height))
-            
-            # Apply different thresholds
-            thresholds = []
-            thresholds.append(cv2.threshold(scaled_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1])
-            thresholds.append(cv2.adaptiveThreshold(scaled_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2))
-            
-            for binary in thresholds:
-                # Noise reduction
-                kernel = np.ones((3,3), np.uint8)
-                binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
-                
-                # Find contours
-                contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                
-                # Process valid contours
-                for cnt in contours:
-                    if cv2.contourArea(cnt) > 100 * scale:
-                        x, y, w, h = cv2.boundingRect(cnt)
-                        roi = scaled_gray[y:y+h, x:x+w]
-                        
-                        # Extract multiple features
-                        if roi.size > 0:
-                            # Resize ROI
-                            roi_resized = cv2.resize(roi, (64, 64))
-                            
-                            # Calculate histogram
-                            hist = cv2.calcHist([roi_resized], [0], None, [256], [0, 256]).flatten()
-                            hist = hist / np.sum(hist)
-                            
-                            # Combine features
-                            combined_features = np.concatenate([hist])
-                            stamp_features.append(combined_features)
-        
-        if not stamp_features:
-            # Fallback to global image features
-            resized = cv2.resize(gray, (64, 64))
-            hist = cv2.calcHist([resized], [0], None, [256], [0, 256]).flatten()
-            hist = hist / np.sum(hist)
-            stamp_features.append(hist)
-        
-        # Normalize features
-        stamp_features = [normalize(feat.reshape(1, -1))[0] for feat in stamp_features]
-        
-        return stamp_features
+        """
+        สกัด stamp features (matrix ขนาดคงที่ MAX_STAMP_CONTOURS x 256, แถวที่ไม่ได้ใช้เป็น 0)
+        ดู inference/stamp_features.py
+        """
+        return extract_stamp_features(image_path)
 
     def predict(self, image_path, threshold=0.80):
         """ปรับปรุงการทำนายด้วยการถ่วงน้ำหนักที่เหมาะสมและการรวมผลแบบ ensemble"""
-        # สกัด embeddings จากรูปทรง
-        img_array = self.preprocess_image(image_path)
-        augmented_images = self.augment_image(img_array)
-        
-        shape_embeddings = []
-        for aug_img in augmented_images:
-            embedding = self.shape_model.predict(np.expand_dims(aug_img, axis=0), verbose=0)
-            shape_embeddings.append(embedding)
-        
-        # ใช้ค่าเฉลี่ยของ embeddings จากภาพที่ผ่านการ augment
-        shape_embedding = np.mean(shape_embeddings, axis=0)
-        
-        # สกัดคุณลักษณะตราปั้ม
-        stamp_features = self.extract_stamp_features(image_path)
+        return self.predict_batch([image_path], threshold)[0]
+
+    def predict_batch(self, image_paths, threshold=0.80):
+        """
+        ทำนายเม็ดยาหลายภาพ: ภาพ TTA ของทุกภาพรันผ่าน shape model เป็น batch เดียว
+        และเทียบกับ prototype ทั้งหมดด้วยการคูณ matrix
+        """
+        if not self.pill_names:
+            return [{'prediction': 'Unknown', 'confidence': 0, 'details': []} for _ in image_paths]
+        
+        # สกัด embeddings จากรูปทรง (ค่าเฉลี่ยของ embeddings จากภาพที่ผ่านการ augment)
+        views = np.concatenate([self.tta_batch(self.preprocess_image(path)) for path in image_paths])
+        embeddings = np.asarray(self.shape_model(views, training=False))
+        shape_embeddings = embeddings.reshape(len(image_paths), self.tta_views, -1).mean(axis=1)
+        
+        # ความคล้ายของรูปทรงกับทุก prototype: (n_images, n_prototypes)
+        shape_similarities = _normalize_rows(shape_embeddings) @ self.shape_matrix.T
         
         # น้ำหนักสำหรับแต่ละคุณลักษณะ
         shape_weight = 0.6
         stamp_weight = 0.4
         
-        predictions = []
-        for pill_name, data in self.prototypes.items():
-            # คำนวณความคล้ายของรูปทรง
-            shape_similarity = np.dot(shape_embedding[0], data['shape_prototype']) / (
-                np.linalg.norm(shape_embedding[0]) * np.linalg.norm(data['shape_prototype'])
-            )
-            
-            # คำนวณความคล้ายของตราปั้ม
-            stamp_similarities = [
-                np.dot(stamp_feat, data['stamp_prototype']) / (
-                    np.linalg.norm(stamp_feat) * np.linalg.norm(data['stamp_prototype'])
-                )
-                for stamp_feat in stamp_features
-            ]
-            
-            # ใช้ค่าสูงสุดของความคล้ายตราปั้ม
-            max_stamp_similarity = max(stamp_similarities) if stamp_similarities else 0
+        results = []
+        for image_path, shape_similarity in zip(image_paths, shape_similarities):
+            # คุณลักษณะตราปั้มทุกจุดเทียบกับทุก prototype แล้วใช้ค่าสูงสุดของแต่ละ prototype
+            stamp_features = self.extract_stamp_features(image_path)
+            stamp_similarity = (stamp_features @ self.stamp_matrix.T).max(axis=0)
             
             # รวมคะแนนโดยใช้น้ำหนัก
-            total_similarity = (shape_similarity * shape_weight + 
-                              max_stamp_similarity * stamp_weight)
+            total_similarity = shape_similarity * shape_weight + stamp_similarity * stamp_weight
+            confidences = np.clip(total_similarity, 0, 1)
             
-            predictions.append({
-                'pill_name': pill_name,
-                'confidence': max(0, min(1, total_similarity)),
-                'shape_similarity': shape_similarity,
-                'stamp_similarity': max_stamp_similarity
+            predictions = [
+                {
+                    'pill_name': self.pill_names[i],
+                    'confidence': float(confidences[i]),
+                    'shape_similarity': float(shape_similarity[i]),
+                    'stamp_similarity': float(stamp_similarity[i])
+                }
+                for i in np.argsort(-confidences, kind='stable')
+            ]
+            
+            results.append({
+                'prediction': predictions[0]['pill_name'] if predictions and predictions[0]['confidence'] >= threshold else 'Unknown',
+                'confidence': predictions[0]['confidence'] if predictions else 0,
+                'details': predictions
             })
         
-        predictions.sort(key=lambda x: x['confidence'], reverse=True)
-        
-        return {
-            'prediction': predictions[0]['pill_name'] if predictions and predictions[0]['confidence'] >= threshold else 'Unknown',
-            'confidence': predictions[0]['confidence'] if predictions else 0,
-            'details': predictions
-        }
+        return results
+
+    def tta_batch(self, img_array):
+        """สร้างภาพ TTA จำนวน tta_views ภาพจากภาพเดียว (batch, 224, 224, 3)"""
+        if self.tta_views == 1:
+            return img_array
+        if self.tta_mode == "random":
+            batch = np.repeat(img_array, self.tta_views, axis=0)
+            return np.asarray(self.augmentation(batch, training=True))
+        image = img_array[0]
+        return np.stack([
+            FIXED_TTA_TRANSFORMS[i % len(FIXED_TTA_TRANSFORMS)](image) for i in range(self.tta_views)
+        ])
 
     def preprocess_image(self, image_path):
         """เพิ่มการ preprocess ที่ซับซ้อนขึ้น"""
-        image = Image.open(image_path).convert('RGB')
+        # ถอดรหัส JPEG ที่ความละเอียดใกล้ขนาดที่ใช้ (draft mode) และหมุนตาม EXIF
+        image = load_pil_image(image_path, self.image_size)
         image = image.resize(self.image_size, Image.Resampling.LANCZOS)
         
         # แปลงเป็น array
@@ -236,12 +224,66 @@ class ImprovedPillRecognitionSystem:
         
         return image_array
 
+    def save_serialized(self, path):
+        """serialize shape model ทั้งหมด (architecture + weights) เป็นไฟล์ .keras สำหรับโหลดแบบ offline"""
+        self.shape_model.save(path)
+
     def augment_image(self, image_array):
         """เพิ่ม data augmentation ที่หลากหลาย"""
         return self.augmentation(image_array)
 
     def load_prototypes(self, file_path='pill_prototypes.json'):
-        """โหลดข้อมูล prototypes"""
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.prototypes = json.load(f)
\ No newline at end of file
+        """
+        โหลดข้อมูล prototypes จาก prototype store (directory ของไฟล์ .npy แบบ memory-mapped)
+        หรือจาก pill_prototypes.json แบบเดิม
+        """
+        self.prototype_path = file_path
+        if file_path and PrototypeStore.exists(file_path):
+            store = PrototypeStore(file_path).load()
+            self.prototype_version = store.version
+            self.prototypes = {}
+            self.pill_names = store.labels
+            self.shape_matrix = store.shape_matrix
+            self.stamp_matrix = store.stamp_matrix
+            return
+        if file_path and os.path.exists(file_path):
+            self.prototypes = load_json_prototypes(file_path)
+        self.build_prototype_index()
+
+    def refresh_prototypes(self):
+        """โหลด prototype store ใหม่ถ้ามี version ใหม่ (เช่น หลัง manage_models.py prototypes add/remove)"""
+        path = self.prototype_path
+        if not path or not PrototypeStore.exists(path):
+            return False
+        if PrototypeStore.current_version(path) == self.prototype_version:
+            return False
+        self.load_prototypes(path)
+        return True
+
+    def build_prototype_index(self):
+        """แปลง prototypes เป็น matrix ที่ normalize แล้ว สำหรับเทียบความคล้ายด้วยการคูณ matrix"""
+        self.pill_names = list(self.prototypes.keys())
+        if not self.pill_names:
+            self.shape_matrix = np.zeros((0, 0), dtype=np.float32)
+            self.stamp_matrix = np.zeros((0, 0), dtype=np.float32)
+            return
+        self.shape_matrix = _normalize_rows(np.array(
+            [self.prototypes[name]['shape_prototype'] for name in self.pill_names], dtype=np.float32
+        ))
+        self.stamp_matrix = _normalize_rows(np.array(
+            [self.prototypes[name]['stamp_prototype'] for name in self.pill_names], dtype=np.float32
+        ))
+
+    def compute_prototype(self, image_paths):
+        """
+        สร้าง prototype ของยาหนึ่งชนิดจากภาพตัวอย่าง
+        (ค่าเฉลี่ยของ shape embedding และของ stamp feature ทุกแถวที่ใช้)
+        """
+        views = np.concatenate([self.tta_batch(self.preprocess_image(path)) for path in image_paths])
+        shape_embeddings = _normalize_rows(np.asarray(self.shape_model(views, training=False)))
+        stamp_features = np.concatenate([self.extract_stamp_features(path) for path in image_paths])
+        stamp_features = stamp_features[np.linalg.norm(stamp_features, axis=1) > 0]
+        return {
+            'shape_prototype': shape_embeddings.mean(axis=0).tolist(),
+            'stamp_prototype': stamp_features.mean(axis=0).tolist()
+        }
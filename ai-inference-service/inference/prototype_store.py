@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHAPE_FILE = "shape_prototypes.npy"
+STAMP_FILE = "stamp_prototypes.npy"
+INDEX_FILE = "labels.json"
+CURRENT_LINK = "current"
+KEEP_VERSIONS = 3
+
+def _normalize_rows(matrix):
+    """L2-normalize แต่ละแถว (แถวที่เป็น 0 คงเป็น 0)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class PrototypeStore:
+    """
+    prototype ของเม็ดยาในรูปไฟล์ .npy (float32, ต่อเนื่อง, normalize แล้ว) และ index ของชื่อยา
+
+        <directory>/current -> v<n>              (symlink ไปยัง version ล่าสุด)
+        <directory>/v<n>/shape_prototypes.npy    (n, shape_dim)
+        <directory>/v<n>/stamp_prototypes.npy    (n, stamp_dim)
+        <directory>/v<n>/labels.json             {"labels": [...], "shape_dim", "stamp_dim"}
+
+    โหลดด้วย np.load(mmap_mode='r') จึงเริ่มได้ทันทีและหลาย worker process ใช้ page เดียวกันของ OS
+    การเพิ่ม/ลบเขียน version ใหม่ทั้ง directory แล้วสลับ symlink "current" ในครั้งเดียว
+    ผู้อ่านจึงเห็นไฟล์ทั้งสามจาก version เดียวกันเสมอ (process ที่ map version เดิมอยู่ยังอ่านได้ตามเดิม)
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self.version = None
+        self.labels = []
+        self.shape_matrix = np.zeros((0, 0), dtype=np.float32)
+        self.stamp_matrix = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(str(directory), CURRENT_LINK, INDEX_FILE))
+
+    @staticmethod
+    def current_version(directory):
+        """ชื่อ version ที่ "current" ชี้อยู่ (None ถ้ายังไม่มี store)"""
+        try:
+            return os.readlink(os.path.join(str(directory), CURRENT_LINK))
+        except OSError:
+            return None
+
+    def load(self, mmap=True):
+        """โหลด version ปัจจุบันของ store (mmap_mode='r' โดยค่าเริ่มต้น)"""
+        version = self.current_version(self.directory)
+        if version is None:
+            raise FileNotFoundError(f"No prototype store at {self.directory}")
+        version_dir = os.path.join(self.directory, version)
+        with open(os.path.join(version_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        mode = "r" if mmap else None
+        self.version = version
+        self.labels = list(index["labels"])
+        self.shape_matrix = np.load(os.path.join(version_dir, SHAPE_FILE), mmap_mode=mode)
+        self.stamp_matrix = np.load(os.path.join(version_dir, STAMP_FILE), mmap_mode=mode)
+        if len(self.shape_matrix) != len(self.labels) or len(self.stamp_matrix) != len(self.labels):
+            raise ValueError(f"Prototype store {version_dir} is inconsistent with its label index")
+        return self
+
+    def save(self, labels, shape_matrix, stamp_matrix):
+        """เขียน store เป็น version ใหม่ (normalize ทุกแถว) แล้วสลับ "current" ไปยัง version นั้น"""
+        if len(set(labels)) != len(labels):
+            raise ValueError("Duplicate pill labels")
+        shape_matrix = np.ascontiguousarray(_normalize_rows(shape_matrix))
+        stamp_matrix = np.ascontiguousarray(_normalize_rows(stamp_matrix))
+        if len(shape_matrix) != len(labels) or len(stamp_matrix) != len(labels):
+            raise ValueError("Prototype rows do not match labels")
+
+        os.makedirs(self.directory, exist_ok=True)
+        version = f"v{time.time_ns()}"
+        version_dir = os.path.join(self.directory, version)
+        os.makedirs(version_dir)
+        np.save(os.path.join(version_dir, SHAPE_FILE), shape_matrix)
+        np.save(os.path.join(version_dir, STAMP_FILE), stamp_matrix)
+        index = {
+            "labels": list(labels),
+            "shape_dim": int(shape_matrix.shape[1]) if shape_matrix.ndim == 2 else 0,
+            "stamp_dim": int(stamp_matrix.shape[1]) if stamp_matrix.ndim == 2 else 0
+        }
+        with open(os.path.join(version_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+        # สลับ symlink แบบ atomic (os.replace ทับ link เดิม)
+        tmp_link = os.path.join(self.directory, f"{CURRENT_LINK}.tmp")
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(version, tmp_link)
+        os.replace(tmp_link, os.path.join(self.directory, CURRENT_LINK))
+        self._prune_versions(keep=version)
+
+        self.version = version
+        self.labels = list(labels)
+        self.shape_matrix = shape_matrix
+        self.stamp_matrix = stamp_matrix
+        return self
+
+    def _prune_versions(self, keep):
+        """ลบ version เก่า เหลือ KEEP_VERSIONS ล่าสุด (ผู้อ่านที่ map ไฟล์ที่ถูกลบไว้แล้วยังอ่านได้)"""
+        versions = sorted(
+            (name for name in os.listdir(self.directory)
+             if name.startswith("v") and name[1:].isdigit() and name != keep),
+            key=lambda name: int(name[1:])
+        )
+        for name in versions[:max(0, len(versions) - (KEEP_VERSIONS - 1))]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def add(self, prototypes):
+        """
+        เพิ่มหรือแทนที่ prototype ของยา
+
+        Args:
+            prototypes: {ชื่อยา: {"shape_prototype": [...], "stamp_prototype": [...]}}
+        """
+        labels = list(self.labels)
+        shape_rows = list(np.asarray(self.shape_matrix, dtype=np.float32))
+        stamp_rows = list(np.asarray(self.stamp_matrix, dtype=np.float32))
+        for name, data in prototypes.items():
+            shape = np.asarray(data["shape_prototype"], dtype=np.float32)
+            stamp = np.asarray(data["stamp_prototype"], dtype=np.float32)
+            if name in labels:
+                i = labels.index(name)
+                shape_rows[i], stamp_rows[i] = shape, stamp
+            else:
+                labels.append(name)
+                shape_rows.append(shape)
+                stamp_rows.append(stamp)
+        return self.save(labels, np.stack(shape_rows), np.stack(stamp_rows))
+
+    def remove(self, names):
+        """ลบ prototype ของยาตามชื่อ (ชื่อที่ไม่มีอยู่จะถูกข้าม)"""
+        names = set(names)
+        keep = [i for i, label in enumerate(self.labels) if label not in names]
+        if len(keep) == len(self.labels):
+            return self
+        if not keep:
+            raise ValueError("Cannot remove every pill class from the prototype store")
+        return self.save(
+            [self.labels[i] for i in keep],
+            np.asarray(self.shape_matrix)[keep],
+            np.asarray(self.stamp_matrix)[keep]
+        )
+
+def load_json_prototypes(json_path):
+    """อ่าน pill_prototypes.json แบบเดิม"""
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def build_store_from_json(json_path, directory):
+    """แปลง pill_prototypes.json เป็น prototype store (.npy)"""
+    prototypes = load_json_prototypes(json_path)
+    if not prototypes:
+        raise ValueError(f"No prototypes in {json_path}")
+    labels = list(prototypes.keys())
+    store = PrototypeStore(directory).save(
+        labels,
+        np.array([prototypes[name]["shape_prototype"] for name in labels], dtype=np.float32),
+        np.array([prototypes[name]["stamp_prototype"] for name in labels], dtype=np.float32)
+    )
+    logger.info(f"Built prototype store {directory} with {len(labels)} classes")
+    return store
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from utils.image_utils import decode_image
+
+STAMP_SCALES = (1.0, 0.75, 0.5)
+STAMP_ROI_SIZE = 64
+HIST_BINS = 256
+MAX_STAMP_CONTOURS = 32
+
+# scale x threshold ทั้ง 6 แบบรันพร้อมกัน (cv2 ปล่อย GIL ระหว่างประมวลผล)
+_variant_pool = ThreadPoolExecutor(max_workers=len(STAMP_SCALES) * 2, thread_name_prefix="stamp-features")
+
+def _find_candidates(gray, scale, use_otsu):
+    """หา contour ของตราปั้มใน threshold แบบหนึ่งของ scale หนึ่ง คืน (พื้นที่, ภาพที่ scale แล้ว, bbox)"""
+    width = int(gray.shape[1] * scale)
+    height = int(gray.shape[0] * scale)
+    scaled_gray = cv2.resize(gray, (width, height))
+
+    if use_otsu:
+        binary = cv2.threshold(scaled_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    else:
+        binary = cv2.adaptiveThreshold(scaled_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+
+    # Noise reduction
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    candidates = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area > 100 * scale:
+            x, y, w, h = cv2.boundingRect(cnt)
+            if w > 0 and h > 0:
+                candidates.append((area, scaled_gray, (x, y, w, h)))
+    return candidates
+
+def histogram_features(rois):
+    """
+    histogram 256 bin ของ ROI ขนาดเท่ากันหลายภาพในครั้งเดียว (L2-normalized ต่อแถว)
+
+    Args:
+        rois: uint8 array shape (K, H, W)
+    """
+    count = len(rois)
+    offsets = (np.arange(count, dtype=np.int64) * HIST_BINS)[:, None]
+    flat = rois.reshape(count, -1).astype(np.int64) + offsets
+    hist = np.bincount(flat.ravel(), minlength=count * HIST_BINS).reshape(count, HIST_BINS).astype(np.float32)
+    return hist / np.maximum(np.linalg.norm(hist, axis=1, keepdims=True), 1e-12)
+
+def extract_stamp_features(image, max_contours=MAX_STAMP_CONTOURS):
+    """
+    สกัดคุณลักษณะตราปั้มของเม็ดยา
+
+    หา contour จากทุก scale และ threshold พร้อมกัน, เลือก contour ที่ใหญ่ที่สุดไม่เกิน max_contours
+    แล้วคำนวณ histogram ของทุก ROI ในครั้งเดียว
+
+    Args:
+        image: path ของรูปภาพ, ข้อมูลไฟล์รูปภาพ (bytes) หรือภาพ BGR (numpy array)
+        max_contours: จำนวน contour สูงสุดที่ใช้
+
+    Returns:
+        numpy array shape (max_contours, 256): แถวที่ไม่ได้ใช้เป็น 0
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = decode_image(bytes(image))
+    elif not isinstance(image, np.ndarray):
+        path = image
+        image = cv2.imread(str(path))
+        if image is None:
+            raise ValueError(f"Cannot read image: {path}")
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    # ใช้ CLAHE เพื่อปรับปรุง contrast
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    gray = clahe.apply(gray)
+
+    variants = [(scale, use_otsu) for scale in STAMP_SCALES for use_otsu in (True, False)]
+    futures = [_variant_pool.submit(_find_candidates, gray, scale, use_otsu) for scale, use_otsu in variants]
+    candidates = [candidate for future in futures for candidate in future.result()]
+
+    # เลือก contour ที่ใหญ่ที่สุดก่อน (ภาพรกมี contour เล็กจำนวนมากที่ไม่ใช่ตราปั้ม)
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    candidates = candidates[:max_contours]
+
+    if candidates:
+        rois = np.stack([
+            cv2.resize(scaled_gray[y:y + h, x:x + w], (STAMP_ROI_SIZE, STAMP_ROI_SIZE))
+            for _, scaled_gray, (x, y, w, h) in candidates
+        ])
+    else:
+        # Fallback to global image features
+        rois = cv2.resize(gray, (STAMP_ROI_SIZE, STAMP_ROI_SIZE))[None]
+
+    features = np.zeros((max_contours, HIST_BINS), dtype=np.float32)
+    features[:len(rois)] = histogram_features(rois)
+    return features
@@ -0,0 +1,451 @@
+"""
+จัดการไฟล์โมเดลสำหรับ inference backend อื่นนอกจาก PyTorch
+
+    python manage_models.py export --format onnx
+    python manage_models.py export --format openvino --models segment,brand
+    python manage_models.py parity --backend onnx --images ./samples
+    python manage_models.py quantize --calibration ./crops
+    python manage_models.py int8-report --images ./crops
+    python manage_models.py embedding-report --images ./labelled_drugs
+    python manage_models.py single-pass-check --images ./crops
+    python manage_models.py stamp-benchmark --images ./pills
+    python manage_models.py prototypes build
+    python manage_models.py prototypes add --name Paracetamol --images ./pills/paracetamol
+    python manage_models.py prototypes remove --name Paracetamol
+    python manage_models.py pill-export
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from core.config import settings
+from ml_managers.ai_model_manager import (
+    INFERENCE_BACKENDS, exported_model_path, get_model_specs, load_yolo, quantized_model_path
+)
+from ml_managers.parity import compare_classifier, compare_detector
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+def select_specs(models_arg, exportable_only=False):
+    """เลือกโมเดลจาก --models (เช่น segment,brand,brand_specific)"""
+    specs = get_model_specs()
+    if exportable_only:
+        # narcotic ใช้ backbone ของ PyTorch สำหรับสร้าง embedding จึงไม่ได้ serve ผ่าน backend อื่น
+        specs = [spec for spec in specs if spec["name"] != "narcotic"]
+    if not models_arg:
+        return specs
+    wanted = {name.strip() for name in models_arg.split(",") if name.strip()}
+    return [
+        spec for spec in specs
+        if spec["name"] in wanted or ("brand" in spec and "brand_specific" in wanted)
+    ]
+
+def run_export(args):
+    exported = 0
+    for spec in select_specs(args.models):
+        if not spec["path"].exists():
+            print(f"⏭️  {spec['name']}: {spec['path']} not found")
+            continue
+        model = load_yolo(spec["path"], task=spec["task"], backend="pytorch", quantized=False)
+        # dynamic=True เพื่อให้รับ batch หลายภาพได้ (ใช้กับ micro-batching)
+        output = model.export(format=args.format, imgsz=args.imgsz, dynamic=not args.static, half=False)
+        print(f"✅ {spec['name']}: {output}")
+        exported += 1
+    print(f"Exported {exported} model(s) to {args.format}")
+
+def load_images(images_dir, limit):
+    paths = sorted(p for p in Path(images_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)[:limit]
+    images = [(p.name, cv2.imread(str(p))) for p in paths]
+    return [(name, image) for name, image in images if image is not None]
+
+def run_parity(args):
+    """เทียบ top-1 label/confidence ของ backend ที่ export กับ PyTorch"""
+    images = load_images(args.images, args.limit)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    failed = 0
+    for spec in select_specs(args.models, exportable_only=True):
+        exported = exported_model_path(spec["path"], args.backend)
+        if not spec["path"].exists() or not exported.exists():
+            print(f"⏭️  {spec['name']}: missing {spec['path'] if not spec['path'].exists() else exported}")
+            continue
+
+        reference = load_yolo(spec["path"], task=spec["task"], backend="pytorch", quantized=False)
+        candidate = load_yolo(spec["path"], task=spec["task"], backend=args.backend, quantized=False)
+        compare = compare_classifier if spec["task"] == "classify" else compare_detector
+        mismatches, max_diff = compare(reference, candidate, images, args.tolerance)
+
+        status = "✅" if not mismatches else "❌"
+        print(f"{status} {spec['name']}: {len(images) - len(mismatches)}/{len(images)} match, max conf diff {max_diff:.4f}")
+        for line in mismatches[:10]:
+            print(f"    {line}")
+        failed += bool(mismatches)
+
+    return 1 if failed else 0
+
+def select_classifier_specs(models_arg):
+    """classifier ที่ quantize ได้ (brand และ brand_specific)"""
+    return [spec for spec in select_specs(models_arg or "brand,brand_specific") if spec["task"] == "classify"]
+
+def run_quantize(args):
+    from ml_managers.quantization import quantize_classifier
+
+    calibration = [image for _, image in load_images(args.calibration, args.limit)] if args.method == "static" else []
+    if args.method == "static" and not calibration:
+        print(f"❌ No calibration images found in {args.calibration}")
+        return 1
+
+    quantized = 0
+    for spec in select_classifier_specs(args.models):
+        if not exported_model_path(spec["path"], "onnx").exists():
+            print(f"⏭️  {spec['name']}: export to ONNX first")
+            continue
+        output = quantize_classifier(spec["path"], calibration, method=args.method)
+        print(f"✅ {spec['name']}: {output}")
+        quantized += 1
+    print(f"Quantized {quantized} classifier(s) with {args.method} INT8 ({len(calibration)} calibration images)")
+    return 0
+
+def run_int8_report(args):
+    """รายงาน top-1/top-3 agreement, latency และหน่วยความจำของ INT8 เทียบกับ FP32"""
+    from ml_managers.quantization import evaluate_quantized
+
+    images = [image for _, image in load_images(args.images, args.limit)]
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    failed = 0
+    for spec in select_classifier_specs(args.models):
+        if not quantized_model_path(spec["path"]).exists():
+            print(f"⏭️  {spec['name']}: no INT8 model")
+            continue
+        report = evaluate_quantized(spec["path"], images)
+        ok = report["top1_agreement"] >= args.min_top1
+        status = "✅" if ok else "❌"
+        print(
+            f"{status} {spec['name']}: top-1 {report['top1_agreement']:.2%}, top-3 {report['top3_agreement']:.2%} | "
+            f"latency {report['fp32_latency_ms']}ms -> {report['int8_latency_ms']}ms | "
+            f"file {report['fp32_file_bytes'] / 1e6:.1f}MB -> {report['int8_file_bytes'] / 1e6:.1f}MB | "
+            f"load RSS {report['fp32_load_rss_bytes'] / 1e6:.1f}MB -> {report['int8_load_rss_bytes'] / 1e6:.1f}MB"
+        )
+        failed += not ok
+
+    return 1 if failed else 0
+
+def load_labelled_images(images_dir, limit_per_label):
+    """โหลดชุดภาพที่มี label ตามชื่อโฟลเดอร์ย่อย (images_dir/<label>/*.jpg)"""
+    images, labels = [], []
+    for label_dir in sorted(p for p in Path(images_dir).iterdir() if p.is_dir()):
+        for _, image in load_images(label_dir, limit_per_label):
+            images.append(image)
+            labels.append(label_dir.name)
+    return images, np.array(labels)
+
+def recall_at_k(vectors, labels, ks):
+    """
+    Leave-one-out recall@k: สัดส่วนของภาพที่มีภาพ label เดียวกันอยู่ใน k อันดับแรก
+    (ไม่นับภาพที่เป็นภาพเดียวของ label นั้น)
+    """
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -np.inf)
+    ranked = np.argsort(-similarity, axis=1)
+
+    same_label = labels[ranked] == labels[:, None]
+    has_positive = same_label.any(axis=1)
+    return {k: float(same_label[has_positive, :k].any(axis=1).mean()) for k in ks}
+
+def run_embedding_report(args):
+    """เทียบ recall@k ของ embedding แต่ละ version บนชุดภาพที่มี label"""
+    from services.vector_service import EMBEDDING_VERSIONS, VectorService
+
+    images, labels = load_labelled_images(args.images, args.limit)
+    if not images:
+        print(f"❌ No labelled images found in {args.images}")
+        return 1
+    ks = [int(k) for k in args.k.split(",")]
+    print(f"{len(images)} images, {len(set(labels))} labels")
+
+    for version in EMBEDDING_VERSIONS:
+        service = VectorService(embedding_version=version)
+        started = time.perf_counter()
+        vectors = np.stack([
+            service.vector_to_numpy(service.image_to_vector(image, normalize=True, segment_first=args.segment_first))
+            for image in images
+        ])
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(images)
+
+        recalls = recall_at_k(vectors, labels, ks)
+        recall_text = ", ".join(f"R@{k} {value:.3f}" for k, value in recalls.items())
+        print(f"{version}: {vectors.shape[1]} dims, {elapsed_ms:.1f}ms/image | {recall_text}")
+    return 0
+
+def run_single_pass_check(args):
+    """
+    ตรวจว่า embedding ที่ได้จาก forward hook ใช้ forward pass เดียวต่อ batch
+    และ (สำหรับ v1) ตรงกับ feature จากการเรียก backbone แบบ model[:-1] เดิม
+    """
+    import torch
+    from services.vector_service import VectorService
+
+    images = [image for _, image in load_images(args.images, args.limit)]
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    service = VectorService(embedding_version=args.version)
+    before = service.forward_passes
+    predictions = service.predict_with_embedding(images, normalize=False)
+    passes = service.forward_passes - before
+    ok = passes == 1 and len(predictions) == len(images)
+    print(f"{'✅' if ok else '❌'} {len(images)} images -> {passes} forward pass(es)")
+
+    if args.version == "v1":
+        batch = torch.stack([service._to_tensor(image) for image in images]).to(service.device)
+        with torch.no_grad():
+            legacy = service.narcotic_model.model.model[:-1](batch)
+        legacy = legacy.view(legacy.size(0), -1).cpu()
+        hooked = torch.stack([p["vector"] for p in predictions])
+        same = torch.allclose(legacy, hooked, atol=1e-5)
+        print(f"{'✅' if same else '❌'} hooked features match model[:-1] (max diff {float((legacy - hooked).abs().max()):.2e})")
+        ok = ok and same
+
+    return 0 if ok else 1
+
+def legacy_stamp_features(image):
+    """stamp features แบบเดิม (ทุก contour, ทีละ scale/threshold, histogram ทีละ ROI) ใช้เป็นค่าอ้างอิงใน benchmark"""
+    gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    features = []
+    for scale in (1.0, 0.75, 0.5):
+        scaled_gray = cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)))
+        thresholds = [
+            cv2.threshold(scaled_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1],
+            cv2.adaptiveThreshold(scaled_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+        ]
+        for binary in thresholds:
+            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+            contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for cnt in contours:
+                if cv2.contourArea(cnt) > 100 * scale:
+                    x, y, w, h = cv2.boundingRect(cnt)
+                    roi = scaled_gray[y:y + h, x:x + w]
+                    if roi.size > 0:
+                        hist = cv2.calcHist([cv2.resize(roi, (64, 64))], [0], None, [256], [0, 256]).flatten()
+                        features.append(hist / np.linalg.norm(hist))
+    if not features:
+        hist = cv2.calcHist([cv2.resize(gray, (64, 64))], [0], None, [256], [0, 256]).flatten()
+        features.append(hist / np.linalg.norm(hist))
+    return np.array(features, dtype=np.float32)
+
+def cluttered_images(count, size, seed):
+    """สร้างภาพเม็ดยาจำลองบนพื้นหลังรก (ลวดลาย, ตัวอักษร, จุดรบกวน) ที่มี contour จำนวนมาก"""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        image = rng.integers(90, 170, (size, size, 3), dtype=np.uint8)
+        for _ in range(400):
+            center = tuple(int(v) for v in rng.integers(0, size, 2))
+            cv2.circle(image, center, int(rng.integers(4, 20)), tuple(int(v) for v in rng.integers(0, 255, 3)), -1)
+        for _ in range(40):
+            origin = tuple(int(v) for v in rng.integers(0, size, 2))
+            cv2.putText(image, "RX10", origin, cv2.FONT_HERSHEY_SIMPLEX, float(rng.uniform(0.5, 2)), (20, 20, 20), 2)
+        cv2.circle(image, (size // 2, size // 2), size // 5, (235, 235, 235), -1)
+        cv2.putText(image, "WY", (size // 2 - size // 10, size // 2 + size // 30), cv2.FONT_HERSHEY_SIMPLEX, size / 300, (60, 60, 60), 3)
+        images.append(image)
+    return images
+
+def run_stamp_benchmark(args):
+    """เทียบเวลาการสกัด stamp features แบบเดิมกับแบบใหม่ (จำกัด contour + histogram แบบ batch + รัน variant พร้อมกัน)"""
+    from inference.stamp_features import extract_stamp_features
+
+    if args.images:
+        images = [image for _, image in load_images(args.images, args.limit)]
+    else:
+        images = cluttered_images(args.limit, args.size, args.seed)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        return 1
+
+    # warm-up (thread pool, CLAHE)
+    extract_stamp_features(images[0], args.max_contours)
+
+    timings = {"legacy": [], "fast": []}
+    contours = []
+    agreement = []
+    for image in images:
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            legacy = legacy_stamp_features(image)
+            timings["legacy"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            fast = extract_stamp_features(image, args.max_contours)
+            timings["fast"].append(time.perf_counter() - started)
+        contours.append(len(legacy))
+
+        # feature ที่เลือกไว้ต้องเป็นส่วนหนึ่งของ feature เดิม (ความคล้ายสูงสุดกับแถวเดิม ~1)
+        used = fast[np.linalg.norm(fast, axis=1) > 0]
+        agreement.append(float((used @ legacy.T).max(axis=1).min()))
+
+    legacy_ms = np.median(timings["legacy"]) * 1000
+    fast_ms = np.median(timings["fast"]) * 1000
+    print(f"{len(images)} images, {np.mean(contours):.0f} contours/image before cap (max {max(contours)}), cap {args.max_contours}")
+    print(f"legacy: {legacy_ms:.1f}ms/image (median)")
+    print(f"fast:   {fast_ms:.1f}ms/image (median) -> {legacy_ms / fast_ms:.1f}x speedup")
+    print(f"{'✅' if min(agreement) > 0.999 else '❌'} kept features match legacy rows (min similarity {min(agreement):.4f})")
+    return 0
+
+def run_prototypes(args):
+    """
+    สร้าง/แก้ไข prototype store (.npy) ของระบบจำแนกเม็ดยา
+
+    pill engine ที่รันอยู่จะใช้ version ใหม่ตั้งแต่ request ถัดไป (ไม่ต้องเริ่มใหม่)
+    ยกเว้น engine ที่เริ่มก่อนมี store ซึ่งยังใช้ pill_prototypes.json จนกว่าจะเริ่มใหม่
+    """
+    from inference.prototype_store import PrototypeStore, build_store_from_json, load_json_prototypes
+
+    if args.action == "build":
+        store = build_store_from_json(args.json, args.store)
+        print(f"✅ {len(store.labels)} classes -> {args.store} ({store.version})")
+        return 0
+
+    store = PrototypeStore(args.store)
+    if PrototypeStore.exists(args.store):
+        store.load(mmap=False)
+
+    if args.action == "list":
+        for label in store.labels:
+            print(label)
+        print(f"{len(store.labels)} classes, shape {store.shape_matrix.shape}, stamp {store.stamp_matrix.shape}")
+        return 0
+
+    if args.action == "remove":
+        if not args.name:
+            print("❌ --name is required")
+            return 1
+        before = len(store.labels)
+        store.remove(args.name)
+        print(f"✅ Removed {before - len(store.labels)} class(es), {len(store.labels)} left ({store.version})")
+        return 0
+
+    # add: จาก prototypes JSON หรือคำนวณจากภาพตัวอย่างด้วยโมเดล
+    if args.from_json:
+        prototypes = load_json_prototypes(args.from_json)
+    elif args.name and args.images and len(args.name) == 1:
+        from inference.pill_recognition import ImprovedPillRecognitionSystem
+
+        paths = sorted(str(p) for p in Path(args.images).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not paths:
+            print(f"❌ No images found in {args.images}")
+            return 1
+        system = ImprovedPillRecognitionSystem(settings.PILL_MODEL)
+        prototypes = {args.name[0]: system.compute_prototype(paths)}
+    else:
+        print("❌ add needs --from-json, or one --name with --images")
+        return 1
+    store.add(prototypes)
+    print(f"✅ Added/updated {len(prototypes)} class(es), {len(store.labels)} total ({store.version})")
+    return 0
+
+def run_pill_export(args):
+    """serialize shape model ของระบบจำแนกเม็ดยาเป็น .keras เพื่อให้ pill engine โหลดแบบ offline"""
+    from inference.pill_recognition import ImprovedPillRecognitionSystem
+
+    if not Path(args.weights).exists():
+        print(f"❌ {args.weights} not found")
+        return 1
+    system = ImprovedPillRecognitionSystem(model_path=args.weights)
+    system.save_serialized(args.output)
+    print(f"✅ {args.weights} -> {args.output}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="AI model export and backend parity tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export best.pt models for another backend")
+    export_parser.add_argument("--format", choices=[b for b in INFERENCE_BACKENDS if b != "pytorch"], default="onnx")
+    export_parser.add_argument("--models", help="Comma-separated: segment,brand,narcotic,brand_specific")
+    export_parser.add_argument("--imgsz", type=int, default=640)
+    export_parser.add_argument("--static", action="store_true", help="Export with a fixed batch size of 1")
+
+    parity_parser = subparsers.add_parser("parity", help="Compare exported models against PyTorch")
+    parity_parser.add_argument("--backend", choices=[b for b in INFERENCE_BACKENDS if b != "pytorch"], default="onnx")
+    parity_parser.add_argument("--images", required=True, help="Directory of sample images")
+    parity_parser.add_argument("--models", help="Comma-separated: segment,brand,brand_specific")
+    parity_parser.add_argument("--limit", type=int, default=50)
+    parity_parser.add_argument("--tolerance", type=float, default=0.02, help="Max allowed top-1 confidence difference")
+
+    quantize_parser = subparsers.add_parser("quantize", help="Build INT8 variants of the classifiers from their ONNX export")
+    quantize_parser.add_argument("--calibration", default=settings.CALIBRATION_IMAGES_DIR, help="Directory of sample gun crops")
+    quantize_parser.add_argument("--method", choices=["static", "dynamic"], default="static")
+    quantize_parser.add_argument("--models", help="Comma-separated: brand,brand_specific")
+    quantize_parser.add_argument("--limit", type=int, default=200, help="Max calibration images")
+
+    report_parser = subparsers.add_parser("int8-report", help="Compare INT8 classifiers against FP32")
+    report_parser.add_argument("--images", default=settings.CALIBRATION_IMAGES_DIR, help="Directory of sample gun crops")
+    report_parser.add_argument("--models", help="Comma-separated: brand,brand_specific")
+    report_parser.add_argument("--limit", type=int, default=200)
+    report_parser.add_argument("--min-top1", type=float, default=0.98, help="Fail when top-1 agreement is lower")
+
+    embedding_parser = subparsers.add_parser("embedding-report", help="Compare recall@k of the embedding versions")
+    embedding_parser.add_argument("--images", required=True, help="Directory with one sub-directory of images per label")
+    embedding_parser.add_argument("--k", default="1,5,10", help="Comma-separated k values")
+    embedding_parser.add_argument("--limit", type=int, default=100, help="Max images per label")
+    embedding_parser.add_argument("--segment-first", action="store_true", help="Crop the drug object before embedding")
+
+    single_pass_parser = subparsers.add_parser("single-pass-check", help="Verify hooked embeddings use one forward pass")
+    single_pass_parser.add_argument("--images", required=True, help="Directory of sample crops")
+    single_pass_parser.add_argument("--version", choices=["v1", "v2"], default="v1")
+    single_pass_parser.add_argument("--limit", type=int, default=8, help="Images in the batch")
+
+    stamp_parser = subparsers.add_parser("stamp-benchmark", help="Benchmark pill stamp-feature extraction against the legacy version")
+    stamp_parser.add_argument("--images", help="Directory of pill images (default: synthetic cluttered images)")
+    stamp_parser.add_argument("--limit", type=int, default=20)
+    stamp_parser.add_argument("--size", type=int, default=1024, help="Synthetic image size")
+    stamp_parser.add_argument("--seed", type=int, default=0)
+    stamp_parser.add_argument("--repeat", type=int, default=3)
+    stamp_parser.add_argument("--max-contours", type=int, default=32)
+
+    prototypes_parser = subparsers.add_parser("prototypes", help="Build or edit the memory-mapped pill prototype store")
+    prototypes_parser.add_argument("action", choices=["build", "add", "remove", "list"])
+    prototypes_parser.add_argument("--store", default=settings.PILL_PROTOTYPE_STORE, help="Prototype store directory")
+    prototypes_parser.add_argument("--json", default=settings.PILL_PROTOTYPES, help="pill_prototypes.json to convert (build)")
+    prototypes_parser.add_argument("--from-json", help="Prototypes JSON with the classes to add")
+    prototypes_parser.add_argument("--name", action="append", help="Pill class name (repeatable for remove)")
+    prototypes_parser.add_argument("--images", help="Sample images of the pill class to add")
+
+    pill_export_parser = subparsers.add_parser("pill-export", help="Serialize the pill shape model for offline loading")
+    pill_export_parser.add_argument("--weights", default=settings.PILL_MODEL, help="Trained pill model weights")
+    pill_export_parser.add_argument("--output", default=settings.PILL_SERIALIZED_MODEL)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        run_export(args)
+        return 0
+    if args.command == "quantize":
+        return run_quantize(args)
+    if args.command == "int8-report":
+        return run_int8_report(args)
+    if args.command == "embedding-report":
+        return run_embedding_report(args)
+    if args.command == "single-pass-check":
+        return run_single_pass_check(args)
+    if args.command == "stamp-benchmark":
+        return run_stamp_benchmark(args)
+    if args.command == "prototypes":
+        return run_prototypes(args)
+    if args.command == "pill-export":
+        return run_pill_export(args)
+    return run_parity(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,92 @@
 import os
 import asyncio
+import hashlib
 import threading
+import weakref
 from pathlib import Path
 from ultralytics import YOLO
 from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import logging
+from core.config import settings
+from ml_managers.brand_model_cache import BrandModelCache
+
+BASE_MODEL_PATH = Path(__file__).parent.parent / "model" / "Model V2"
+
+BRAND_MODEL_NAMES = [
+    "BERETTA", "Browning", "CZ", "Colt", "GLOCK",
+    "Kimber", "Norinco", "SIG", "Smith & wesson", "Walther"
+]
+
+INFERENCE_BACKENDS = ("pytorch", "onnx", "openvino")
+
+def get_model_specs(base_model_path=BASE_MODEL_PATH):
+    """รายการไฟล์ best.pt ทั้งหมดที่ ModelManager ใช้ พร้อม task ของ ultralytics"""
+    specs = [
+        {"name": "segment", "path": base_model_path / "5M_Segment" / "best_v8.pt", "task": "segment"},
+        {"name": "brand", "path": base_model_path / "Model-CLS-Brand V1" / "best.pt", "task": "classify"},
+        {"name": "narcotic", "path": base_model_path / "Narcotics" / "best.pt", "task": None},
+    ]
+    for brand in BRAND_MODEL_NAMES:
+        specs.append({
+            "name": f"brand_specific/{brand}",
+            "brand": brand,
+            "path": base_model_path / "Model-CLS-MGun-V1" / f"{brand}_model" / "best.pt",
+            "task": "classify"
+        })
+    return specs
+
+def exported_model_path(pt_path, backend):
+    """path ของโมเดลที่ export แล้วสำหรับ backend (อยู่ข้างไฟล์ .pt ต้นฉบับ)"""
+    pt_path = Path(pt_path)
+    if backend == "onnx":
+        return pt_path.with_suffix(".onnx")
+    if backend == "openvino":
+        return pt_path.parent / f"{pt_path.stem}_openvino_model"
+    return pt_path
+
+def quantized_model_path(pt_path):
+    """path ของ classifier แบบ INT8 (ONNX) ที่สร้างด้วย python manage_models.py quantize"""
+    return Path(pt_path).with_suffix(".int8.onnx")
+
+def load_yolo(pt_path, task=None, backend=None, quantized=None):
+    """
+    โหลดโมเดล YOLO ตาม INFERENCE_BACKEND
+    ถ้ายังไม่มีไฟล์ที่ export ไว้จะใช้ไฟล์ .pt แทน
+    ถ้าเปิด INFERENCE_QUANTIZED และมีไฟล์ INT8 ของ classifier จะใช้ไฟล์นั้นก่อน
+    """
+    backend = backend or settings.INFERENCE_BACKEND
+    quantized = settings.INFERENCE_QUANTIZED if quantized is None else quantized
+    path = Path(pt_path)
+    if quantized and task == "classify":
+        int8_path = quantized_model_path(pt_path)
+        if int8_path.exists():
+            return YOLO(str(int8_path), task=task)
+        print(f"⚠️ INT8 model not found for {pt_path}, using {backend} model")
+    if backend != "pytorch":
+        exported = exported_model_path(pt_path, backend)
+        if exported.exists():
+            path = exported
+        else:
+            print(f"⚠️ {backend} model not found for {pt_path}, falling back to PyTorch weights")
+    return YOLO(str(path), task=task)
+
+def get_process_rss_bytes():
+    """Resident memory ปัจจุบันของ process (Linux) หรือ None ถ้าอ่านไม่ได้"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def get_model_memory_bytes(model):
+    """ขนาดของ weights และ buffers ของโมเดล (byte) ที่อยู่ในหน่วยความจำ"""
+    torch_model = getattr(model, "model", None)
+    if torch_model is None or not hasattr(torch_model, "parameters"):
+        return None
+    tensors = list(torch_model.parameters()) + list(torch_model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
 
 class ModelManager:
     """
@@ -30,8 +111,9 @@ class ModelManager:
         print("Initializing Model Manager...")
         
         # Initialize paths
-        self.base_model_path = Path(__file__).parent.parent / "model" / "Model V2"
+        self.base_model_path = BASE_MODEL_PATH
         self._setup_paths()
+        self._model_fingerprint = None
         
         # Model loading status
         self.models_loaded = {
@@ -45,7 +127,25 @@ class ModelManager:
         self.model_segment = None
         self.model_brand = None
         self.model_narcotic = None
-        self.model_map = {}
+        
+        # โมเดล segmentation มี instance เดียว (predictor ของ ultralytics ใช้ร่วมกันข้าม thread ไม่ได้)
+        self._segment_lock = threading.Lock()
+        # lock ต่อโมเดล classification (ยี่ห้อ, เฉพาะยี่ห้อ, narcotic) ที่ stream และ analyze เรียกพร้อมกันได้
+        self._model_locks = weakref.WeakKeyDictionary()
+        self._model_locks_guard = threading.Lock()
+        
+        # โมเดลเฉพาะยี่ห้อโหลดเมื่อถูกใช้ครั้งแรก และเก็บใน LRU cache ที่จำกัดขนาด
+        self.brand_model_cache = BrandModelCache(
+            loader=self._load_single_brand_model,
+            size_of=get_model_memory_bytes,
+            max_models=settings.BRAND_MODEL_CACHE_SIZE,
+            max_bytes=settings.BRAND_MODEL_CACHE_MAX_MB * 1024 * 1024,
+            pinned=[brand.strip() for brand in settings.BRAND_MODEL_PINNED.split(",") if brand.strip()]
+        )
+        
+        # โมเดลอื่นที่โหลดผ่าน get_or_load_model (key -> (path, model))
+        self.extra_models = {}
+        self._extra_models_lock = threading.Lock()
         
         self.segment_classes = {0: "gun", 1: "pistol", 2: "rifle", 3: "weapon"}
         
@@ -65,16 +165,8 @@ class ModelManager:
         self.path_model_narcotic = self.base_model_path / "Narcotics" / "best.pt"
         
         self.model_records = [
-            {"brand": "BERETTA", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "BERETTA_model" / "best.pt")},
-            {"brand": "Browning", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "Browning_model" / "best.pt")},
-            {"brand": "CZ", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "CZ_model" / "best.pt")},
-            {"brand": "Colt", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "Colt_model" / "best.pt")},
-            {"brand": "GLOCK", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "GLOCK_model" / "best.pt")},
-            {"brand": "Kimber", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "Kimber_model" / "best.pt")},
-            {"brand": "Norinco", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "Norinco_model" / "best.pt")},
-            {"brand": "SIG", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "SIG_model" / "best.pt")},
-            {"brand": "Smith & wesson", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "Smith & wesson_model" / "best.pt")},
-            {"brand": "Walther", "path": str(self.base_model_path / "Model-CLS-MGun-V1" / "Walther_model" / "best.pt")},
+            {"brand": spec["brand"], "path": str(spec["path"])}
+            for spec in get_model_specs(self.base_model_path) if "brand" in spec
         ]
 
     def _load_models_background(self):
@@ -85,7 +177,7 @@ class ModelManager:
             # Priority 1: Load critical models first
             self._load_critical_models()
             
-            # Priority 2: Load brand-specific models
+            # Priority 2: Load pinned brand-specific models (ที่เหลือโหลดเมื่อถูกใช้)
             self._load_brand_models()
             
             self.loading_complete.set()
@@ -101,7 +193,7 @@ class ModelManager:
         if self.path_model_5MSegment.exists():
             try:
                 print(f"Loading segmentation model: {self.path_model_5MSegment}")
-                self.model_segment = YOLO(str(self.path_model_5MSegment))
+                self.model_segment = load_yolo(self.path_model_5MSegment, task="segment")
                 if hasattr(self.model_segment, 'names'):
                     self.segment_classes = self.model_segment.names
                 self.models_loaded['segment'] = True
@@ -113,7 +205,7 @@ class ModelManager:
         if self.path_model_CLS_Brand.exists():
             try:
                 print(f"Loading brand model: {self.path_model_CLS_Brand}")
-                self.model_brand = YOLO(str(self.path_model_CLS_Brand))
+                self.model_brand = load_yolo(self.path_model_CLS_Brand, task="classify")
                 self.models_loaded['brand'] = True
                 print("✅ Brand model loaded")
             except Exception as e:
@@ -123,6 +215,7 @@ class ModelManager:
         if self.path_model_narcotic.exists():
             try:
                 print(f"Loading narcotic model: {self.path_model_narcotic}")
+                # ใช้ PyTorch เสมอ เพราะการสร้าง embedding ต้องเข้าถึง backbone ภายในโมเดล
                 self.model_narcotic = YOLO(str(self.path_model_narcotic))
                 self.models_loaded['narcotic'] = True
                 print("✅ Narcotic model loaded")
@@ -130,30 +223,31 @@ class ModelManager:
                 print(f"❌ Failed to load narcotic model: {e}")
 
     def _load_brand_models(self):
-        """Load brand-specific models"""
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            futures = []
-            for record in self.model_records:
-                future = executor.submit(self._load_single_brand_model, record)
-                futures.append(future)
-            
-            # Wait for all brand models to load
-            for future in futures:
-                future.result()
+        """Preload pinned brand-specific models"""
+        pinned = sorted(self.brand_model_cache.pinned)
+        if pinned:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                list(executor.map(self.brand_model_cache.get, pinned))
         
         self.models_loaded['brand_specific'] = True
-        print("✅ All brand-specific models loaded")
+        print(f"✅ Brand-specific models ready (pinned: {pinned or 'none'}, others load on demand)")
 
-    def _load_single_brand_model(self, record):
+    def _load_single_brand_model(self, brand):
         """Load a single brand model"""
-        brand = record['brand']
+        record = next((r for r in self.model_records if r['brand'] == brand), None)
+        if record is None:
+            return None
         path = Path(record['path'])
-        if path.exists():
-            try:
-                self.model_map[brand] = YOLO(str(path))
-                print(f"✅ Loaded {brand} model")
-            except Exception as e:
-                print(f"❌ Failed to load {brand} model: {e}")
+        if not path.exists():
+            return None
+        model = load_yolo(path, task="classify")
+        print(f"✅ Loaded {brand} model")
+        return model
+
+    @property
+    def model_map(self):
+        """โมเดลเฉพาะยี่ห้อที่อยู่ใน cache ตอนนี้ (brand -> model)"""
+        return self.brand_model_cache.loaded()
 
     def wait_for_models(self, timeout=300):
         """Wait for models to finish loading"""
@@ -185,7 +279,7 @@ class ModelManager:
             if self.model_segment is not None:
                 logger.info("Warming up segmentation model...")
                 try:
-                    _ = self.model_segment(dummy_image)
+                    _ = self.segment(dummy_image)
                     warmup_results["segmentation"] = True
                     logger.info("✅ Segmentation model warmed up")
                 except Exception as e:
@@ -195,7 +289,7 @@ class ModelManager:
             if self.model_brand is not None:
                 logger.info("Warming up brand model...")
                 try:
-                    _ = self.model_brand(dummy_image)
+                    _ = self.predict(self.model_brand, dummy_image)
                     warmup_results["brand"] = True
                     logger.info("✅ Brand model warmed up")
                 except Exception as e:
@@ -205,21 +299,22 @@ class ModelManager:
             if self.model_narcotic is not None:
                 logger.info("Warming up narcotic model...")
                 try:
-                    _ = self.model_narcotic(dummy_image)
+                    _ = self.predict(self.model_narcotic, dummy_image)
                     warmup_results["narcotic"] = True
                     logger.info("✅ Narcotic model warmed up")
                 except Exception as e:
                     logger.error(f"❌ Narcotic model warmup failed: {e}")
             
-            # Warm up brand-specific models (sample a few)
+            # Warm up brand-specific models ที่โหลดอยู่แล้ว (ไม่บังคับโหลดยี่ห้อที่ยังไม่ถูกใช้)
             brand_models_warmed = 0
-            sample_brands = list(self.model_map.keys())[:3]  # Warm up first 3 brand models
+            loaded_brands = self.model_map
+            sample_brands = list(loaded_brands.keys())[:3]  # Warm up first 3 brand models
             
             for brand in sample_brands:
-                if self.model_map.get(brand) is not None:
+                if loaded_brands.get(brand) is not None:
                     try:
                         logger.info(f"Warming up {brand} model...")
-                        _ = self.model_map[brand](dummy_image)
+                        _ = self.predict(loaded_brands[brand], dummy_image)
                         brand_models_warmed += 1
                         logger.info(f"✅ {brand} model warmed up")
                     except Exception as e:
@@ -245,7 +340,8 @@ class ModelManager:
                 "brand": self.model_brand is not None,
                 "narcotic": self.model_narcotic is not None,
                 "brand_specific_count": len(self.model_map)
-            }
+            },
+            "brand_model_cache": self.brand_model_cache.stats()
         }
 
     # Getters
@@ -258,8 +354,96 @@ class ModelManager:
     def get_narcotic_model(self):
         return self.model_narcotic
 
+    def segment(self, images, **kwargs):
+        """
+        เรียกโมเดล segmentation ทีละ thread (micro-batching, vector, realtime ใช้ instance เดียวกัน)
+
+        Returns:
+            ผลลัพธ์ของ ultralytics หรือ None ถ้าโมเดลยังไม่พร้อม
+        """
+        model = self.model_segment
+        if model is None:
+            return None
+        with self._segment_lock:
+            return model(images, **kwargs)
+
+    def predict(self, model, images, **kwargs):
+        """
+        เรียกโมเดล ultralytics ทีละ thread ต่อโมเดล (โมเดลยี่ห้อ, เฉพาะยี่ห้อ และ narcotic)
+        โมเดลต่างกันยังรันพร้อมกันได้ ส่วนโมเดล segmentation ใช้ segment()
+        """
+        with self._model_locks_guard:
+            lock = self._model_locks.get(model)
+            if lock is None:
+                lock = self._model_locks[model] = threading.Lock()
+        with lock:
+            return model(images, **kwargs)
+
     def get_brand_specific_model(self, brand_name):
-        return self.model_map.get(brand_name)
+        return self.brand_model_cache.get(brand_name)
+
+    def get_or_load_model(self, key, path):
+        """
+        คืนโมเดลเพิ่มเติมจาก registry (โหลดครั้งแรกที่ขอ) เพื่อให้ทุกส่วนของแอปใช้ instance เดียวกัน
+        """
+        entry = self.extra_models.get(key)
+        if entry is not None:
+            return entry[1]
+        with self._extra_models_lock:
+            entry = self.extra_models.get(key)
+            if entry is None:
+                if not Path(path).exists():
+                    return None
+                print(f"Loading model '{key}': {path}")
+                entry = (str(path), YOLO(str(path)))
+                self.extra_models[key] = entry
+        return entry[1]
+
+    def get_model_fingerprint(self):
+        """
+        hash ของไฟล์โมเดลทั้งหมด (path, ขนาด, เวลาแก้ไข), backend และ embedding version ที่ใช้
+        ใช้เป็น version ของโมเดลใน key ของ result cache
+        """
+        if self._model_fingerprint is None:
+            digest = hashlib.sha256(
+                f"{settings.INFERENCE_BACKEND}:{settings.INFERENCE_QUANTIZED}:{settings.EMBEDDING_VERSION}".encode()
+            )
+            for spec in get_model_specs(self.base_model_path):
+                pt_path = spec["path"]
+                for path in (pt_path, exported_model_path(pt_path, settings.INFERENCE_BACKEND), quantized_model_path(pt_path)):
+                    if path.exists():
+                        stat = path.stat()
+                        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+            self._model_fingerprint = digest.hexdigest()[:16]
+        return self._model_fingerprint
+
+    def get_model_registry(self):
+        """รายการโมเดลที่โหลดอยู่ทั้งหมด พร้อมขนาดในหน่วยความจำ"""
+        registry = {}
+
+        def add(name, path, model):
+            registry[name] = {
+                "path": str(path),
+                "loaded": model is not None,
+                "memory_bytes": get_model_memory_bytes(model) if model is not None else 0
+            }
+
+        add("segment", self.path_model_5MSegment, self.model_segment)
+        add("brand", self.path_model_CLS_Brand, self.model_brand)
+        add("narcotic", self.path_model_narcotic, self.model_narcotic)
+        loaded_brands = self.model_map
+        for record in self.model_records:
+            add(f"brand_specific/{record['brand']}", record["path"], loaded_brands.get(record["brand"]))
+        for key, (path, model) in list(self.extra_models.items()):
+            add(key, path, model)
+
+        return {
+            "backend": settings.INFERENCE_BACKEND,
+            "quantized": settings.INFERENCE_QUANTIZED,
+            "models": registry,
+            "total_model_bytes": sum(entry["memory_bytes"] or 0 for entry in registry.values()),
+            "process_rss_bytes": get_process_rss_bytes()
+        }
 
     def get_segment_classes(self):
         """Return the segmentation class names as dictionary"""
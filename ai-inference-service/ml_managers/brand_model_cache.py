@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+class BrandModelCache:
+    """
+    LRU cache ของโมเดลจำแนกรุ่นปืนแยกตามยี่ห้อ
+
+    - โหลดโมเดลเมื่อถูกขอครั้งแรก (lazy) และโหลดครั้งเดียวแม้มีหลาย thread ขอพร้อมกัน (single-flight)
+    - จำกัดจำนวนโมเดลและขนาดรวมในหน่วยความจำ โดยปลดโมเดลที่ไม่ได้ใช้นานที่สุดออก
+    - ยี่ห้อที่ถูก pin จะไม่ถูกปลดออกจาก cache
+    """
+
+    def __init__(self, loader, size_of=None, max_models=0, max_bytes=0, pinned=None):
+        """
+        Args:
+            loader: ฟังก์ชัน (brand) -> model หรือ None ถ้าไม่มีโมเดลของยี่ห้อนั้น
+            size_of: ฟังก์ชัน (model) -> ขนาด byte (optional)
+            max_models: จำนวนโมเดลสูงสุด (0 = ไม่จำกัด)
+            max_bytes: ขนาดรวมสูงสุด (0 = ไม่จำกัด)
+            pinned: ยี่ห้อที่ต้องอยู่ใน cache ตลอด
+        """
+        self.loader = loader
+        self.size_of = size_of or (lambda model: 0)
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned or [])
+
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+
+    def get(self, brand):
+        """คืนโมเดลของยี่ห้อ (โหลดถ้ายังไม่มี) หรือ None ถ้าไม่มีโมเดล"""
+        with self._lock:
+            model = self._models.get(brand)
+            if model is not None:
+                self._models.move_to_end(brand)
+                self.hits += 1
+                return model
+            self.misses += 1
+            load_lock = self._load_locks.setdefault(brand, threading.Lock())
+
+        with load_lock:
+            # อาจมี thread อื่นโหลดเสร็จระหว่างรอ lock
+            with self._lock:
+                model = self._models.get(brand)
+                if model is not None:
+                    self._models.move_to_end(brand)
+                    return model
+
+            try:
+                model = self.loader(brand)
+            except Exception as e:
+                print(f"❌ Failed to load {brand} model: {e}")
+                model = None
+
+            with self._lock:
+                if model is None:
+                    self.load_failures += 1
+                    return None
+                self.loads += 1
+                self._models[brand] = model
+                self._sizes[brand] = self.size_of(model) or 0
+                self._evict()
+        return model
+
+    def _evict(self):
+        """ปลดโมเดลที่ไม่ได้ใช้นานที่สุด (ที่ไม่ได้ pin) จนอยู่ในงบประมาณ"""
+        while self._over_budget():
+            victim = next((brand for brand in self._models if brand not in self.pinned), None)
+            if victim is None:
+                break
+            del self._models[victim]
+            self._sizes.pop(victim, None)
+            self.evictions += 1
+            print(f"♻️ Evicted {victim} model from cache")
+
+    def _over_budget(self):
+        if self.max_models and len(self._models) > self.max_models:
+            return True
+        if self.max_bytes and sum(self._sizes.values()) > self.max_bytes:
+            return True
+        return False
+
+    def loaded(self):
+        """สำเนา dict ของโมเดลที่อยู่ใน cache (brand -> model)"""
+        with self._lock:
+            return dict(self._models)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": list(self._models.keys()),
+                "pinned": sorted(self.pinned),
+                "bytes": sum(self._sizes.values()),
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "evictions": self.evictions
+            }
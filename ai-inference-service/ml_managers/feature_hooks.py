@@ -0,0 +1,52 @@
+import threading
+from contextlib import contextmanager
+
+class FeatureHooks:
+    """
+    ดึง output ของ layer ภายในโมเดล ultralytics ระหว่าง forward ปกติด้วย forward hook
+
+    forward ผ่าน model.model ตามเส้นทางของ graph (from indices / Concat) ตามเดิม
+    จึงได้ทั้งผลลัพธ์ของโมเดลและ feature ของ layer ที่เลือกจาก forward pass เดียว
+    """
+
+    def __init__(self, torch_model, layer_ids):
+        """
+        Args:
+            torch_model: nn.Module ของ ultralytics (เช่น YOLO(...).model) ที่มี .model เป็นรายการ layer
+            layer_ids: index ของ layer ที่ต้องการ output
+        """
+        self.torch_model = torch_model
+        self.layer_ids = list(layer_ids)
+        self.forward_passes = 0
+
+        self._local = threading.local()
+        self._handles = [
+            torch_model.model[i].register_forward_hook(self._make_hook(i)) for i in self.layer_ids
+        ]
+        self._handles.append(torch_model.register_forward_hook(self._count_forward))
+
+    def _make_hook(self, layer_id):
+        def hook(module, inputs, output):
+            captured = getattr(self._local, "captured", None)
+            if captured is not None:
+                captured[layer_id] = output
+        return hook
+
+    def _count_forward(self, module, inputs, output):
+        if getattr(self._local, "captured", None) is not None:
+            self.forward_passes += 1
+
+    @contextmanager
+    def capture(self):
+        """เก็บ output ของ layer ที่เลือกระหว่างอยู่ใน block นี้ (แยกตาม thread)"""
+        captured = {}
+        self._local.captured = captured
+        try:
+            yield captured
+        finally:
+            self._local.captured = None
+
+    def remove(self):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
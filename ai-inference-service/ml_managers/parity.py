@@ -0,0 +1,41 @@
+"""
+เปรียบเทียบผลของโมเดลสองตัว (เช่น PyTorch กับ backend ที่ export) จากภาพชุดเดียวกัน
+
+ไม่ import โมเดลหรือ numpy: รับ predictor อะไรก็ได้ที่คืนผลรูปแบบเดียวกับ ultralytics
+"""
+
+def compare_classifier(reference, candidate, images, tolerance):
+    """เทียบ top-1 label และ confidence ของ classifier คืน (รายการภาพที่ต่างกัน, confidence ที่ต่างมากที่สุด)"""
+    mismatches = []
+    max_diff = 0.0
+    for name, image in images:
+        ref = reference(image, verbose=False)[0].probs
+        cand = candidate(image, verbose=False)[0].probs
+        diff = abs(float(ref.top1conf) - float(cand.top1conf))
+        max_diff = max(max_diff, diff)
+        if int(ref.top1) != int(cand.top1) or diff > tolerance:
+            mismatches.append(
+                f"{name}: top1 {reference.names[int(ref.top1)]} ({float(ref.top1conf):.3f}) "
+                f"vs {candidate.names[int(cand.top1)]} ({float(cand.top1conf):.3f})"
+            )
+    return mismatches, max_diff
+
+def compare_detector(reference, candidate, images, tolerance, conf=0.25):
+    """เทียบคลาสและ confidence (เรียงแล้ว) ของ detector คืนค่ารูปแบบเดียวกับ compare_classifier"""
+    mismatches = []
+    max_diff = 0.0
+    for name, image in images:
+        ref = reference(image, conf=conf, verbose=False)[0].boxes
+        cand = candidate(image, conf=conf, verbose=False)[0].boxes
+        ref_classes = sorted(int(c) for c in ref.cls.tolist())
+        cand_classes = sorted(int(c) for c in cand.cls.tolist())
+        if ref_classes != cand_classes:
+            mismatches.append(f"{name}: classes {ref_classes} vs {cand_classes}")
+            continue
+        ref_conf = sorted(ref.conf.tolist())
+        cand_conf = sorted(cand.conf.tolist())
+        diff = max((abs(a - b) for a, b in zip(ref_conf, cand_conf)), default=0.0)
+        max_diff = max(max_diff, diff)
+        if diff > tolerance:
+            mismatches.append(f"{name}: confidence differs by {diff:.3f}")
+    return mismatches, max_diff
@@ -0,0 +1,139 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from ml_managers.ai_model_manager import exported_model_path, get_process_rss_bytes, load_yolo, quantized_model_path
+
+def preprocess_classify(image, imgsz=224):
+    """
+    เตรียมภาพแบบเดียวกับ classify transform ของ ultralytics
+    (ย่อด้านสั้นเป็น imgsz, crop ตรงกลาง, RGB, สเกล 0-1, CHW)
+    """
+    height, width = image.shape[:2]
+    scale = imgsz / min(height, width)
+    resized = cv2.resize(image, (max(imgsz, round(width * scale)), max(imgsz, round(height * scale))), interpolation=cv2.INTER_LINEAR)
+    top = (resized.shape[0] - imgsz) // 2
+    left = (resized.shape[1] - imgsz) // 2
+    cropped = resized[top:top + imgsz, left:left + imgsz]
+    rgb = cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)
+    return (rgb.astype(np.float32) / 255.0).transpose(2, 0, 1)
+
+class ImageCalibrationReader:
+    """CalibrationDataReader ของ onnxruntime ที่อ่าน sample crop จากโฟลเดอร์"""
+
+    def __init__(self, input_name, images, imgsz):
+        self._batches = iter([{input_name: preprocess_classify(image, imgsz)[None]} for image in images])
+
+    def get_next(self):
+        return next(self._batches, None)
+
+def _copy_metadata(source_path, target_path):
+    """คัดลอก metadata (names, task, imgsz) ที่ ultralytics ต้องใช้ไปยังโมเดล INT8"""
+    import onnx
+
+    source = onnx.load(str(source_path))
+    target = onnx.load(str(target_path))
+    del target.metadata_props[:]
+    for prop in source.metadata_props:
+        target.metadata_props.add(key=prop.key, value=prop.value)
+    onnx.save(target, str(target_path))
+
+def _onnx_input(onnx_path):
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    imgsz = model_input.shape[-1] if isinstance(model_input.shape[-1], int) else 224
+    return model_input.name, imgsz
+
+def quantize_classifier(pt_path, calibration_images, method="static"):
+    """
+    สร้างโมเดล INT8 จากไฟล์ ONNX ของ classifier
+
+    Args:
+        pt_path: path ของ best.pt (ต้อง export เป็น ONNX ไว้ก่อน)
+        calibration_images: list ของภาพ BGR สำหรับ static quantization
+        method: "static" (ใช้ calibration) หรือ "dynamic"
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    fp32_path = exported_model_path(pt_path, "onnx")
+    if not fp32_path.exists():
+        raise FileNotFoundError(f"{fp32_path} not found, run: python manage_models.py export --format onnx")
+    int8_path = quantized_model_path(pt_path)
+
+    if method == "dynamic":
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    else:
+        if not calibration_images:
+            raise ValueError("Static quantization needs calibration images")
+        input_name, imgsz = _onnx_input(fp32_path)
+        quantize_static(
+            str(fp32_path),
+            str(int8_path),
+            ImageCalibrationReader(input_name, calibration_images, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True
+        )
+
+    _copy_metadata(fp32_path, int8_path)
+    return int8_path
+
+def _timed_load(path, task):
+    rss_before = get_process_rss_bytes() or 0
+    model = load_yolo(path, task=task, backend="pytorch", quantized=False)
+    rss_after = get_process_rss_bytes() or 0
+    return model, max(0, rss_after - rss_before)
+
+def _top3(model, image):
+    probs = model(image, verbose=False)[0].probs
+    return [int(i) for i in probs.top5[:3]]
+
+def evaluate_quantized(pt_path, images, task="classify"):
+    """
+    เทียบโมเดล INT8 กับ FP32 (ONNX) บนชุดภาพ
+
+    Returns:
+        dict: top-1/top-3 agreement, latency เฉลี่ย, ขนาดไฟล์และ RSS ที่เพิ่มขึ้นตอนโหลด
+    """
+    fp32_path = exported_model_path(pt_path, "onnx")
+    int8_path = quantized_model_path(pt_path)
+    fp32_model, fp32_rss = _timed_load(fp32_path, task)
+    int8_model, int8_rss = _timed_load(int8_path, task)
+
+    # warm up ครั้งแรกไม่นับเวลา
+    fp32_model(images[0], verbose=False)
+    int8_model(images[0], verbose=False)
+
+    top1_agree = 0
+    top3_agree = 0
+    fp32_ms = 0.0
+    int8_ms = 0.0
+    for image in images:
+        started = time.perf_counter()
+        reference = _top3(fp32_model, image)
+        fp32_ms += (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        candidate = _top3(int8_model, image)
+        int8_ms += (time.perf_counter() - started) * 1000
+
+        top1_agree += reference[0] == candidate[0]
+        top3_agree += set(reference) == set(candidate)
+
+    count = len(images)
+    return {
+        "images": count,
+        "top1_agreement": round(top1_agree / count, 4),
+        "top3_agreement": round(top3_agree / count, 4),
+        "fp32_latency_ms": round(fp32_ms / count, 2),
+        "int8_latency_ms": round(int8_ms / count, 2),
+        "fp32_file_bytes": os.path.getsize(fp32_path),
+        "int8_file_bytes": os.path.getsize(int8_path),
+        "fp32_load_rss_bytes": fp32_rss,
+        "int8_load_rss_bytes": int8_rss
+    }
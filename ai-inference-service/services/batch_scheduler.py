@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from core.config import settings
+from services.inference_executor import InferenceQueueFull, estimate_retry_after
+
+logger = logging.getLogger(__name__)
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler สำหรับโมเดลหนึ่งตัว
+
+    request ที่เข้ามาจะถูกเข้าคิว แล้วรวมเป็น batch ภายในช่วงเวลาสั้น ๆ (max_wait_ms)
+    หรือจนครบ max_batch_size จากนั้นเรียก batch_fn ใน worker thread ครั้งเดียว
+    และส่งผลลัพธ์กลับให้แต่ละ request ผ่าน future
+
+    batch_fn รับ list ของ item และต้องคืน list ผลลัพธ์ที่มีลำดับเดียวกัน
+    (ผลลัพธ์ที่เป็น Exception จะถูกส่งเป็น error ให้เฉพาะ request นั้น)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 15.0,
+        max_pending: int = 16
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_pending = max(self.max_batch_size, max_pending)
+
+        # โมเดลเดียวกันถูกเรียกจาก thread เดียวเสมอ
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"batch-{name}")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.batch_sizes = Counter()
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+        self.in_flight = 0
+
+    def _ensure_worker(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """ส่ง item เข้าคิวและรอผลลัพธ์ของ item นั้น"""
+        self._ensure_worker()
+        pending = self._queue.qsize() + self.in_flight
+        if pending >= self.max_pending:
+            self.rejected += 1
+            avg_run_ms = self.total_run_ms / self.batches if self.batches else 0
+            raise InferenceQueueFull(estimate_retry_after(pending, self.max_batch_size, avg_run_ms))
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        items = [item for item, _, _ in batch]
+
+        self.batches += 1
+        self.batch_sizes[len(batch)] += 1
+        self.total_wait_ms += sum((started - queued_at) * 1000 for _, _, queued_at in batch)
+        self.in_flight = len(batch)
+
+        try:
+            results = await loop.run_in_executor(self._executor, self.batch_fn, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"❌ Batch '{self.name}' failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.in_flight = 0
+            self.total_run_ms += (time.perf_counter() - started) * 1000
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        processed = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": round(processed / self.batches, 2) if self.batches else 0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "avg_queue_wait_ms": round(self.total_wait_ms / processed, 2) if processed else 0,
+            "avg_batch_run_ms": round(self.total_run_ms / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
+
+_schedulers: Dict[str, BatchScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+def get_batch_scheduler(name: str, batch_fn: Callable[[List[Any]], List[Any]]) -> BatchScheduler:
+    """คืน scheduler ของโมเดลตามชื่อ (สร้างครั้งแรกที่เรียก)"""
+    scheduler = _schedulers.get(name)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(name)
+            if scheduler is None:
+                scheduler = BatchScheduler(
+                    name,
+                    batch_fn,
+                    max_batch_size=settings.BATCH_MAX_SIZE,
+                    max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+                    max_pending=settings.INFERENCE_MAX_PENDING
+                )
+                _schedulers[name] = scheduler
+    return scheduler
+
+def get_batching_metrics() -> Dict[str, Any]:
+    """Metrics ของทุก scheduler สำหรับ /status"""
+    return {name: scheduler.get_metrics() for name, scheduler in _schedulers.items()}
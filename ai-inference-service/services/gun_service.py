@@ -1,4 +1,5 @@
 import cv2
+from collections import defaultdict
 from ml_managers.ai_model_manager import get_model_manager
 from utils.image_utils import crop_mask_on_white
 from utils.prediction_utils import get_top3
@@ -13,22 +14,39 @@ def analyze_gun_brand(cropped_image):
     Returns:
         dict: ข้อมูลยี่ห้อปืนและความมั่นใจ
     """
+    return analyze_gun_brands([cropped_image])[0]
+
+def analyze_gun_brands(cropped_images):
+    """
+    วิเคราะห์ยี่ห้อปืนจากหลายภาพด้วยการเรียกโมเดลยี่ห้อครั้งเดียว (batch)
+    
+    Args:
+        cropped_images: list ของภาพที่ตัดเฉพาะปืนบนพื้นขาว
+        
+    Returns:
+        list[dict]: ข้อมูลยี่ห้อปืนของแต่ละภาพ เรียงตามลำดับเดียวกับ input
+    """
+    if not cropped_images:
+        return []
+
     # รับโมเดลจาก ModelManager
     model_manager = get_model_manager()
     model_brand = model_manager.get_brand_model()
     
     if model_brand is None:
-        return {"selected_brand": "Unknown", "brand_top3": []}
+        return [{"selected_brand": "Unknown", "brand_top3": []} for _ in cropped_images]
     
-    # ทำนายยี่ห้อ
-    pred_brand = model_brand(cropped_image)[0]
-    brand_top3 = get_top3(pred_brand, model_brand.names)
-    selected_brand = brand_top3[0]['label'] if brand_top3 else "Unknown"
+    # ทำนายยี่ห้อทุกภาพใน batch เดียว
+    preds = model_manager.predict(model_brand, list(cropped_images))
     
-    return {
-        "selected_brand": selected_brand,
-        "brand_top3": brand_top3
-    }
+    results = []
+    for pred_brand in preds:
+        brand_top3 = get_top3(pred_brand, model_brand.names)
+        results.append({
+            "selected_brand": brand_top3[0]['label'] if brand_top3 else "Unknown",
+            "brand_top3": brand_top3
+        })
+    return results
 
 def analyze_gun_model(cropped_image, brand_name):
     """
@@ -41,20 +59,43 @@ def analyze_gun_model(cropped_image, brand_name):
     Returns:
         dict: ข้อมูลรุ่นปืนและความมั่นใจ
     """
+    return analyze_gun_models([cropped_image], [brand_name])[0]
+
+def analyze_gun_models(cropped_images, brand_names):
+    """
+    วิเคราะห์รุ่นปืนจากหลายภาพ โดยจัดกลุ่มตามยี่ห้อแล้วเรียกโมเดลเฉพาะยี่ห้อครั้งเดียวต่อกลุ่ม
+    
+    Args:
+        cropped_images: list ของภาพที่ตัดเฉพาะปืนบนพื้นขาว
+        brand_names: list ของชื่อยี่ห้อปืน (ลำดับเดียวกับ cropped_images)
+        
+    Returns:
+        list[dict]: ข้อมูลรุ่นปืนของแต่ละภาพ เรียงตามลำดับเดียวกับ input
+    """
+    results = [{"selected_model": "Unknown", "model_top3": []} for _ in cropped_images]
+
+    # จัดกลุ่ม index ของภาพตามยี่ห้อ
+    indices_by_brand = defaultdict(list)
+    for i, brand_name in enumerate(brand_names):
+        indices_by_brand[brand_name].append(i)
+
     # รับโมเดลจาก ModelManager
     model_manager = get_model_manager()
-    model_model = model_manager.get_brand_specific_model(brand_name)
-    
-    # ถ้าไม่มีโมเดลสำหรับยี่ห้อนี้
-    if model_model is None:
-        return {"selected_model": "Unknown", "model_top3": []}
-    
-    # ใช้โมเดลเฉพาะยี่ห้อเพื่อทำนายรุ่น
-    pred_model = model_model(cropped_image)[0]
-    model_top3 = get_top3(pred_model, model_model.names)
-    selected_model = model_top3[0]['label'] if model_top3 else "Unknown"
+
+    for brand_name, indices in indices_by_brand.items():
+        model_model = model_manager.get_brand_specific_model(brand_name)
+        
+        # ถ้าไม่มีโมเดลสำหรับยี่ห้อนี้
+        if model_model is None:
+            continue
+        
+        # ใช้โมเดลเฉพาะยี่ห้อทำนายรุ่นของทุกภาพในกลุ่มพร้อมกัน
+        preds = model_manager.predict(model_model, [cropped_images[i] for i in indices])
+        for i, pred_model in zip(indices, preds):
+            model_top3 = get_top3(pred_model, model_model.names)
+            results[i] = {
+                "selected_model": model_top3[0]['label'] if model_top3 else "Unknown",
+                "model_top3": model_top3
+            }
     
-    return {
-        "selected_model": selected_model,
-        "model_top3": model_top3
-    }
\ No newline at end of file
+    return results
@@ -1,48 +1,70 @@
 import cv2
 import numpy as np
 from ml_managers.ai_model_manager import get_model_manager
-from utils.image_utils import crop_mask_on_white
+from utils.image_utils import crop_masks_on_white, working_image
 
 def segment_image(image):
     """
     ทำการแบ่งส่วนภาพและระบุประเภทวัตถุ
-    
+
     Args:
         image: ภาพในรูปแบบ numpy array (BGR)
-        
+
     Returns:
         results: ผลลัพธ์จาก model_segment
         segmented_objects: list ของอ็อบเจ็กต์ที่แบ่งส่วนเสร็จแล้ว
     """
+    return segment_images([image])[0]
+
+def segment_images(images):
+    """
+    ทำการแบ่งส่วนหลายภาพด้วยการเรียกโมเดล segmentation ครั้งเดียว (batch)
+
+    Args:
+        images: list ของภาพในรูปแบบ numpy array (BGR) หรือ DecodedImage
+            (วัตถุถูกตัดจากภาพความละเอียดเต็มของ DecodedImage)
+
+    Returns:
+        list ของ (results, segmented_objects) เรียงตามลำดับเดียวกับ input
+    """
     # รับโมเดลและคลาสจาก ModelManager
     model_manager = get_model_manager()
-    model_segment = model_manager.get_segmentation_model()
     segment_classes = model_manager.get_segment_classes()
-    
-    if model_segment is None:
-        return None, []
-    
-    # ประมวลผลภาพด้วยโมเดล segmentation
-    results = model_segment(image)[0]
-    
+
+    # ประมวลผลทุกภาพด้วยโมเดล segmentation ในครั้งเดียว
+    batch_results = model_manager.segment([working_image(image) for image in images])
+    if batch_results is None:
+        return [(None, []) for _ in images]
+
+    return [
+        (results, _extract_objects(image, results, segment_classes))
+        for image, results in zip(images, batch_results)
+    ]
+
+def _extract_objects(image, results, segment_classes):
+    """ตัดวัตถุแต่ละชิ้นจากผลลัพธ์ segmentation ของภาพหนึ่งภาพ"""
     segmented_objects = []
-    
+
+    if results.masks is None:
+        return segmented_objects
+
+    # resize mask ทั้งหมดครั้งเดียว แล้วตัดเฉพาะ bounding box ของแต่ละวัตถุบนพื้นขาว
+    masks = results.masks.data.cpu().numpy()
+    cropped_images = crop_masks_on_white(image, masks)
+
     # วนลูปผ่านแต่ละ mask
-    for i, mask in enumerate(results.masks.data):
+    for i, cropped in enumerate(cropped_images):
         cls_id = int(results.boxes.cls[i].item())
         confidence = float(results.boxes.conf[i].item())
         cls_name = segment_classes.get(cls_id, "Unknown")
-        
-        # สร้างภาพที่ตัดเฉพาะส่วนที่ต้องการบนพื้นขาว
-        cropped = crop_mask_on_white(image, mask.cpu().numpy())
-        
+
         segmented_objects.append({
             "index": i,
             "class_id": cls_id,
             "class_name": cls_name,
             "confidence": round(confidence, 3),
-            "mask": mask.cpu().numpy(),
+            "mask": masks[i],
             "cropped_image": cropped
         })
-    
-    return results, segmented_objects
\ No newline at end of file
+
+    return segmented_objects
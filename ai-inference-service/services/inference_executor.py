@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import torch
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class InferenceQueueFull(Exception):
+    """คิวงาน inference เต็ม (ให้ตอบ 429 พร้อม Retry-After)"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def estimate_retry_after(pending: int, workers: int, avg_ms: float) -> int:
+    """ประมาณเวลา (วินาที) ที่คิวจะว่างพอรับงานใหม่"""
+    if not avg_ms:
+        return 1
+    return max(1, math.ceil(pending / max(1, workers) * avg_ms / 1000))
+
+class InferenceExecutor:
+    """
+    Thread pool ขนาดจำกัดสำหรับงาน inference ที่ใช้ CPU หนัก
+
+    ให้ route แบบ async เรียกโมเดลโดยไม่บล็อก event loop
+    และปฏิเสธงานใหม่ (InferenceQueueFull) เมื่องานค้างเกิน max_pending
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+        self.total_run_ms = 0.0
+
+    @property
+    def avg_run_ms(self) -> float:
+        return self.total_run_ms / self.completed if self.completed else 0.0
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise InferenceQueueFull(estimate_retry_after(self._pending, self.max_workers, self.avg_run_ms))
+            self._pending += 1
+
+    def _timed(self, fn: Callable, *args, **kwargs) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.completed += 1
+                self.total_run_ms += elapsed
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """รัน fn(*args, **kwargs) ใน thread pool และรอผลลัพธ์"""
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(self._timed, fn, *args, **kwargs)
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_run_ms": round(self.avg_run_ms, 2),
+            "torch_threads": torch.get_num_threads()
+        }
+
+_executor: Optional[InferenceExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_inference_executor() -> InferenceExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = InferenceExecutor(settings.INFERENCE_WORKERS, settings.INFERENCE_MAX_PENDING)
+    return _executor
+
+async def run_inference(fn: Callable, *args, **kwargs) -> Any:
+    """รันงาน inference แบบ synchronous นอก event loop ผ่าน executor กลาง"""
+    return await get_inference_executor().run(fn, *args, **kwargs)
+
+def configure_torch_threads() -> int:
+    """
+    กำหนดจำนวน intra-op thread ของ torch ให้ worker ทุกตัวรวมกันไม่เกินจำนวน CPU
+    """
+    threads = settings.TORCH_NUM_THREADS or max(1, (os.cpu_count() or 1) // max(1, settings.INFERENCE_WORKERS))
+    torch.set_num_threads(threads)
+    logger.info(f"Torch intra-op threads: {threads}, inference workers: {settings.INFERENCE_WORKERS}")
+    return threads
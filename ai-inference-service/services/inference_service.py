@@ -1,105 +1,226 @@
-import os
-import cv2
+import asyncio
 import traceback
-import tempfile
 import logging
+from core.config import settings
 from ml_managers.ai_model_manager import get_model_manager
-from services.gun_service import analyze_gun_brand, analyze_gun_model
+from services.gun_service import analyze_gun_brands, analyze_gun_models
 from services.narcotic_service import analyze_drug
-from services.image_service import segment_image
-from utils.image_utils import save_temp_image
+from services.image_service import segment_images
+from services.batch_scheduler import get_batch_scheduler
+from services.inference_executor import InferenceQueueFull, run_inference
+from services.result_cache import get_result_cache, is_cacheable, make_cache_key
+from services.stream_service import detect_frame
+from utils.image_utils import decode_image_info, working_image
 
 # Get logger
 logger = logging.getLogger(__name__)
 
-def process_image_with_gun_models(image_path):
+def classify_gun_objects(gun_objects):
     """
-    ฟังก์ชันหลักสำหรับประมวลผลภาพด้วยโมเดลปืนและยาเสพติด
+    จำแนกยี่ห้อและรุ่นของปืนหลายกระบอกแบบ batch
+
+    เรียกโมเดลยี่ห้อครั้งเดียวกับทุกภาพ แล้วเรียกโมเดลเฉพาะยี่ห้อครั้งเดียวต่อยี่ห้อ
+    
+    Args:
+        gun_objects: list ของ (obj_data, cropped_image) โดย obj_data จะถูกอัปเดตผลลัพธ์
     """
-    logger.info(f"Processing image: {image_path}")
-    image = cv2.imread(image_path)
-    if image is None:
-        logger.error(f"Could not read image at {image_path}")
-        return {"error": f"Could not read image at {image_path}"}
+    crops = [cropped for _, cropped in gun_objects]
+    logger.info(f"Analyzing gun brand for {len(crops)} objects")
+    brand_infos = analyze_gun_brands(crops)
     
-    logger.info("Segmenting image")
-    _, segmented_objects = segment_image(image)
+    known = []
+    for (obj_data, cropped), brand_info in zip(gun_objects, brand_infos):
+        obj_data.update(brand_info)
+        if brand_info["selected_brand"] != "Unknown":
+            known.append((obj_data, cropped, brand_info["selected_brand"]))
+    
+    if known:
+        logger.info(f"Analyzing gun model for brands: {sorted({brand for _, _, brand in known})}")
+        model_infos = analyze_gun_models(
+            [cropped for _, cropped, _ in known],
+            [brand for _, _, brand in known]
+        )
+        for (obj_data, _, _), model_info in zip(known, model_infos):
+            obj_data.update(model_info)
+
+def load_image(image):
+    """
+    แปลง input เป็นภาพ numpy array (BGR) หรือ DecodedImage (สำหรับ bytes/path)
+
+    Args:
+        image: ภาพ numpy array (BGR), DecodedImage, bytes ของไฟล์ภาพ หรือ path
+    """
+    if isinstance(image, str):
+        logger.info(f"Processing image: {image}")
+        try:
+            with open(image, "rb") as f:
+                image = f.read()
+        except OSError:
+            raise ValueError(f"Could not read image at {image}")
+    if isinstance(image, (bytes, bytearray)):
+        return decode_image_info(bytes(image), settings.DECODE_MAX_SIDE)
+    return image
+
+def process_image_with_gun_models(image, image_name=None):
+    """
+    ฟังก์ชันหลักสำหรับประมวลผลภาพด้วยโมเดลปืนและยาเสพติด
+
+    Args:
+        image: ภาพ numpy array (BGR), DecodedImage, bytes ของไฟล์ภาพ หรือ path
+        image_name: ชื่อไฟล์ต้นฉบับสำหรับผลลัพธ์ (optional)
+    """
+    if isinstance(image, str):
+        image_name = image_name or image
+    try:
+        image = load_image(image)
+    except ValueError as e:
+        logger.error(str(e))
+        return {"error": str(e)}
     
+    result = process_images_with_gun_models([image], [image_name])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def _segment_each(images):
+    """segment ทีละภาพ คืน Exception แทนผลของภาพที่ล้มเหลว"""
+    segmentations = []
+    for image in images:
+        try:
+            segmentations.append(segment_images([image])[0])
+        except Exception as e:
+            logger.error(f"❌ Segmentation failed: {e}")
+            segmentations.append(e)
+    return segmentations
+
+def _process_segmented_objects(segmented_objects):
+    """แปลงวัตถุที่ segment แล้วของภาพหนึ่งภาพ คืน (processed_objects, gun_objects ที่รอจำแนก)"""
     processed_objects = []
-    temp_files = []
+    gun_objects = []
     
     for obj in segmented_objects:
         logger.info(f"Processing object: {obj['class_name']} (confidence: {obj['confidence']})")
-        temp_path = save_temp_image(obj["cropped_image"], image_path, obj["index"], obj["class_name"])
-        temp_files.append(temp_path)
         
         obj_data = {
             "object_index": obj["index"],
             "class": obj["class_name"],
-            "confidence": obj["confidence"],
-            "cropped_path": temp_path
+            "confidence": obj["confidence"]
         }
         
         if obj["class_name"] in ['BigGun', 'Pistol', 'Revolver']:
-            logger.info(f"Analyzing gun brand for {obj['class_name']}")
-            brand_info = analyze_gun_brand(obj["cropped_image"])
-            obj_data.update(brand_info)
-            
-            if brand_info["selected_brand"] != "Unknown":
-                logger.info(f"Analyzing gun model for brand: {brand_info['selected_brand']}")
-                model_info = analyze_gun_model(obj["cropped_image"], brand_info["selected_brand"])
-                obj_data.update(model_info)
+            # จำแนกยี่ห้อ/รุ่นพร้อมกันทีเดียวหลังวนครบทุกวัตถุของทุกภาพ
+            gun_objects.append((obj_data, obj["cropped_image"]))
         
         elif obj["class_name"] in ['Drug', 'PackageDrug']:
             logger.info(f"Analyzing drug: {obj['class_name']}")
-            drug_info = analyze_drug(obj["cropped_image"], temp_path)
+            drug_info = analyze_drug(obj["cropped_image"])
             obj_data.update(drug_info)
         
         processed_objects.append(obj_data)
     
-    for temp_file in temp_files:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+    return processed_objects, gun_objects
+
+def process_images_with_gun_models(images, image_names=None):
+    """
+    ประมวลผลหลายภาพพร้อมกัน: segmentation ครั้งเดียวทั้ง batch
+    และจำแนกยี่ห้อ/รุ่นของปืนจากทุกภาพรวมกัน
+    
+    ภาพที่ล้มเหลวได้ผลลัพธ์เป็น Exception ของภาพนั้นเท่านั้น (ไม่กระทบภาพอื่นใน batch)
+    ถ้าการเรียกแบบ batch ล้มเหลว จะลองใหม่ทีละภาพ
+
+    Args:
+        images: list ของภาพ numpy array (BGR) หรือ DecodedImage
+        image_names: list ของชื่อไฟล์ต้นฉบับ (optional)
+
+    Returns:
+        list ของผลลัพธ์ (dict หรือ Exception) แต่ละภาพ เรียงตามลำดับเดียวกับ input
+    """
+    image_names = image_names or [None] * len(images)
+    
+    logger.info(f"Segmenting {len(images)} image(s)")
+    try:
+        segmentations = segment_images(images)
+    except Exception as e:
+        if len(images) == 1:
+            logger.error(f"❌ Segmentation failed: {e}")
+            return [e]
+        logger.warning(f"⚠️ Batch segmentation failed ({e}), retrying images one at a time")
+        segmentations = _segment_each(images)
+    
+    batch_results = []
+    gun_groups = {}
+    
+    for i, (image_name, segmentation) in enumerate(zip(image_names, segmentations)):
+        if isinstance(segmentation, Exception):
+            batch_results.append(segmentation)
+            continue
+        try:
+            processed_objects, gun_objects = _process_segmented_objects(segmentation[1])
+        except Exception as e:
+            logger.error(f"❌ Processing objects failed for {image_name or 'uploaded image'}: {e}")
+            batch_results.append(e)
+            continue
+        
+        logger.info(f"Processing complete. Found {len(processed_objects)} objects")
+        batch_results.append({
+            "original_image": image_name,
+            "detected_objects": processed_objects
+        })
+        if gun_objects:
+            gun_groups[i] = gun_objects
+    
+    if gun_groups:
+        try:
+            classify_gun_objects([obj for gun_objects in gun_groups.values() for obj in gun_objects])
+        except Exception as e:
+            if len(gun_groups) == 1:
+                failed = {i: e for i in gun_groups}
+            else:
+                logger.warning(f"⚠️ Batch gun classification failed ({e}), retrying images one at a time")
+                failed = {}
+                for i, gun_objects in gun_groups.items():
+                    try:
+                        classify_gun_objects(gun_objects)
+                    except Exception as image_error:
+                        failed[i] = image_error
+            for i, error in failed.items():
+                logger.error(f"❌ Gun classification failed: {error}")
+                batch_results[i] = error
     
-    logger.info(f"Processing complete. Found {len(processed_objects)} objects")
-    return {
-        "original_image": image_path,
-        "detected_objects": processed_objects
-    }
+    return batch_results
+
+def _analyze_batch(items):
+    """batch_fn ของ scheduler 'analyze': items คือ list ของ (image, image_name)"""
+    return process_images_with_gun_models(
+        [image for image, _ in items],
+        [image_name for _, image_name in items]
+    )
 
-async def analyze_image_service(image_path: str):
+async def analyze_image_service(image, image_name=None):
     """
     บริการวิเคราะห์รูปภาพสำหรับทั้งยาเสพติดและอาวุธ
+
+    Args:
+        image: ภาพ numpy array (BGR) หรือ DecodedImage ที่ถอดรหัสแล้ว, bytes ของไฟล์ภาพ หรือ path
+        image_name: ชื่อไฟล์ต้นฉบับ (optional)
     """
     try:
-        logger.info(f"Starting image analysis for: {image_path}")
+        logger.info(f"Starting image analysis for: {image_name or 'uploaded image'}")
         
         model_manager = get_model_manager()
         
         if model_manager.get_segmentation_model() is not None:
             logger.info("Using segment model for analysis")
-            result = process_image_with_gun_models(image_path)
-            
-            gun_classes = ['BigGun', 'Pistol', 'Revolver']
-            gun_objects = [obj for obj in result["detected_objects"] if obj["class"] in gun_classes]
-            drug_objects = [obj for obj in result["detected_objects"] if obj["class"] in ["Drug", "PackageDrug"]]
-            other_objects = [obj for obj in result["detected_objects"] 
-                            if obj["class"] not in gun_classes + ["Drug", "PackageDrug"]]
-            
-            if gun_objects:
-                logger.info("Detected firearm objects")
-                result["detectionType"] = "firearm"
-                result["primaryObjects"] = gun_objects
-                result["secondaryObjects"] = other_objects
-                
-            elif drug_objects:
-                logger.info("Detected drug objects")
-                result["detectionType"] = "narcotic"
-            else:
-                logger.info("No specific objects detected")
-                result["detectionType"] = "unknown"
-                result["primaryObjects"] = other_objects
+            if isinstance(image, str):
+                image_name = image_name or image
+            image = await run_inference(load_image, image)
             
+            # ภาพเดิมกับโมเดลเดิมให้ผลเดิม: ใช้ผลใน cache หรือรอ request ที่กำลังวิเคราะห์ภาพเดียวกันอยู่
+            cache_key = await asyncio.to_thread(make_cache_key, "analyze", working_image(image))
+            result = await get_result_cache().get_or_compute(
+                cache_key, lambda: _analyze_uncached(image), cacheable=is_cacheable
+            )
+            result["original_image"] = image_name
             return result
         else:
             logger.error("Gun models not loaded")
@@ -109,25 +230,49 @@ async def analyze_image_service(image_path: str):
                 "message": "Cannot analyze image because required models are not available"
             }
             
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}", exc_info=True)
         raise Exception(f"Failed to process image: {str(e)}")
 
+async def _analyze_uncached(image):
+    """วิเคราะห์ภาพผ่าน micro-batching scheduler และจัดกลุ่มวัตถุตามประเภท"""
+    # รวม request ที่เข้ามาพร้อมกันเป็น batch เดียวก่อนส่งเข้าโมเดล
+    result = await get_batch_scheduler("analyze", _analyze_batch).submit((image, None))
+    
+    gun_classes = ['BigGun', 'Pistol', 'Revolver']
+    gun_objects = [obj for obj in result["detected_objects"] if obj["class"] in gun_classes]
+    drug_objects = [obj for obj in result["detected_objects"] if obj["class"] in ["Drug", "PackageDrug"]]
+    other_objects = [obj for obj in result["detected_objects"] 
+                    if obj["class"] not in gun_classes + ["Drug", "PackageDrug"]]
+    
+    if gun_objects:
+        logger.info("Detected firearm objects")
+        result["detectionType"] = "firearm"
+        result["primaryObjects"] = gun_objects
+        result["secondaryObjects"] = other_objects
+        
+    elif drug_objects:
+        logger.info("Detected drug objects")
+        result["detectionType"] = "narcotic"
+    else:
+        logger.info("No specific objects detected")
+        result["detectionType"] = "unknown"
+        result["primaryObjects"] = other_objects
+    
+    return result
+
 async def detect_realtime_service(image_data, mode=None):
     """
     บริการตรวจจับแบบเรียลไทม์สำหรับการใช้งานผ่านกล้อง
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
-        temp_path = temp.name
-        temp.write(image_data)
-    
     try:
+        decoded = await run_inference(decode_image_info, image_data, settings.DECODE_MAX_SIDE)
         model_manager = get_model_manager()
-        weapon_model = model_manager.get_weapon_model()
-        
-        if mode == "fast" and weapon_model:
-            image = cv2.imread(temp_path)
-            results = weapon_model(image)[0]
+        if mode == "fast" and model_manager.get_segmentation_model() is not None:
+            # segmentation อย่างเดียวที่ imgsz ลดลง (ไม่จำแนกยี่ห้อ/รุ่น)
+            results = await run_inference(detect_frame, decoded.image)
             
             detections = []
             for i, box in enumerate(results.boxes):
@@ -135,18 +280,17 @@ async def detect_realtime_service(image_data, mode=None):
                 cls_name = results.names[cls_id]
                 confidence = float(box.conf[0].item())
                 
-                if confidence > 0.3:
-                    detections.append({
-                        "class": cls_name,
-                        "confidence": round(confidence, 2)
-                    })
+                detections.append({
+                    "class": cls_name,
+                    "confidence": round(confidence, 2)
+                })
             
             return {
                 "mode": "fast",
                 "detections": detections
             }
         else:
-            result = await analyze_image_service(temp_path)
+            result = await analyze_image_service(decoded)
             
             simplified = {
                 "mode": "accurate",
@@ -167,10 +311,8 @@ async def detect_realtime_service(image_data, mode=None):
             
             return simplified
     
+    except InferenceQueueFull:
+        raise
     except Exception as e:
         print(f"Error in real-time detection: {e}")
-        return {"error": str(e)}
-    
-    finally:
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
\ No newline at end of file
+        return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import queue
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+class PillEngineUnavailable(Exception):
+    """pill engine process เริ่มไม่ได้ หรือหยุดทำงานระหว่างประมวลผล"""
+
+class PillEngine:
+    """
+    ตัวเชื่อมต่อกับ pill engine (TensorFlow) ที่รันใน process แยก (inference/pill_engine_worker.py)
+
+    TensorFlow ไม่ถูกโหลดใน process ของ FastAPI (ที่มี PyTorch/ultralytics อยู่แล้ว)
+    process ถูกเริ่มเมื่อมี request แรกเท่านั้น และเริ่มใหม่อัตโนมัติถ้าหยุดทำงาน
+    request ที่เข้ามาพร้อมกันถูกรวมเป็น batch (ไม่เกิน PILL_ENGINE_BATCH_SIZE ภาพ)
+    และส่งภาพผ่าน shared memory
+    """
+
+    def __init__(self):
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._process: Optional[subprocess.Popen] = None
+        self._conn = None
+        self._socket_dir: Optional[str] = None
+
+        # Metrics
+        self.starts = 0
+        self.requests = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def submit(self, images: List[bytes], threshold: float = 0.80) -> Future:
+        """ส่งภาพ (ข้อมูลไฟล์) เข้าคิว คืน Future ของรายการผลลัพธ์ตามลำดับภาพ"""
+        future: Future = Future()
+        if not images:
+            future.set_result([])
+            return future
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="pill-engine", daemon=True)
+                self._dispatcher.start()
+        self._jobs.put((list(images), threshold, future))
+        return future
+
+    async def predict(self, images: List[bytes], threshold: float = 0.80) -> List[Dict[str, Any]]:
+        return await asyncio.wrap_future(self.submit(images, threshold))
+
+    def _take_job(self, block: bool):
+        """ดึงงานจากคิว ข้ามงานที่ถูกยกเลิกไปแล้ว (เช่น client ตัดการเชื่อมต่อ)"""
+        while True:
+            job = self._jobs.get() if block else self._jobs.get_nowait()
+            # RUNNING แล้วยกเลิกไม่ได้อีก จึง set_result/set_exception ได้เสมอ
+            if job[2].set_running_or_notify_cancel():
+                return job
+
+    def _dispatch_loop(self):
+        while True:
+            jobs = [self._take_job(block=True)]
+            count = len(jobs[0][0])
+            while count < settings.PILL_ENGINE_BATCH_SIZE:
+                try:
+                    job = self._take_job(block=False)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                count += len(job[0])
+
+            try:
+                self._run_jobs(jobs)
+            except Exception as e:
+                # ไม่ให้ dispatcher หยุด: งานที่ยังไม่ได้ผลลัพธ์ได้ exception แทน
+                logger.error(f"❌ Pill engine dispatch failed: {e}")
+                for job in jobs:
+                    if not job[2].done():
+                        job[2].set_exception(PillEngineUnavailable(str(e)))
+
+    def _run_jobs(self, jobs):
+        images = [image for job in jobs for image in job[0]]
+        thresholds = [job[1] for job in jobs for _ in job[0]]
+        try:
+            self._ensure_process()
+            results = self._send(images, thresholds)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"❌ Pill engine failed: {e}")
+            for job in jobs:
+                job[2].set_exception(PillEngineUnavailable(str(e)))
+            return
+
+        self.batches += 1
+        offset = 0
+        for job_images, _, future in jobs:
+            self.requests += 1
+            future.set_result(results[offset:offset + len(job_images)])
+            offset += len(job_images)
+
+    def _ensure_process(self):
+        if self._process is not None and self._process.poll() is None and self._conn is not None:
+            return
+        self._stop_process()
+
+        logger.info("🚀 Starting pill engine process...")
+        started = time.perf_counter()
+        self._socket_dir = tempfile.mkdtemp(prefix="pill-engine-")
+        address = os.path.join(self._socket_dir, "engine.sock")
+        authkey = secrets.token_bytes(16)
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "inference.pill_engine_worker", address],
+            cwd=str(SERVICE_DIR),
+            env=dict(os.environ, PILL_ENGINE_AUTHKEY=authkey.hex())
+        )
+
+        # worker เปิด socket หลังโหลดโมเดลเสร็จ จึงรอจนเชื่อมต่อได้
+        deadline = time.monotonic() + settings.PILL_ENGINE_STARTUP_TIMEOUT
+        while True:
+            code = self._process.poll()
+            if code is not None:
+                self._stop_process()
+                raise RuntimeError(f"Pill engine exited during startup with code {code}")
+            if time.monotonic() > deadline:
+                self._stop_process()
+                raise TimeoutError(f"Pill engine did not start within {settings.PILL_ENGINE_STARTUP_TIMEOUT}s")
+            try:
+                self._conn = Client(address, family="AF_UNIX", authkey=authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.2)
+
+        self.starts += 1
+        logger.info(f"✅ Pill engine started in {time.perf_counter() - started:.1f}s (pid {self._process.pid})")
+
+    def _send(self, images: List[bytes], thresholds: List[float]) -> List[Dict[str, Any]]:
+        sizes = [len(image) for image in images]
+        shm = shared_memory.SharedMemory(create=True, size=max(1, sum(sizes)))
+        try:
+            offset = 0
+            for image in images:
+                shm.buf[offset:offset + len(image)] = image
+                offset += len(image)
+
+            try:
+                self._conn.send({"shm": shm.name, "sizes": sizes, "thresholds": thresholds})
+                if not self._conn.poll(settings.PILL_ENGINE_REQUEST_TIMEOUT):
+                    raise TimeoutError(f"Pill engine did not respond within {settings.PILL_ENGINE_REQUEST_TIMEOUT}s")
+                reply = self._conn.recv()
+            except (EOFError, OSError, TimeoutError):
+                # process ค้างหรือหยุดทำงาน: เริ่มใหม่ใน batch ถัดไป
+                self._stop_process()
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["results"]
+
+    def _stop_process(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                    self._process.wait()
+            self._process = None
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+    def stop(self):
+        """หยุด process (งานที่ค้างในคิวจะเริ่ม process ใหม่เมื่อถึงคิว)"""
+        self._stop_process()
+
+    def get_status(self) -> Dict[str, Any]:
+        running = self._process is not None and self._process.poll() is None
+        return {
+            "running": running,
+            "pid": self._process.pid if running else None,
+            "starts": self.starts,
+            "requests": self.requests,
+            "batches": self.batches,
+            "failures": self.failures,
+            "queued": self._jobs.qsize(),
+            "last_error": self.last_error
+        }
+
+_pill_engine: Optional[PillEngine] = None
+_pill_engine_lock = threading.Lock()
+
+def get_pill_engine() -> PillEngine:
+    """PillEngine ของ service (สร้างครั้งแรกเมื่อเรียก โดยยังไม่เริ่ม process)"""
+    global _pill_engine
+    if _pill_engine is None:
+        with _pill_engine_lock:
+            if _pill_engine is None:
+                _pill_engine = PillEngine()
+    return _pill_engine
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from core.config import settings
+from ml_managers.ai_model_manager import get_model_manager
+
+logger = logging.getLogger(__name__)
+
+def _json_default(value):
+    """แปลงค่า numpy ที่หลุดมาในผลลัพธ์ให้เป็นชนิดของ Python"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def image_digest(image: np.ndarray) -> str:
+    """hash ของพิกเซลภาพที่ถอดรหัสแล้ว (ไฟล์ต่าง encoding แต่ภาพเดียวกันได้ key เดียวกัน)"""
+    digest = hashlib.sha256(str(image.shape).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+def make_cache_key(namespace: str, image: np.ndarray, **options) -> str:
+    """key จาก hash ของภาพ + version ของโมเดล + option ของ request"""
+    parts = [namespace, get_model_manager().get_model_fingerprint(), image_digest(image)]
+    parts += [f"{name}={options[name]}" for name in sorted(options)]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+class ResultCache:
+    """
+    Cache ผลลัพธ์ของ AI endpoint แบบ content-addressed
+
+    - เก็บผลลัพธ์เป็น JSON ใน LRU ที่จำกัดขนาดรวมเป็น byte
+    - มี disk tier (optional) สำหรับผลลัพธ์ที่ถูกปลดจากหน่วยความจำหรือหลัง restart
+    - request ที่ key เดียวกันเข้ามาพร้อมกันจะรอผลจาก inference ครั้งเดียว (single-flight)
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._disk_writes = 0
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+        # Metrics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda result: True
+    ) -> Any:
+        """
+        คืนผลลัพธ์จาก cache หรือเรียก compute() ครั้งเดียวต่อ key
+
+        ผลลัพธ์ที่คืนเป็นสำเนาเสมอ ผู้เรียกแก้ไขได้โดยไม่กระทบ cache
+        """
+        payload = self._get_memory(key)
+        if payload is not None:
+            self.hits += 1
+            return json.loads(payload)
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return json.loads(await asyncio.shield(in_flight))
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            payload = await self._get_disk(key)
+            if payload is not None:
+                self.disk_hits += 1
+                self._put_memory(key, payload)
+            else:
+                self.misses += 1
+                result = await compute()
+                payload = json.dumps(result, default=_json_default).encode()
+                if cacheable(result):
+                    self._put_memory(key, payload)
+                    await self._put_disk(key, payload)
+            future.set_result(payload)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # ป้องกัน warning "exception was never retrieved" เมื่อไม่มีใครรอ
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        return json.loads(payload)
+
+    def _get_memory(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def _put_memory(self, key: str, payload: bytes) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = payload
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    async def _get_disk(self, key: str) -> Optional[bytes]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"⚠️ Cannot read cached result {path}: {e}")
+            return None
+
+    async def _put_disk(self, key: str, payload: bytes) -> None:
+        if self.disk_dir is None:
+            return
+        try:
+            await asyncio.to_thread(self._write_disk, self._disk_path(key), payload)
+        except OSError as e:
+            logger.warning(f"⚠️ Cannot write cached result for {key}: {e}")
+
+    def _write_disk(self, path: Path, payload: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(payload)
+        os.replace(tmp_path, path)
+        self._disk_writes += 1
+        # ตรวจขนาด disk tier เป็นระยะ ไม่ต้อง scan ทุกครั้งที่เขียน
+        if self.disk_max_bytes and self._disk_writes % 50 == 1:
+            self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        """ลบไฟล์ที่เก่าที่สุดจน disk tier อยู่ในงบประมาณ"""
+        files = [(f.stat().st_mtime, f.stat().st_size, f) for f in self.disk_dir.glob("*/*.json")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": str(self.disk_dir) if self.disk_dir else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "in_flight": len(self._in_flight)
+        }
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(
+                    settings.RESULT_CACHE_MAX_MB * 1024 * 1024,
+                    disk_dir=settings.RESULT_CACHE_DIR or None,
+                    disk_max_bytes=settings.RESULT_CACHE_DISK_MAX_MB * 1024 * 1024
+                )
+    return _cache
+
+def is_cacheable(result: Any) -> bool:
+    """ไม่ cache ผลลัพธ์ที่เป็น error (เช่นโมเดลยังโหลดไม่เสร็จ)"""
+    return isinstance(result, dict) and "error" not in result
@@ -0,0 +1,113 @@
+import logging
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from core.config import settings
+from ml_managers.ai_model_manager import get_model_manager
+from utils.image_utils import crop_masks_on_white, decode_image_info
+
+logger = logging.getLogger(__name__)
+
+GUN_CLASSES = ['BigGun', 'Pistol', 'Revolver']
+
+def detect_frame(image: np.ndarray):
+    """
+    รันโมเดล segmentation สำหรับงาน realtime ที่ imgsz ลดลง (STREAM_IMGSZ)
+
+    Returns:
+        ultralytics Results ของภาพ หรือ None ถ้าโมเดลยังไม่พร้อม
+    """
+    results = get_model_manager().segment(image, imgsz=settings.STREAM_IMGSZ, conf=settings.STREAM_CONF, verbose=False)
+    return results[0] if results is not None else None
+
+def _create_tracker():
+    """สร้าง ByteTrack ของ ultralytics สำหรับ stream หนึ่ง (แต่ละ stream มี tracker ของตัวเอง)"""
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml(settings.STREAM_TRACKER)))
+    return BYTETracker(args=cfg, frame_rate=settings.STREAM_FRAME_RATE)
+
+class StreamSession:
+    """
+    สถานะของ WebSocket stream หนึ่งการเชื่อมต่อ
+
+    ตรวจจับทุก frame ที่ได้ประมวลผล, ติดตามวัตถุข้าม frame ด้วย ByteTrack
+    และจำแนกยี่ห้อ/รุ่นปืนครั้งเดียวต่อ track แล้วส่งกลับเฉพาะส่วนที่เปลี่ยน (delta)
+    """
+
+    def __init__(self):
+        self.tracker = _create_tracker()
+        self.tracks: Dict[int, Dict[str, Any]] = {}
+        self._last_seen: Dict[int, int] = {}
+        self.frames = 0
+        self.classified = 0
+
+    def process_frame(self, data: bytes) -> Dict[str, Any]:
+        """ถอดรหัส frame (JPEG), ตรวจจับ, อัปเดต track และคืน delta เทียบกับ frame ก่อนหน้า"""
+        from services.inference_service import classify_gun_objects
+
+        started = time.perf_counter()
+        decoded = decode_image_info(data, settings.DECODE_MAX_SIDE)
+        image = decoded.image
+        results = detect_frame(image)
+        if results is None:
+            raise RuntimeError("Detection model not loaded")
+        self.frames += 1
+
+        tracked = self.tracker.update(results.boxes.cpu().numpy(), image) if len(results.boxes) else np.empty((0, 8))
+
+        names = get_model_manager().get_segment_classes() or results.names
+        added: List[Dict[str, Any]] = []
+        updated: List[Dict[str, Any]] = []
+        new_guns = []
+
+        for x1, y1, x2, y2, track_id, score, cls_id, det_index in tracked:
+            track_id = int(track_id)
+            self._last_seen[track_id] = self.frames
+            bbox = [int(x1), int(y1), int(x2), int(y2)]
+
+            track = self.tracks.get(track_id)
+            if track is None:
+                track = {
+                    "id": track_id,
+                    "class": names.get(int(cls_id), str(int(cls_id))),
+                    "confidence": round(float(score), 2),
+                    "bbox": bbox
+                }
+                self.tracks[track_id] = track
+                added.append(track)
+                if track["class"] in GUN_CLASSES and results.masks is not None:
+                    new_guns.append((track, int(det_index)))
+            else:
+                track["bbox"] = bbox
+                track["confidence"] = round(float(score), 2)
+                updated.append({"id": track_id, "bbox": bbox, "confidence": track["confidence"]})
+
+        # จำแนกยี่ห้อ/รุ่นเฉพาะปืนที่เพิ่งเริ่ม track (ไม่จำแนกซ้ำทุก frame)
+        if new_guns:
+            masks = results.masks.data[[index for _, index in new_guns]].cpu().numpy()
+            # ตัดปืนจากภาพความละเอียดเต็มสำหรับ classifier (ถ้า frame ถูกย่อ)
+            crops = crop_masks_on_white(decoded, masks)
+            classify_gun_objects([(track, crop) for (track, _), crop in zip(new_guns, crops)])
+            self.classified += len(new_guns)
+
+        # ByteTrack เก็บ track ที่หายไปชั่วคราวไว้ได้ จึงลบเมื่อไม่เห็นเกิน STREAM_TRACK_TTL frame
+        removed = [
+            track_id for track_id, last_seen in self._last_seen.items()
+            if self.frames - last_seen > settings.STREAM_TRACK_TTL
+        ]
+        for track_id in removed:
+            del self.tracks[track_id]
+            del self._last_seen[track_id]
+
+        return {
+            "frame": self.frames,
+            "added": [dict(track) for track in added],
+            "updated": updated,
+            "removed": removed,
+            "process_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
@@ -5,88 +5,104 @@ import cv2
 import os
 import uuid
 import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
 from torchvision import transforms
-from ultralytics import YOLO
 from pathlib import Path
 from typing import Union, List, Tuple, Optional, Dict, Any
+from core.config import settings
+from ml_managers.ai_model_manager import get_model_manager
+from ml_managers.feature_hooks import FeatureHooks
+from utils.image_utils import DecodedImage, crop_masks_on_white, decode_image, decode_image_info, load_pil_image, working_image
+
+# v1: flatten feature map ทั้งหมดแล้วย่อเป็น 16000 มิติ (รูปแบบที่เก็บในฐานข้อมูลปัจจุบัน)
+# v2: GeM pooling ของ backbone สอง stage สุดท้าย ต่อกันแล้ว L2-normalize (หลักร้อยถึงพันมิติ)
+EMBEDDING_VERSIONS = ("v1", "v2")
+
+def gem_pool(features: torch.Tensor, p: float = 3.0, eps: float = 1e-6) -> torch.Tensor:
+    """Generalized-mean pooling ของ feature map (N, C, H, W) -> (N, C)"""
+    return features.clamp(min=eps).pow(p).mean(dim=(-2, -1)).pow(1.0 / p)
+
+def to_bgr(image: Union[str, Path, Image.Image, np.ndarray, bytes]) -> np.ndarray:
+    """แปลงรูปภาพรูปแบบต่างๆ เป็น numpy array (BGR)"""
+    if isinstance(image, str) or isinstance(image, Path):
+        try:
+            image = Path(image).read_bytes()
+        except OSError:
+            raise ValueError(f"Cannot read image: {image}")
+    if isinstance(image, Image.Image):
+        return cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, bytes):
+        return decode_image(image, settings.DECODE_MAX_SIDE)
+    raise TypeError("Image must be a file path, PIL Image, numpy array, or bytes")
+
+def load_source(image: Union[str, Path, Image.Image, np.ndarray, bytes, DecodedImage]) -> Union[np.ndarray, DecodedImage]:
+    """
+    แปลงรูปภาพเป็นภาพสำหรับ segment: ไฟล์/bytes ได้ DecodedImage (ตัดยาเสพติดจากภาพความละเอียดเต็มได้)
+    """
+    if isinstance(image, DecodedImage):
+        return image
+    if isinstance(image, str) or isinstance(image, Path):
+        try:
+            image = Path(image).read_bytes()
+        except OSError:
+            raise ValueError(f"Cannot read image: {image}")
+    if isinstance(image, bytes):
+        return decode_image_info(image, settings.DECODE_MAX_SIDE)
+    return to_bgr(image)
 
 class VectorService:
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self, model_path: Optional[str] = None, embedding_version: Optional[str] = None):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
-        # Standard image transformation - same as in gun_classification.py
+        self.embedding_version = embedding_version or settings.EMBEDDING_VERSION
+        if self.embedding_version not in EMBEDDING_VERSIONS:
+            raise ValueError(f"Unknown embedding version '{self.embedding_version}', expected one of {EMBEDDING_VERSIONS}")
+        
+        # v1 ใช้ transformation เดียวกับ gun_classification.py, v2 ใช้ขนาดที่ classifier ถูก train มา
+        self._hooks: Optional[FeatureHooks] = None
+        self._hooks_lock = threading.Lock()
+        
+        imgsz = 640 if self.embedding_version == "v1" else settings.EMBEDDING_IMGSZ
         self.transform = transforms.Compose([
-            transforms.Resize((640, 640)),
+            transforms.Resize((imgsz, imgsz)),
             transforms.ToTensor(),
         ])
         
         # สร้าง paths ของโมเดลต่างๆ
         backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         
-        # 📁 โมเดลสำหรับ Segmentation
-        self.segment_model_path = os.path.join(backend_dir, "app", "model", "Model V2", "5M_Segment", "best_v8.pt")
-        self.segment_model = None
-        
-        # 📁 โมเดลสำหรับ Feature Extraction
-        self.narcotic_model_path = os.path.join(backend_dir, "app", "model", "Model V2", "Narcotics", "best.pt")
-        if model_path:
-            self.narcotic_model_path = model_path
-            
-        self.narcotic_model = None
+        # 📁 โมเดลสำหรับ Feature Extraction (ถ้าไม่ระบุใช้โมเดล narcotic ของ ModelManager)
+        self.narcotic_model_path = model_path
         
         # 📁 โฟลเดอร์สำหรับบันทึกภาพที่ segment แล้วสำหรับการ debug
         self.debug_dir = os.path.join(backend_dir, "debug_images")
         if not os.path.exists(self.debug_dir):
             os.makedirs(self.debug_dir)
-            
-        # 📊 ตัวแปรสำหรับ class mapping
-        self.segment_classes = {0: 'BigGun', 1: 'Bullet', 2: 'Drug', 3: 'Magazine', 4: 'PackageDrug', 5: 'Pistol', 6: 'Revolver'}
-        
-        # ⚙️ โหลดโมเดล
-        self.load_segmentation_model()
-        self.load_narcotic_model()
     
-    def load_segmentation_model(self) -> None:
-        """โหลดโมเดลสำหรับ segmentation"""
-        try:
-            if os.path.exists(self.segment_model_path):
-                self.segment_model = YOLO(self.segment_model_path)
-            else:
-                pass
-        except Exception as e:
-            pass
+    # ⚙️ โมเดลทั้งหมดมาจาก ModelManager เพื่อไม่ให้โหลด weights ซ้ำ
+    @property
+    def segment_model(self):
+        return get_model_manager().get_segmentation_model()
     
-    def load_narcotic_model(self) -> None:
-        """โหลดโมเดลสำหรับสร้าง feature vector"""
-        try:
-            if os.path.exists(self.narcotic_model_path):
-                self.narcotic_model = YOLO(self.narcotic_model_path)
-            else:
-                pass
-        except Exception as e:
-            pass
+    @property
+    def narcotic_model(self):
+        model_manager = get_model_manager()
+        if self.narcotic_model_path:
+            return model_manager.get_or_load_model(f"narcotic:{self.narcotic_model_path}", self.narcotic_model_path)
+        return model_manager.get_narcotic_model()
     
-    def crop_mask_on_white(self, img: np.ndarray, mask: np.ndarray) -> np.ndarray:
-        """
-        ตัดวัตถุตาม mask และวางบนพื้นหลังสีขาว เหมือนในไฟล์ gun_classification.py
-        """
-        # Resize mask ให้ตรงกับ shape ของ image
-        if mask.shape != img.shape[:2]:
-            mask = cv2.resize(mask.astype(np.uint8), (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
-
-        white_bg = np.ones_like(img) * 255
-        mask = mask.astype(bool)
-
-        # Apply mask to each channel
-        for c in range(3):
-            white_bg[:, :, c][mask] = img[:, :, c][mask]
-        return white_bg
+    @property
+    def segment_classes(self) -> Dict[int, str]:
+        return get_model_manager().get_segment_classes()
     
     def process_image_for_vector(self, 
                                image: Union[str, Path, Image.Image, np.ndarray, bytes], 
-                               save_debug_image: bool = True) -> Tuple[np.ndarray, Dict]:
+                               save_debug_image: bool = False) -> Tuple[np.ndarray, Dict]:
         """
         ประมวลผลรูปภาพโดย segment วัตถุที่เป็นยาเสพติดออกมาก่อน
         แล้วจึงส่งผ่านไปยัง feature extraction
@@ -102,23 +118,16 @@ class VectorService:
         if self.segment_model is None:
             raise ValueError("Segmentation model not loaded. Please load the model first.")
             
-        # แปลงรูปภาพให้เป็นรูปแบบที่ถูกต้อง
-        if isinstance(image, str) or isinstance(image, Path):
-            cv_image = cv2.imread(str(image))
-        elif isinstance(image, Image.Image):
-            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        elif isinstance(image, np.ndarray):
-            cv_image = image
-        elif isinstance(image, bytes):
-            import io
-            pil_image = Image.open(io.BytesIO(image))
-            cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-        else:
-            raise TypeError("Image must be a file path, PIL Image, numpy array, or bytes")
+        source = load_source(image)
         
         # ใช้โมเดล segment เพื่อแยกวัตถุ
-        results = self.segment_model(cv_image)[0]
-        
+        results = get_model_manager().segment(working_image(source))[0]
+        return self._crop_best_drug(source, results, save_debug_image)
+    
+    def _crop_best_drug(self, image: Union[np.ndarray, DecodedImage], results,
+                        save_debug_image: bool = False) -> Tuple[np.ndarray, Dict]:
+        """ตัดยาเสพติดที่มั่นใจที่สุดจากผล segmentation (ใช้ภาพเดิมถ้าไม่พบ)"""
+        cv_image = working_image(image)
         # ข้อมูลผลลัพธ์
         result_info = {
             "found_drug": False,
@@ -151,8 +160,9 @@ class VectorService:
         idx, cls_name, confidence = best_match
         
         # ตัดภาพตาม mask
+        # ตัดจากภาพความละเอียดเต็มถ้าเป็น DecodedImage
         mask = results.masks.data[idx].cpu().numpy()
-        cropped = self.crop_mask_on_white(cv_image, mask)
+        cropped = crop_masks_on_white(image, mask[None])[0]
         
         # บันทึกภาพสำหรับการ debug
         if save_debug_image:
@@ -173,7 +183,7 @@ class VectorService:
                        image: Union[str, Path, Image.Image, np.ndarray, bytes], 
                        normalize: bool = True,
                        segment_first: bool = True,
-                       save_debug_image: bool = True) -> torch.Tensor:
+                       save_debug_image: bool = False) -> torch.Tensor:
         """
         แปลงรูปภาพเป็น vector โดยอาจจะผ่านการ segment ก่อน
         
@@ -203,23 +213,20 @@ class VectorService:
                 processed_image = image
         
         # แปลงรูปภาพเป็นรูปแบบที่เหมาะกับ feature extraction
+        processed_image = working_image(processed_image)
         if isinstance(processed_image, np.ndarray):
             processed_image = Image.fromarray(cv2.cvtColor(processed_image, cv2.COLOR_BGR2RGB))
         elif isinstance(processed_image, str) or isinstance(processed_image, Path):
-            processed_image = Image.open(processed_image).convert("RGB")
+            processed_image = load_pil_image(processed_image, self.transform.transforms[0].size)
         elif isinstance(processed_image, bytes):
-            import io
-            processed_image = Image.open(io.BytesIO(processed_image)).convert("RGB")
+            processed_image = Image.fromarray(cv2.cvtColor(decode_image(processed_image, settings.DECODE_MAX_SIDE), cv2.COLOR_BGR2RGB))
         
         # แปลงภาพเป็น tensor
         tensor = self.transform(processed_image).unsqueeze(0)
         tensor = tensor.to(self.device)
         
         # สกัด feature vector
-        with torch.no_grad():
-            backbone = self.narcotic_model.model.model[:-1]
-            features = backbone(tensor)
-            vector = features.view(features.size(0), -1)[0]
+        vector = self.extract_features(tensor)[0]
         
         # Normalize vector if requested
         if normalize:
@@ -227,6 +234,187 @@ class VectorService:
             
         return vector
     
+    def extract_features(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        สกัด feature จากโมเดล narcotic ตาม embedding_version
+        
+        Args:
+            batch: tensor ของภาพ shape (N, 3, H, W)
+            
+        Returns:
+            tensor shape (N, D) (ยังไม่ normalize)
+        """
+        return self.forward_with_features(batch)[1]
+    
+    def forward_with_features(self, batch: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        รันโมเดล narcotic ครั้งเดียวตามเส้นทางของ graph และเก็บ feature ของ layer ที่เลือกด้วย forward hook
+        
+        Returns:
+            (probs, features): ความน่าจะเป็นของแต่ละคลาส shape (N, C) และ feature shape (N, D)
+        """
+        hooks = self._feature_hooks()
+        
+        with torch.no_grad(), hooks.capture() as captured:
+            output = hooks.torch_model(batch)
+        # Classify head คืน (probs, logits) ใน ultralytics บางเวอร์ชัน
+        probs = output[0] if isinstance(output, (tuple, list)) else output
+        
+        if self.embedding_version == "v1":
+            features = captured[hooks.layer_ids[0]]
+            return probs, features.view(features.size(0), -1)
+        
+        pooled = [
+            F.normalize(gem_pool(captured[i], settings.EMBEDDING_GEM_P), p=2, dim=1)
+            for i in hooks.layer_ids
+        ]
+        return probs, torch.cat(pooled, dim=1)
+    
+    def embedding_layer_ids(self, layers) -> List[int]:
+        """
+        index ของ layer ที่ใช้สร้าง embedding (กำหนดเองได้ด้วย EMBEDDING_LAYERS เช่น "6,8")
+        
+        - v1: layer สุดท้ายก่อน head (เท่ากับ output ของ model[:-1] เดิม)
+        - v2: สอง stage สุดท้ายก่อน head ที่ไม่ใช่ Conv (เช่น C2f ที่ stride 16 และ 32)
+        """
+        if settings.EMBEDDING_LAYERS:
+            return [int(i) for i in settings.EMBEDDING_LAYERS.split(",")]
+        backbone = list(layers)[:-1]
+        if self.embedding_version == "v1":
+            return [len(backbone) - 1]
+        return [i for i, layer in enumerate(backbone) if type(layer).__name__ != "Conv"][-2:]
+    
+    def _feature_hooks(self) -> FeatureHooks:
+        """hook ของโมเดล narcotic ปัจจุบัน (ลงทะเบียนใหม่เมื่อโมเดลเปลี่ยน)"""
+        torch_model = self.narcotic_model.model
+        hooks = self._hooks
+        if hooks is None or hooks.torch_model is not torch_model:
+            with self._hooks_lock:
+                hooks = self._hooks
+                if hooks is None or hooks.torch_model is not torch_model:
+                    if hooks is not None:
+                        hooks.remove()
+                    hooks = FeatureHooks(torch_model, self.embedding_layer_ids(torch_model.model))
+                    self._hooks = hooks
+        return hooks
+    
+    @property
+    def forward_passes(self) -> int:
+        """จำนวน forward pass ของโมเดล narcotic ที่ใช้สร้าง embedding"""
+        return self._hooks.forward_passes if self._hooks is not None else 0
+    
+    def predict_with_embedding(self, images: List[np.ndarray], normalize: bool = True) -> List[Dict]:
+        """
+        จำแนกประเภทและสร้าง embedding ของภาพ BGR หลายภาพจาก forward pass เดียว
+        
+        Returns:
+            list ของ dict: class, confidence และ vector (torch tensor) ของแต่ละภาพ
+        """
+        if self.narcotic_model is None:
+            raise ValueError("Narcotic model not loaded. Please load the model first.")
+        
+        batch = torch.stack([self._to_tensor(image) for image in images]).to(self.device)
+        probs, features = self.forward_with_features(batch)
+        if normalize:
+            features = F.normalize(features, p=2, dim=1)
+        
+        top1 = self._top1_from_head(probs, len(images))
+        return [
+            {"class": class_name, "confidence": confidence, "vector": vector}
+            for (class_name, confidence), vector in zip(top1, features.cpu())
+        ]
+    
+    def _top1_from_head(self, probs, count: int) -> List[Tuple[Optional[str], Optional[float]]]:
+        """top-1 จาก output ของ head ((None, None) ถ้า output ไม่ใช่ความน่าจะเป็น shape (N, C))"""
+        if not isinstance(probs, torch.Tensor) or probs.dim() != 2 or probs.size(0) != count:
+            return [(None, None)] * count
+        names = self.narcotic_model.names
+        confidences, class_ids = probs.max(dim=1)
+        return [
+            (names.get(int(class_id), str(int(class_id))), round(float(confidence), 2))
+            for class_id, confidence in zip(class_ids.cpu(), confidences.cpu())
+        ]
+    
+    def classify(self, image: np.ndarray) -> Dict:
+        """จำแนกประเภทยาเสพติดด้วย model.predict (preprocessing ของ classifier เอง ไม่ใช่ของ embedding)"""
+        result = get_model_manager().predict(self.narcotic_model, image, verbose=False)[0]
+        return {
+            "class": result.names[int(result.probs.top1)],
+            "confidence": round(float(result.probs.top1conf), 2)
+        }
+    
+    def crops_to_vectors(self, crops: List[np.ndarray], normalize: bool = True) -> torch.Tensor:
+        """
+        แปลงภาพ BGR หลายภาพเป็น vector ด้วย backbone ครั้งเดียวทั้ง batch
+        
+        Returns:
+            tensor shape (N, D)
+        """
+        if self.narcotic_model is None:
+            raise ValueError("Narcotic model not loaded. Please load the model first.")
+        
+        tensors = [self._to_tensor(crop) for crop in crops]
+        batch = torch.stack(tensors).to(self.device)
+        vectors = self.extract_features(batch)
+        
+        if normalize:
+            vectors = F.normalize(vectors, p=2, dim=1)
+        return vectors
+    
+    def detect_and_embed(self, image: Union[np.ndarray, DecodedImage], all_objects: bool = False) -> Dict:
+        """
+        segment ภาพครั้งเดียว แล้วสร้าง embedding ของวัตถุยาเสพติดจากผล segmentation เดียวกัน
+        
+        Args:
+            image: ภาพ BGR ที่ถอดรหัสแล้ว หรือ DecodedImage (ตัดยาเสพติดจากภาพความละเอียดเต็ม)
+            all_objects: สร้าง embedding ให้ยาเสพติดทุกชิ้น (ปกติเฉพาะชิ้นที่มั่นใจที่สุด)
+            
+        Returns:
+            dict: detections ทั้งหมด และ embeddings ของวัตถุยาเสพติด (เรียงตาม confidence)
+        """
+        if self.segment_model is None:
+            raise ValueError("Segmentation model not loaded. Please load the model first.")
+        
+        results = get_model_manager().segment(working_image(image), verbose=False)[0]
+        
+        detections = []
+        drug_indices = []
+        for i, box in enumerate(results.boxes):
+            cls_name = self.segment_classes.get(int(box.cls[0].item()), "Unknown")
+            confidence = float(box.conf[0].item())
+            detections.append({
+                "object_index": i,
+                "class": cls_name,
+                "confidence": round(confidence, 2),
+                "bbox": [round(float(v), 1) for v in box.xyxy[0].tolist()]
+            })
+            if cls_name in ['Drug', 'PackageDrug']:
+                drug_indices.append(i)
+        
+        drug_indices.sort(key=lambda i: detections[i]["confidence"], reverse=True)
+        if not all_objects:
+            drug_indices = drug_indices[:1]
+        
+        embeddings = []
+        if drug_indices:
+            masks = results.masks.data[drug_indices].cpu().numpy()
+            crops = crop_masks_on_white(image, masks)
+            vectors = self.crops_to_vectors(crops)
+            for i, vector in zip(drug_indices, vectors):
+                embeddings.append({
+                    "object_index": i,
+                    "class": detections[i]["class"],
+                    "confidence": detections[i]["confidence"],
+                    **encode_vector(self.vector_to_numpy(vector))
+                })
+        
+        return {
+            "embedding_version": self.embedding_version,
+            "found_drug": bool(embeddings),
+            "detections": detections,
+            "embeddings": embeddings
+        }
+    
     def torch_vector_resize(self, vector: torch.Tensor, target_dim: int = 16000) -> torch.Tensor:
         """
         ลดขนาด vector ด้วย PyTorch operations โดยตรง เร็วกว่าการใช้ NumPy
@@ -259,7 +447,11 @@ class VectorService:
     def vector_to_numpy(self, vector: torch.Tensor, target_dim: int = 16000) -> np.ndarray:
         """
         แปลง PyTorch tensor เป็น numpy array โดยทำการลดขนาดด้วย PyTorch ก่อน
+        (embedding v2 มีขนาดคงที่อยู่แล้ว จึงไม่ถูกย่อ)
         """
+        if self.embedding_version != "v1":
+            return vector.cpu().numpy().astype(np.float32, copy=False)
+        
         # ตรวจสอบว่า vector มีข้อมูลจริงหรือไม่
         if vector.numel() == 0 or (vector.numel() == 1 and vector.item() == 0):
             np.random.seed(42)  # ใช้ seed คงที่
@@ -310,66 +502,142 @@ class VectorService:
         return results[:top_k]
     
     def process_image_batch(self, 
-                          images: List[Union[str, Path, Image.Image, np.ndarray]],
-                          normalize: bool = True) -> List[torch.Tensor]:
+                          images: List[Union[str, Path, Image.Image, np.ndarray, bytes]],
+                          normalize: bool = True,
+                          segment_first: bool = True,
+                          batch_size: Optional[int] = None) -> Tuple[List[Optional[torch.Tensor]], List[Optional[str]]]:
         """
-        Process a batch of images to vectors
+        แปลงรูปภาพหลายภาพเป็น vector แบบ batch
+        
+        ถอดรหัส/เตรียมภาพแบบขนานใน thread pool, segment ทีละ batch (ถ้า segment_first)
+        แล้วรวม tensor เป็น batch เดียวเพื่อรัน backbone ครั้งเดียวต่อ batch
         
         Args:
-            images: List of images
-            normalize: Whether to normalize vectors
+            images: รายการรูปภาพ
+            normalize: ต้องการ normalize vector หรือไม่
+            segment_first: ตัดส่วนที่เป็นยาเสพติดก่อน (เหมือน image_to_vector)
+            batch_size: จำนวนภาพต่อการรันโมเดลหนึ่งครั้ง (default: EMBEDDING_BATCH_SIZE)
             
         Returns:
-            List of feature vectors (PyTorch tensors)
+            (vectors, errors): รายการ vector (None ถ้าภาพนั้นล้มเหลว) และข้อความ error ของแต่ละภาพ
         """
-        vectors = []
-        for img in images:
+        if self.narcotic_model is None:
+            raise ValueError("Narcotic model not loaded. Please load the model first.")
+        
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        vectors: List[Optional[torch.Tensor]] = [None] * len(images)
+        errors: List[Optional[str]] = [None] * len(images)
+        
+        # 1. ถอดรหัสภาพแบบขนาน (cv2.imdecode ปล่อย GIL)
+        decoded = list(_preprocess_pool.map(_try, [load_source] * len(images), images))
+        for i, (_, error) in enumerate(decoded):
+            errors[i] = error
+        valid = [i for i, (_, error) in enumerate(decoded) if error is None]
+        
+        for start in range(0, len(valid), batch_size):
+            indices = valid[start:start + batch_size]
+            sources = [decoded[i][0] for i in indices]
+            cv_images = [working_image(source) for source in sources]
+            
+            # 2. segment ทั้ง batch ในการเรียกโมเดลครั้งเดียว แล้วตัดยาเสพติดที่มั่นใจที่สุดของแต่ละภาพ
+            if segment_first and self.segment_model is not None:
+                try:
+                    results = get_model_manager().segment(cv_images, verbose=False)
+                    cv_images = [self._crop_best_drug(source, res)[0] for source, res in zip(sources, results)]
+                except Exception as e:
+                    # ใช้รูปภาพเดิมถ้ามีปัญหา (เหมือน image_to_vector)
+                    print(f"⚠️ Batch segmentation failed, embedding full images: {e}")
+            
+            # 3. transform แบบขนานแล้วรัน backbone ครั้งเดียวทั้ง batch
+            prepared = list(_preprocess_pool.map(_try, [self._to_tensor] * len(cv_images), cv_images))
+            ready = [(i, tensor) for i, (tensor, error) in zip(indices, prepared) if error is None]
+            for i, (_, error) in zip(indices, prepared):
+                if error is not None:
+                    errors[i] = error
+            if not ready:
+                continue
+            
             try:
-                vector = self.image_to_vector(img, normalize)
-                vectors.append(vector)
+                batch = torch.stack([tensor for _, tensor in ready]).to(self.device)
+                features = self.extract_features(batch)
+                if normalize:
+                    features = F.normalize(features, p=2, dim=1)
+                for (i, _), vector in zip(ready, features.cpu()):
+                    vectors[i] = vector
             except Exception as e:
-                vectors.append(None)
-        return vectors
+                for i, _ in ready:
+                    errors[i] = str(e)
+        
+        return vectors, errors
+    
+    def _to_tensor(self, cv_image: np.ndarray) -> torch.Tensor:
+        return self.transform(Image.fromarray(cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)))
+
+# thread pool สำหรับถอดรหัส/เตรียมภาพของ process_image_batch
+_preprocess_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="vector-preprocess")
+
+def _try(fn, item):
+    """เรียก fn(item) และคืน (ผลลัพธ์, error) แทนการ raise"""
+    try:
+        return fn(item), None
+    except Exception as e:
+        return None, str(e)
+
+def encode_vector(vector_np: np.ndarray) -> Dict:
+    """แปลง vector เป็น base64 (float32) สำหรับส่งผ่าน JSON"""
+    return {
+        "vector_base64": base64.b64encode(vector_np.astype(np.float32, copy=False).tobytes()).decode('utf-8'),
+        "vector_dimension": len(vector_np)
+    }
 
 _vector_service = VectorService()
 
-def create_vector_embedding(image_data: Union[str, Path, Image.Image, np.ndarray, bytes], segment_first: bool = True) -> Dict:
+def get_vector_service() -> VectorService:
+    """VectorService ของ service (ทุก route ใช้ instance เดียวกัน เพื่อให้ FeatureHooks ถูกลงทะเบียนบนโมเดลครั้งเดียว)"""
+    return _vector_service
+
+def create_vector_embedding(image_data: Union[str, Path, Image.Image, np.ndarray, bytes, DecodedImage], segment_first: bool = True) -> Dict:
     """
     สร้าง vector embedding จากรูปภาพ พร้อมทั้งข้อมูลเพิ่มเติม
     """
-    global _vector_service
-    
-    if _vector_service.segment_model is None:
-        _vector_service.load_segmentation_model()
-        
-    if _vector_service.narcotic_model is None:
-        _vector_service.load_narcotic_model()
-    
     result_info = {}
-    try:
-        if segment_first:
-            processed_image, result_info = _vector_service.process_image_for_vector(image_data)
-            vector = _vector_service.image_to_vector(processed_image, normalize=True, segment_first=False)
-        else:
-            vector = _vector_service.image_to_vector(image_data, normalize=True, segment_first=False)
-    except Exception as e:
-        raise
+    if segment_first:
+        processed_image, result_info = _vector_service.process_image_for_vector(image_data)
+        vector = _vector_service.image_to_vector(processed_image, normalize=True, segment_first=False)
+    else:
+        vector = _vector_service.image_to_vector(image_data, normalize=True, segment_first=False)
     
     vector_np = _vector_service.vector_to_numpy(vector)
     
-    # Convert vector to base64 instead of JSON list
-    vector_bytes = vector_np.tobytes()
-    vector_base64 = base64.b64encode(vector_bytes).decode('utf-8')
-
-    result = {
-        # Remove JSON list and use base64 instead
-        "vector_base64": vector_base64,
-        "vector_dimension": len(vector_np),
-        "segmentation_result": result_info
-    }
+    # ส่ง vector เป็น base64 แทน JSON list
+    result = encode_vector(vector_np)
+    result["embedding_version"] = _vector_service.embedding_version
+    result["segmentation_result"] = result_info
     
     return result
 
+def classify_and_embed(image_data: Union[np.ndarray, bytes]) -> Dict:
+    """
+    สร้าง vector ของยาเสพติดจาก forward hook แล้วจึงจำแนกประเภทแยกต่างหาก
+
+    ถ้าการจำแนกล้มเหลว vector ยังถูกคืนตามเดิม โดย class/confidence เป็น None
+    """
+    image = decode_image(image_data, settings.DECODE_MAX_SIDE) if isinstance(image_data, bytes) else image_data
+    prediction = _vector_service.predict_with_embedding([image])[0]
+    result = encode_vector(_vector_service.vector_to_numpy(prediction["vector"]))
+    result["embedding_version"] = _vector_service.embedding_version
+    try:
+        result.update(_vector_service.classify(image))
+    except Exception as e:
+        print(f"Error classifying drug: {str(e)}")
+        result.update({"class": None, "confidence": None})
+    return result
+
+def detect_and_embed(image_data: Union[np.ndarray, bytes, DecodedImage], all_objects: bool = False) -> Dict:
+    """segment ครั้งเดียวและสร้าง embedding ของยาเสพติดที่พบ (ใช้โดย /api/detect-embed)"""
+    image = decode_image_info(image_data, settings.DECODE_MAX_SIDE) if isinstance(image_data, bytes) else image_data
+    return _vector_service.detect_and_embed(image, all_objects=all_objects)
+
 def preview_vector(vector: Union[torch.Tensor, np.ndarray]) -> None:
     """
     แสดงรายละเอียดของ vector ในรูปแบบเดียวกับในไฟล์ gun_classification.py
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# ให้ import โมดูลของ service (core, services, ml_managers, ...) ได้เมื่อรัน pytest จากที่ใดก็ได้
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
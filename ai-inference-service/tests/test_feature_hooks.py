@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+from torch import nn
+
+from ml_managers.feature_hooks import FeatureHooks
+from services.vector_service import VectorService
+
+class TinyClassifier(nn.Module):
+    """โมเดลจำลองรูปแบบเดียวกับ ultralytics: layer อยู่ใน .model และ layer สุดท้ายเป็น head"""
+
+    def __init__(self):
+        super().__init__()
+        self.model = nn.Sequential(
+            nn.Conv2d(3, 4, 3, padding=1),
+            nn.ReLU(),
+            nn.Conv2d(4, 8, 3, stride=2, padding=1),
+            nn.Sequential(nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(8, 3), nn.Softmax(dim=1)),
+        )
+
+    def forward(self, x):
+        return self.model(x)
+
+def count_forward_calls(module):
+    calls = []
+    module.register_forward_hook(lambda *_: calls.append(1))
+    return calls
+
+@pytest.fixture
+def tiny_service(monkeypatch):
+    torch.manual_seed(0)
+    torch_model = TinyClassifier().eval()
+    narcotic_model = SimpleNamespace(model=torch_model, names={0: "a", 1: "b", 2: "c"})
+    monkeypatch.setattr(VectorService, "narcotic_model", property(lambda self: narcotic_model))
+    return torch_model
+
+def test_capture_records_selected_layers_only_inside_block():
+    torch_model = TinyClassifier().eval()
+    hooks = FeatureHooks(torch_model, [2])
+    batch = torch.rand(2, 3, 8, 8)
+
+    with torch.no_grad():
+        torch_model(batch)
+    assert hooks.forward_passes == 0
+
+    with torch.no_grad(), hooks.capture() as captured:
+        torch_model(batch)
+    assert set(captured) == {2}
+    assert captured[2].shape == (2, 8, 4, 4)
+    assert hooks.forward_passes == 1
+
+    hooks.remove()
+    with hooks.capture() as captured:
+        torch_model(batch)
+    assert captured == {}
+
+def test_forward_with_features_v1_uses_one_forward_pass(tiny_service):
+    service = VectorService(embedding_version="v1")
+    calls = count_forward_calls(tiny_service)
+    batch = torch.rand(4, 3, 8, 8)
+
+    probs, features = service.forward_with_features(batch)
+
+    assert len(calls) == 1
+    assert service.forward_passes == 1
+    assert probs.shape == (4, 3)
+    assert torch.allclose(probs.sum(dim=1), torch.ones(4))
+    # v1 เท่ากับ output ของ backbone (model[:-1]) แบบเดิมที่ flatten แล้ว
+    with torch.no_grad():
+        legacy = tiny_service.model[:-1](batch).flatten(1)
+    assert torch.allclose(features, legacy)
+
+def test_forward_with_features_v2_uses_one_forward_pass(tiny_service):
+    service = VectorService(embedding_version="v2")
+    calls = count_forward_calls(tiny_service)
+
+    probs, features = service.forward_with_features(torch.rand(2, 3, 8, 8))
+
+    assert len(calls) == 1
+    assert probs.shape == (2, 3)
+    # GeM ของสอง layer สุดท้ายก่อน head (ReLU 4 channel + Conv 8 channel)
+    assert features.shape == (2, 12)
+
+def test_predict_with_embedding_single_pass_for_batch(tiny_service):
+    np = pytest.importorskip("numpy")
+    service = VectorService(embedding_version="v1")
+    service.device = torch.device("cpu")
+    calls = count_forward_calls(tiny_service)
+    images = [np.full((16, 16, 3), value, dtype=np.uint8) for value in (0, 128, 255)]
+
+    predictions = service.predict_with_embedding(images)
+
+    assert len(calls) == 1
+    assert [set(p) for p in predictions] == [{"class", "confidence", "vector"}] * 3
+
+def test_top1_from_head_ignores_non_probability_output(tiny_service):
+    service = VectorService(embedding_version="v1")
+
+    assert service._top1_from_head(torch.rand(3), 3) == [(None, None)] * 3
+    assert service._top1_from_head(torch.rand(2, 3), 3) == [(None, None)] * 3
+
+def test_classify_and_embed_keeps_vector_when_classification_fails(tiny_service, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from services import vector_service
+
+    def fail(image):
+        raise RuntimeError("classifier unavailable")
+
+    monkeypatch.setattr(vector_service._vector_service, "device", torch.device("cpu"))
+    monkeypatch.setattr(vector_service._vector_service, "classify", fail)
+
+    result = vector_service.classify_and_embed(np.zeros((16, 16, 3), dtype=np.uint8))
+
+    assert result["vector_base64"]
+    assert result["class"] is None and result["confidence"] is None
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+from ml_managers.parity import compare_classifier, compare_detector
+
+class StubClassifier:
+    """ตัวจำลอง predictor ของ ultralytics ที่คืน top-1 ตามที่กำหนดต่อชื่อภาพ"""
+
+    names = {0: "glock", 1: "sig"}
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def __call__(self, image, verbose=False):
+        top1, top1conf = self.outputs[image]
+        return [SimpleNamespace(probs=SimpleNamespace(top1=top1, top1conf=top1conf))]
+
+class Values(list):
+    """แทน tensor ของ ultralytics (ใช้แค่ .tolist())"""
+
+    def tolist(self):
+        return list(self)
+
+class StubDetector:
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def __call__(self, image, conf=0.25, verbose=False):
+        classes, confidences = self.outputs[image]
+        return [SimpleNamespace(boxes=SimpleNamespace(cls=Values(classes), conf=Values(confidences)))]
+
+IMAGES = [("a.jpg", "a"), ("b.jpg", "b")]
+
+def test_classifier_within_tolerance_matches():
+    reference = StubClassifier({"a": (0, 0.91), "b": (1, 0.80)})
+    candidate = StubClassifier({"a": (0, 0.90), "b": (1, 0.81)})
+
+    mismatches, max_diff = compare_classifier(reference, candidate, IMAGES, tolerance=0.02)
+
+    assert mismatches == []
+    assert max_diff == pytest.approx(0.01)
+
+def test_classifier_reports_label_and_confidence_mismatches():
+    reference = StubClassifier({"a": (0, 0.91), "b": (1, 0.80)})
+    candidate = StubClassifier({"a": (1, 0.91), "b": (1, 0.70)})
+
+    mismatches, max_diff = compare_classifier(reference, candidate, IMAGES, tolerance=0.02)
+
+    assert len(mismatches) == 2
+    assert mismatches[0].startswith("a.jpg: top1 glock")
+    assert "sig" in mismatches[0]
+    assert max_diff == pytest.approx(0.10)
+
+def test_detector_compares_sorted_classes_and_confidences():
+    reference = StubDetector({"a": ([0, 1], [0.9, 0.5]), "b": ([2], [0.7])})
+    candidate = StubDetector({"a": ([1, 0], [0.51, 0.9]), "b": ([2], [0.6])})
+
+    mismatches, max_diff = compare_detector(reference, candidate, IMAGES, tolerance=0.05)
+
+    assert mismatches == ["b.jpg: confidence differs by 0.100"]
+    assert max_diff == pytest.approx(0.10)
+
+def test_detector_reports_class_mismatch():
+    reference = StubDetector({"a": ([0], [0.9]), "b": ([], [])})
+    candidate = StubDetector({"a": ([1], [0.9]), "b": ([], [])})
+
+    mismatches, _ = compare_detector(reference, candidate, IMAGES, tolerance=0.05)
+
+    assert mismatches == ["a.jpg: classes [0] vs [1]"]
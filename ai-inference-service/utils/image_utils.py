@@ -1,49 +1,257 @@
+import io
+import time
 import cv2
 import numpy as np
-import os
-import tempfile
-import uuid
-from typing import Union, List, Tuple
+from PIL import Image, ImageOps
+from typing import Union, List, Tuple, Optional
+
+def resize_masks(masks: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Resize mask ทั้งหมดของภาพให้เท่ากับขนาดภาพในครั้งเดียว
+    
+    Args:
+        masks: mask ของวัตถุทั้งหมด shape (N, h, w)
+        shape: (height, width) ของภาพต้นฉบับ
+        
+    Returns:
+        numpy array: mask แบบ bool shape (N, height, width)
+    """
+    masks = np.asarray(masks)
+    if masks.ndim == 2:
+        masks = masks[None]
+    height, width = shape[:2]
+    if masks.shape[1:] == (height, width):
+        return masks.astype(bool)
+    if masks.shape[0] == 0:
+        return np.zeros((0, height, width), dtype=bool)
+
+    # ตัดขอบ letterbox ที่โมเดลเติมไว้ออกก่อน (ภาพใน batch ที่ขนาดต่างกันจะถูก pad เป็นสี่เหลี่ยมจัตุรัส)
+    mask_h, mask_w = masks.shape[1:]
+    gain = min(mask_h / height, mask_w / width)
+    pad_h = (mask_h - height * gain) / 2
+    pad_w = (mask_w - width * gain) / 2
+    top, left = int(round(pad_h - 0.1)), int(round(pad_w - 0.1))
+    bottom, right = mask_h - int(round(pad_h + 0.1)), mask_w - int(round(pad_w + 0.1))
+    masks = masks[:, top:bottom, left:right]
+
+    # cv2.resize รับ mask หลายอันพร้อมกันในรูป channel (สูงสุด 512 channel ต่อครั้ง)
+    stacked = np.ascontiguousarray(masks.astype(np.uint8).transpose(1, 2, 0))
+    resized = [
+        cv2.resize(stacked[:, :, i:i + 512], (width, height), interpolation=cv2.INTER_NEAREST).reshape(height, width, -1)
+        for i in range(0, stacked.shape[2], 512)
+    ]
+    return np.concatenate(resized, axis=2).transpose(2, 0, 1).astype(bool)
+
+def mask_bbox(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    หา bounding box (x1, y1, x2, y2) ของพื้นที่ใน mask
+    
+    Returns:
+        tuple หรือ None ถ้า mask ว่าง
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
 
 def crop_mask_on_white(img: np.ndarray, mask: np.ndarray) -> np.ndarray:
     """
-    ตัดวัตถุตาม mask และวางบนพื้นหลังสีขาว
+    ตัดวัตถุตาม mask และวางบนพื้นหลังสีขาว โดยตัดเฉพาะ bounding box ของวัตถุ
     
     Args:
         img: รูปภาพต้นฉบับ (numpy array)
-        mask: mask ของวัตถุ (numpy array)
+        mask: mask ของวัตถุ (numpy array) ถ้าขนาดไม่ตรงกับภาพจะถูก resize
         
     Returns:
-        numpy array: รูปภาพที่ตัดแล้ว
+        numpy array: รูปภาพที่ตัดแล้ว (ขนาดเท่ากับ bounding box ของวัตถุ)
     """
-    # Resize mask ให้ตรงกับ shape ของ image
-    if mask.shape != img.shape[:2]:
-        mask = cv2.resize(mask.astype(np.uint8), (img.shape[1], img.shape[0]), interpolation=cv2.INTER_NEAREST)
+    mask = resize_masks(mask, img.shape[:2])[0]
 
-    white_bg = np.ones_like(img) * 255
-    mask = mask.astype(bool)
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return np.full_like(img, 255)
 
-    # Apply mask to each channel
-    for c in range(3):
-        white_bg[:, :, c][mask] = img[:, :, c][mask]
-    return white_bg
+    x1, y1, x2, y2 = bbox
+    roi = img[y1:y2, x1:x2]
+    roi_mask = mask[y1:y2, x1:x2]
+    if roi.ndim == 3:
+        roi_mask = roi_mask[:, :, None]
+    return np.where(roi_mask, roi, np.uint8(255)).astype(img.dtype, copy=False)
 
-def save_temp_image(image: np.ndarray, prefix: str, index: int, class_name: str) -> str:
+def crop_masks_on_white(img: np.ndarray, masks: np.ndarray) -> List[np.ndarray]:
     """
-    บันทึกรูปภาพชั่วคราว
+    ตัดวัตถุทุกชิ้นของภาพบนพื้นหลังสีขาว โดย resize mask ครั้งเดียวต่อภาพ
     
     Args:
-        image: รูปภาพที่จะบันทึก
-        prefix: คำนำหน้าชื่อไฟล์
-        index: ลำดับ
-        class_name: ชื่อประเภท
+        img: รูปภาพต้นฉบับ (numpy array) หรือ DecodedImage (ตัดจากภาพความละเอียดเต็ม)
+        masks: mask ของวัตถุทั้งหมด shape (N, h, w)
         
     Returns:
-        str: พาธของไฟล์ที่บันทึก
+        List[numpy array]: รูปภาพที่ตัดแล้วของแต่ละวัตถุ
+    """
+    if isinstance(img, DecodedImage):
+        return img.crop_masks_on_white(masks)
+    full_masks = resize_masks(masks, img.shape[:2])
+    return [crop_mask_on_white(img, mask) for mask in full_masks]
+
+# IMREAD_REDUCED_COLOR_* ให้ libjpeg ถอดรหัสที่ 1/2, 1/4, 1/8 ของความละเอียดโดยตรง
+_REDUCED_DECODE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+# EXIF orientation ที่หมุนภาพ 90/270 องศา (กว้าง/สูงสลับกัน)
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+class DecodedImage:
+    """
+    ภาพที่ถอดรหัสแล้วสำหรับประมวลผล (ความละเอียดถูกจำกัด) พร้อมข้อมูลสำหรับแปลงพิกัดกลับไปยังภาพต้นฉบับ
+    """
+
+    def __init__(self, image: np.ndarray, original_size: Tuple[int, int], decode_ms: float, data: Optional[bytes] = None):
+        self.image = image
+        self.original_size = original_size  # (width, height) หลังหมุนตาม EXIF
+        self.decode_ms = decode_ms
+        self._data = data
+        self._full: Optional[np.ndarray] = None
+
+    @property
+    def scale(self) -> float:
+        """อัตราส่วนขนาดภาพต้นฉบับต่อภาพที่ใช้ประมวลผล"""
+        return self.original_size[0] / self.image.shape[1]
+
+    def to_original(self, bbox) -> List[int]:
+        """แปลง bbox (x1, y1, x2, y2) บนภาพที่ใช้ประมวลผลเป็นพิกัดบนภาพต้นฉบับ"""
+        return [int(round(v * self.scale)) for v in bbox]
+
+    def full_image(self) -> np.ndarray:
+        """ภาพความละเอียดเต็ม (ถอดรหัสครั้งแรกที่เรียกเท่านั้น)"""
+        if self._data is None:
+            return self.image
+        if self._full is None:
+            self._full = cv2.imdecode(np.frombuffer(self._data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self._full
+
+    def crop_original(self, bbox) -> np.ndarray:
+        """ตัดภาพความละเอียดเต็มตาม bbox บนภาพที่ใช้ประมวลผล"""
+        x1, y1, x2, y2 = self.to_original(bbox) if self._data is not None else [int(v) for v in bbox]
+        return self.full_image()[y1:y2, x1:x2].copy()
+
+    def crop_masks_on_white(self, masks: np.ndarray) -> List[np.ndarray]:
+        """
+        ตัดวัตถุทุกชิ้นบนพื้นหลังสีขาวจากภาพความละเอียดเต็ม (สำหรับ classifier และ embedding)
+
+        หา bounding box จาก mask บนภาพที่ใช้ประมวลผล แล้วขยาย mask เฉพาะส่วนใน bounding box
+        ให้เท่ากับขนาดที่ตัดจากภาพต้นฉบับ
+        """
+        if self._data is None:
+            return crop_masks_on_white(self.image, masks)
+
+        crops = []
+        for mask in resize_masks(masks, self.image.shape[:2]):
+            bbox = mask_bbox(mask)
+            if bbox is None:
+                crops.append(np.full_like(self.image, 255))
+                continue
+            roi = self.crop_original(bbox)
+            x1, y1, x2, y2 = bbox
+            roi_mask = cv2.resize(
+                mask[y1:y2, x1:x2].astype(np.uint8), (roi.shape[1], roi.shape[0]), interpolation=cv2.INTER_NEAREST
+            ).astype(bool)
+            crops.append(np.where(roi_mask[:, :, None], roi, np.uint8(255)))
+        return crops
+
+    def info(self) -> dict:
+        return {
+            "original_size": list(self.original_size),
+            "working_size": [self.image.shape[1], self.image.shape[0]],
+            "decode_ms": round(self.decode_ms, 1)
+        }
+
+def working_image(image) -> np.ndarray:
+    """ภาพที่ใช้ประมวลผล (numpy array) จาก DecodedImage หรือ numpy array"""
+    return image.image if isinstance(image, DecodedImage) else image
+
+def _probe_image(data: bytes) -> Tuple[Optional[int], Optional[int], int]:
+    """อ่านขนาดและ EXIF orientation จาก header ของไฟล์ (ไม่ถอดรหัสพิกเซล)"""
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            width, height = probe.size
+            orientation = probe.getexif().get(0x0112, 1)
+        return width, height, orientation
+    except Exception:
+        return None, None, 1
+
+def decode_image_info(data: bytes, max_side: Optional[int] = None) -> DecodedImage:
+    """
+    ถอดรหัสรูปภาพจาก bytes โดยจำกัดด้านที่ยาวที่สุดไม่เกิน max_side
+    
+    ภาพ JPEG ขนาดใหญ่ (เช่นภาพจากมือถือ 12-48 MP) ถูกถอดรหัสที่ความละเอียดลดลงโดยตรง
+    แทนการถอดรหัสเต็มแล้วย่อ และหมุนตาม EXIF orientation (cv2.imdecode ทำให้อยู่แล้ว)
+    
+    Args:
+        data: ข้อมูลไฟล์รูปภาพ
+        max_side: ความยาวด้านที่ยาวที่สุดของภาพที่ใช้ประมวลผล (None = ความละเอียดเต็ม)
+        
+    Returns:
+        DecodedImage: ภาพ BGR, ขนาดภาพต้นฉบับ และเวลาที่ใช้ถอดรหัส
+    """
+    started = time.perf_counter()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if not buffer.size:
+        raise ValueError("Could not decode image data")
+    
+    width, height, orientation = _probe_image(data)
+    flag = cv2.IMREAD_COLOR
+    if max_side and width:
+        longest = max(width, height)
+        factor = next((f for f in _REDUCED_DECODE_FLAGS if longest / f >= max_side), 1)
+        flag = _REDUCED_DECODE_FLAGS.get(factor, cv2.IMREAD_COLOR)
+    
+    image = cv2.imdecode(buffer, flag)
+    if image is None:
+        raise ValueError("Could not decode image data")
+    
+    if width is None:
+        height, width = image.shape[:2]
+    elif orientation in _TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    
+    if max_side and max(image.shape[:2]) > max_side:
+        ratio = max_side / max(image.shape[:2])
+        size = (max(1, round(image.shape[1] * ratio)), max(1, round(image.shape[0] * ratio)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    
+    decode_ms = (time.perf_counter() - started) * 1000
+    # เก็บ bytes ไว้ตัดภาพความละเอียดเต็มภายหลังเฉพาะเมื่อภาพถูกย่อ
+    downscaled = image.shape[1] != width
+    return DecodedImage(image, (width, height), decode_ms, data if downscaled else None)
+
+def decode_image(data: bytes, max_side: Optional[int] = None) -> np.ndarray:
+    """
+    ถอดรหัสรูปภาพจาก bytes (เช่น ไฟล์ที่อัปโหลด) เป็น numpy array (BGR) ในหน่วยความจำ
+    
+    Args:
+        data: ข้อมูลไฟล์รูปภาพ
+        max_side: จำกัดด้านที่ยาวที่สุดของภาพ (None = ความละเอียดเต็ม)
+        
+    Returns:
+        numpy array: รูปภาพ BGR 3 channel
+    """
+    return decode_image_info(data, max_side).image
+
+def load_pil_image(path_or_data, size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    เปิดภาพด้วย PIL เป็น RGB โดยหมุนตาม EXIF และใช้ draft mode ของ JPEG
+    ให้ถอดรหัสที่ความละเอียดต่ำที่สุดที่ยังไม่เล็กกว่า size
     """
-    temp_path = f"{prefix}_crop_{index}_{class_name}.jpg"
-    cv2.imwrite(temp_path, image)
-    return temp_path
+    source = io.BytesIO(path_or_data) if isinstance(path_or_data, (bytes, bytearray)) else path_or_data
+    image = Image.open(source)
+    if size is not None:
+        image.draft('RGB', size)
+    return ImageOps.exif_transpose(image).convert('RGB')
 
 def get_top3(pred, class_names) -> List[dict]:
     """
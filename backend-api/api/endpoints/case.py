@@ -44,75 +44,47 @@ async def get_cases_with_relationships(
     end_date: Optional[str] = Query(None, description="วันที่สิ้นสุด (YYYY-MM-DD)"),
     province: Optional[str] = Query(None, description="จังหวัด"),
     district: Optional[str] = Query(None, description="อำเภอ"),
-    drug_type: Optional[str] = Query(None, description="ประเภทยาเสพติด")
+    drug_type: Optional[str] = Query(None, description="ประเภทยาเสพติด"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="จำนวนคดีต่อหน้า (ไม่ระบุ = ทั้งหมด)"),
+    cursor: Optional[int] = Query(None, description="next_cursor จากหน้าก่อนหน้า")
 ):
     """ดึงรายการ Cases พร้อมความสัมพันธ์ทั้งหมด สำหรับหน้า Drug Cases List"""
     try:
-        # ✅ สร้าง filters object
-        filters = {}
-        if search:
-            filters['search'] = search
-        if case_type:
-            filters['case_type'] = case_type
-        if status_filter:  # ✅ ใช้ status_filter แทน
-            filters['status'] = status_filter
-        if start_date:
-            filters['start_date'] = start_date
-        if end_date:
-            filters['end_date'] = end_date
-        if province:
-            filters['province'] = province
-        if district:
-            filters['district'] = district
-        if drug_type:
-            filters['drug_type'] = drug_type
-        
-        print(f"🔍 Cases with relationships - Filters: {filters}")
-        
-        # ✅ เรียกใช้ service method
-        result = CaseService.get_cases_with_relationships(filters)
-        
+        filters = {
+            'search': search,
+            'case_type': case_type,
+            'status': status_filter,
+            'start_date': start_date,
+            'end_date': end_date,
+            'province': province,
+            'district': district,
+            'drug_type': drug_type
+        }
+
+        result = CaseService.get_cases_with_relationships(
+            {key: value for key, value in filters.items() if value},
+            limit=limit,
+            cursor=cursor
+        )
+
         if not result['success']:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=result.get('message', 'Unknown error')
             )
-        
-        # ✅ Debug logging - แสดงข้อมูลเพิ่มเติม
-        print(f"✅ API returning {len(result['data'])} cases with relationships")
-        if result['data']:
-            sample_case = result['data'][0]
-            print(f"📋 Sample case structure:")
-            print(f"   - case_id: {sample_case.get('case_id')}")
-            print(f"   - has evidences: {'evidences' in sample_case}")
-            print(f"   - has defendants: {'defendants' in sample_case}")
-            print(f"   - evidences count: {len(sample_case.get('evidences', []))}")
-            print(f"   - defendants count: {len(sample_case.get('defendants', []))}")
-            
-            if sample_case.get('evidences'):
-                first_evidence = sample_case['evidences'][0]
-                print(f"   - first evidence drug_type: {first_evidence.get('drug_type', 'N/A')}")
-                print(f"   - first evidence quantity: {first_evidence.get('quantity', 'N/A')}")
-                print(f"   - first evidence weight: {first_evidence.get('weight', 'N/A')}")
-            
-            if sample_case.get('defendants'):
-                first_defendant = sample_case['defendants'][0]
-                print(f"   - first defendant: {first_defendant.get('fullname', 'N/A')}")
-                print(f"   - first defendant id: {first_defendant.get('id', 'N/A')}")
-        
+
         return {
             "success": True,
             "data": result['data'],
-            "total": result.get('total', len(result['data'])),
-            "message": f"Found {len(result['data'])} cases with relationships"
+            "total": result['total'],
+            "next_cursor": result.get('next_cursor'),
+            "message": f"Found {result['total']} cases with relationships"
         }
-        
+
     except HTTPException:
         raise
     except Exception as e:
         print(f"❌ Error in get_cases_with_relationships: {str(e)}")
-        import traceback
-        print(f"❌ API traceback: {traceback.format_exc()}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
@@ -1,29 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from config.database import get_db
+from core.config import settings
+from core.geojson import MAX_GEOJSON_PRECISION
 from schemas.geography import District
 from services.district_service import (
-    get_districts, 
     get_district_by_id, 
     search_districts_by_name
 )
+from services.geography_cache_service import get_cached_districts, cached_response
 
 router = APIRouter(tags=["geography"])
 
 @router.get("/districts", response_model=List[District])
 async def read_districts(
+    request: Request,
     province_id: Optional[int] = Query(None, description="Filter districts by province ID"),
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    ดึงข้อมูลอำเภอทั้งหมดหรือกรองตามจังหวัด (ORM)
+    ดึงข้อมูลอำเภอทั้งหมดหรือกรองตามจังหวัด (serialize และ gzip ไว้ใน cache พร้อม ETag)
     """
     try:
-        districts = await get_districts(db, province_id)
-        if province_id and not districts:
+        payload = await get_cached_districts(db, province_id, simplify, precision)
+        if province_id and not payload.count:
             raise HTTPException(status_code=404, detail=f"No districts found for province ID: {province_id}")
-        return districts
+        return cached_response(request, payload, settings.GEOGRAPHY_CACHE_MAX_AGE)
     except HTTPException:
         raise
     except Exception as e:
@@ -33,24 +38,31 @@ async def read_districts(
 async def search_districts(
     q: str = Query(..., description="Search term for district name", min_length=1),
     province_id: Optional[int] = Query(None, description="Filter by province ID"),
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     ค้นหาอำเภอจากชื่อ (ORM)
     """
     try:
-        districts = await search_districts_by_name(db, q.strip(), province_id)
+        districts = await search_districts_by_name(db, q.strip(), province_id, simplify, precision)
         return districts
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching districts: {str(e)}")
 
 @router.get("/districts/{district_id}", response_model=District)
-async def read_district(district_id: int, db: AsyncSession = Depends(get_db)):
+async def read_district(
+    district_id: int,
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     ดึงข้อมูลอำเภอตาม ID (ORM)
     """
     try:
-        district = await get_district_by_id(db, district_id)
+        district = await get_district_by_id(db, district_id, simplify, precision)
         if district is None:
             raise HTTPException(status_code=404, detail="District not found")
         return district
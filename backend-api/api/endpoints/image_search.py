@@ -1,13 +1,14 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 import base64
 import numpy as np
 
 from config.database import get_db
-from models.narcotic import Narcotic, NarcoticExampleImage, NarcoticImageVector
+from models.narcotic import Narcotic
+from services.narcotic_service import NarcoticService
 from services.ai_image_search import get_ai_image_search_service, AIImageSearchService
 
 router = APIRouter(tags=["image_search"])
@@ -22,71 +23,43 @@ async def search_narcotics_by_image(
 ):
     """
     ค้นหายาเสพติดโดยใช้รูปภาพ:
-    1. ทำ segmentation เพื่อแยกส่วนที่เป็นยาเสพติด
-    2. แปลงเป็น vector
-    3. ค้นหาในฐานข้อมูล
+    1. ทำ segmentation และแปลงส่วนที่เป็นยาเสพติดเป็น vector (เรียก AI Service ครั้งเดียว)
+    2. ค้นหาในฐานข้อมูล
     """
     try:
-        # 1. ส่งรูปภาพไปทำ segmentation
-        segment_result = await ai_service.segment_drug_image(file)
+        # 1. segment และสร้าง vector ของยาเสพติดที่มั่นใจที่สุดจากผล segmentation เดียวกัน
+        detect_result = await ai_service.detect_and_embed(file)
+        embeddings = detect_result.get("embeddings", [])
         
-        # ตรวจสอบว่าพบยาเสพติดหรือไม่
-        drug_objects = [obj for obj in segment_result.get("objects", []) 
-                       if obj.get("class") in ["Drug", "drug", "narcotic", "Narcotic"]]
-        
-        if not drug_objects:
+        if not embeddings:
             return {
                 "success": False,
                 "message": "ไม่พบยาเสพติดในรูปภาพ",
                 "results": []
             }
         
-        # 2. แปลงรูปภาพเป็น vector
-        vector_result = await ai_service.convert_to_vector(file)
-        
-        if not vector_result or "vector_base64" not in vector_result:
-            raise HTTPException(status_code=500, detail="ไม่สามารถสร้าง vector จากรูปภาพได้")
-        
         # แปลง vector จาก base64 เป็น numpy array
-        vector_bytes = base64.b64decode(vector_result["vector_base64"])
+        vector_bytes = base64.b64decode(embeddings[0]["vector_base64"])
         search_vector = np.frombuffer(vector_bytes, dtype=np.float32)
         
-        # 3. ค้นหา vector ที่คล้ายคลึงในฐานข้อมูล
-        cosine_similarity = func.text("1 - (image_vector <=> :search_vector)")
-        
-        # สร้าง subquery
-        subq = (
-            select(
-                NarcoticImageVector.narcotic_id,
-                NarcoticImageVector.image_id,
-                cosine_similarity.label("similarity")
-            )
-            .where(cosine_similarity > threshold)
-            .order_by(func.text("similarity").desc())
-            .limit(top_k)
-            .params(search_vector=search_vector.tolist())
-            .subquery()
+        # 2. ค้นหา vector ที่คล้ายคลึงในฐานข้อมูล (HNSW candidates + re-rank ด้วย vector เต็ม)
+        similar_items = await NarcoticService.search_similar_narcotics(
+            db,
+            search_vector,
+            top_k=top_k,
+            similarity_threshold=threshold
         )
         
-        # สร้าง query หลัก
-        query = (
-            select(
-                Narcotic.id.label("narcotic_id"),
-                Narcotic.drug_type,
-                Narcotic.drug_category,
-                Narcotic.characteristics,
-                NarcoticExampleImage.id.label("image_id"),
-                NarcoticExampleImage.image_url,
-                subq.c.similarity
+        # ดึงข้อมูลเพิ่มเติมของทุกรายการในครั้งเดียว
+        narcotic_ids = list({item["narcotic_id"] for item in similar_items})
+        narcotics = {}
+        if narcotic_ids:
+            drug_result = await db.execute(
+                select(Narcotic)
+                .options(selectinload(Narcotic.drug_form), selectinload(Narcotic.pill_info))
+                .filter(Narcotic.id.in_(narcotic_ids))
             )
-            .join(subq, Narcotic.id == subq.c.narcotic_id)
-            .join(NarcoticExampleImage, NarcoticExampleImage.id == subq.c.image_id)
-            .order_by(subq.c.similarity.desc())
-        )
-        
-        # ดึงข้อมูล
-        result = await db.execute(query)
-        similar_items = result.mappings().all()
+            narcotics = {n.id: n for n in drug_result.scalars().all()}
         
         # แปลงผลลัพธ์
         results = []
@@ -103,19 +76,15 @@ async def search_narcotics_by_image(
                 "similarity": round(float(item["similarity"]), 4)
             }
             
-            # ดึงข้อมูลเพิ่มเติม
-            drug_query = select(Narcotic).filter(Narcotic.id == item["narcotic_id"])
-            drug_result = await db.execute(drug_query)
-            narcotic = drug_result.scalars().first()
-            
+            narcotic = narcotics.get(item["narcotic_id"])
             if narcotic:
-                if hasattr(narcotic, "drug_form") and narcotic.drug_form:
+                if narcotic.drug_form:
                     result_item["drug_form"] = {
                         "id": narcotic.drug_form.id,
                         "name": narcotic.drug_form.name
                     }
                 
-                if hasattr(narcotic, "pill_info") and narcotic.pill_info:
+                if narcotic.pill_info:
                     result_item["pill_info"] = {
                         "color": narcotic.pill_info.color,
                         "diameter_mm": narcotic.pill_info.diameter_mm,
@@ -1,26 +1,16 @@
-import os
 import httpx
 import base64
 import numpy as np
 
-from typing import List
 from fastapi import APIRouter, Depends, Body, HTTPException, status, File, UploadFile, Form
-from sqlalchemy import func, literal_column, text
-from sqlalchemy.orm import aliased
-
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import List, Optional, Dict, Any
 
 from config.database import get_db
 from config.cloudinary_config import upload_image_to_cloudinary
-from models.narcotic import (
-    Narcotic, NarcoticExampleImage, NarcoticChemicalCompound,
-    NarcoticPill, NarcoticImageVector, ChemicalCompound,
-    DrugForm
-)
+from models.narcotic import NarcoticExampleImage, ChemicalCompound, DrugForm
 from schemas.narcotic import (
-    Narcotic as NarcoticSchema,
     NarcoticCreate,
     NarcoticUpdate,
     NarcoticWithRelations,
@@ -33,7 +23,6 @@ from schemas.narcotic import (
 )
 from services.exhibit_service import get_exhibit_by_id
 from services.narcotic_service import NarcoticService
-from pgvector.sqlalchemy import Vector
 from core.config import get_ml_service_url
 
 
@@ -651,50 +640,14 @@ async def search_similar_narcotics(
         vector_data = base64.b64decode(vector_result["vector_base64"])
         search_vector = np.frombuffer(vector_data, dtype=np.float32)
         
-        # ตรวจสอบว่ามีข้อมูลในตาราง vector หรือไม่
-        check_query = text("SELECT COUNT(*) FROM narcotics_image_vectors")
-        count_result = await db.execute(check_query)
-        count = count_result.scalar_one()
-        print(f"Database has {count} vectors stored")
-        
-        # สร้าง custom function สำหรับ cosine similarity
-        cosine_similarity = func.text("1 - (image_vector <=> :search_vector)")
-        
-        # สร้าง subquery ที่คำนวณ similarity
-        subq = (
-            select(
-                NarcoticImageVector.narcotic_id,
-                NarcoticImageVector.image_id,
-                func.text("1 - (image_vector <=> :search_vector)").label("similarity")
-            )
-            .where(func.text("1 - (image_vector <=> :search_vector)") > similarity_threshold)
-            .order_by(func.text("similarity").desc())
-            .limit(top_k)
-            .params(search_vector=search_vector.tolist())
-            .subquery()
-        )
-        
-        # Join กับตารางอื่นๆ เพื่อดึงข้อมูลที่ต้องการ
-        query = (
-            select(
-                Narcotic.id.label("narcotic_id"),
-                Narcotic.drug_type,
-                Narcotic.drug_category,
-                Narcotic.characteristics,
-                NarcoticExampleImage.id.label("image_id"),
-                NarcoticExampleImage.image_url,
-                NarcoticExampleImage.description,
-                subq.c.similarity
-            )
-            .join(subq, Narcotic.id == subq.c.narcotic_id)
-            .join(NarcoticExampleImage, NarcoticExampleImage.id == subq.c.image_id)
-            .order_by(subq.c.similarity.desc())
+        # 2-4. ค้นหา candidates จาก HNSW index แล้ว re-rank ด้วย vector เต็ม
+        similar_items = await NarcoticService.search_similar_narcotics(
+            db,
+            search_vector,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold
         )
         
-        # 4. ค้นหาในฐานข้อมูล
-        result = await db.execute(query)
-        similar_items = result.mappings().all()
-        
         # 5. แปลงผลลัพธ์เป็น dictionary (เหมือนเดิม)
         results = []
         for item in similar_items:
@@ -705,7 +658,7 @@ async def search_similar_narcotics(
                 "characteristics": item["characteristics"],
                 "image_id": item["image_id"],
                 "image_url": item["image_url"],
-                "description": item["description"],
+                "description": item["image_description"],
                 "similarity": round(float(item["similarity"]), 4)
             })
         
@@ -808,120 +761,13 @@ async def search_similar_narcotics(
         print(f"Input vector length: {len(vector)}")
         print(f"Input vector sample: {vector[:10]}...")
         
-        # โค้ดที่เหลือเหมือนเดิม
-        # ...
-        # ตรวจสอบจำนวน vectors ในฐานข้อมูล
-        check_query = text("SELECT COUNT(*) FROM narcotics_image_vectors")
-        count_result = await db.execute(check_query)
-        count = count_result.scalar_one()
-        print(f"Database has {count} vectors stored")
-        
-        # ดึงข้อมูล vector จากฐานข้อมูล (ข้อมูลพื้นฐานก่อน)
-        basic_query = text("""
-            SELECT 
-                id,
-                narcotic_id,
-                image_id
-            FROM 
-                narcotics_image_vectors
-        """)
-        
-        basic_result = await db.execute(basic_query)
-        basic_info = basic_result.mappings().all()
-        
-        print("\n==== VECTOR ENTRIES IN DATABASE ====")
-        for v in basic_info:
-            print(f"ID: {v['id']}, Narcotic ID: {v['narcotic_id']}, Image ID: {v['image_id']}")
-        
-        # แทนที่จะใช้ json_array_elements ให้ใช้ ::text โดยตรง
-        vector_query = text("""
-            SELECT 
-                id,
-                narcotic_id,
-                image_id,
-                image_vector::text as vector_text
-            FROM 
-                narcotics_image_vectors
-        """)
-        
-        try:
-            vector_result = await db.execute(vector_query)
-            vector_data = vector_result.mappings().all()
-            
-            print("\n==== VECTOR VALUES ====")
-            for v in vector_data:
-                vector_text = v['vector_text']
-                # แสดงรูปแบบ vector และตัดให้เหลือแค่ 100 ตัวอักษรแรก
-                print(f"ID: {v['id']}, Narcotic ID: {v['narcotic_id']}")
-                print(f"Vector (sample): {vector_text[:100]}...")
-                
-                # แปลง vector text เป็น Python list เพื่อแสดงค่าตัวเลข
-                try:
-                    # ลบวงเล็บ [] ที่ห่อหุ้มและแยกด้วย comma
-                    vector_text = vector_text.strip('[]')
-                    vector_values = [float(x) for x in vector_text.split(',')]
-                    print(f"Vector first 10 elements: {vector_values[:10]}")
-                    print(f"Vector length: {len(vector_values)}")
-                except Exception as parse_err:
-                    print(f"Could not parse vector values: {parse_err}")
-        except Exception as e:
-            print(f"Could not extract vector values: {e}")
-            
-            # แสดงค่า vector แบบแยกทีละรายการ
-            for vid in [v['id'] for v in basic_info]:
-                single_vector_query = text(f"""
-                    SELECT 
-                        id,
-                        image_vector::text as vector_text
-                    FROM 
-                        narcotics_image_vectors
-                    WHERE
-                        id = {vid}
-                """)
-                
-                try:
-                    single_result = await db.execute(single_vector_query)
-                    single_data = single_result.mappings().first()
-                    if single_data:
-                        vector_text = single_data['vector_text']
-                        print(f"\nVector ID: {single_data['id']}")
-                        print(f"Vector (first 100 chars): {vector_text[:100]}...")
-                except Exception as inner_e:
-                    print(f"Error getting vector {vid}: {inner_e}")
-        
-        # ทำการค้นหาตามปกติ
-        vector_str = f"[{','.join(str(x) for x in vector)}]"
-        
-        # ใช้ string interpolation โดยตรงเพื่อแก้ปัญหา parameter binding
-        query = text(f"""
-            WITH query_vector AS (
-                SELECT '{vector_str}'::vector AS v
-            ),
-            similarity_calc AS (
-                SELECT 
-                    n.id as narcotic_id,
-                    n.drug_type as drug_type,
-                    n.drug_category as drug_category,
-                    n.effect as description,
-                    1 - (niv.image_vector <=> (SELECT v FROM query_vector)) as similarity
-                FROM 
-                    narcotics_image_vectors niv
-                JOIN 
-                    narcotics n ON niv.narcotic_id = n.id
-                ORDER BY 
-                    niv.image_vector <=> (SELECT v FROM query_vector)
-                LIMIT :top_k
-            )
-            SELECT * FROM similarity_calc
-            WHERE similarity > :threshold
-        """)
-        
-        # ส่งทั้ง top_k และ threshold
-        result = await db.execute(
-            query, 
-            {"top_k": top_k, "threshold": similarity_threshold}
+        # ค้นหา candidates จาก HNSW index แล้ว re-rank ด้วย vector เต็ม
+        rows = await NarcoticService.search_similar_narcotics(
+            db,
+            vector,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold
         )
-        rows = result.mappings().all()
         
         similar_items = []
         for row in rows:
@@ -1,38 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from config.database import get_db
+from core.config import settings
+from core.geojson import MAX_GEOJSON_PRECISION
 from schemas.geography import Province
 from services.province_service import (
-    get_provinces, 
     get_province_by_id, 
     search_provinces_by_name,
     get_province_statistics
 )
+from services.geography_cache_service import get_cached_provinces, cached_response
 
 router = APIRouter(tags=["geography"])
 
 @router.get("/provinces", response_model=List[Province])
-async def read_provinces(db: AsyncSession = Depends(get_db)):
+async def read_provinces(
+    request: Request,
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    ดึงข้อมูลจังหวัดทั้งหมด (ORM)
+    ดึงข้อมูลจังหวัดทั้งหมด (serialize และ gzip ไว้ใน cache พร้อม ETag)
     """
     try:
-        provinces = await get_provinces(db)
-        return provinces
+        payload = await get_cached_provinces(db, simplify, precision)
+        return cached_response(request, payload, settings.GEOGRAPHY_CACHE_MAX_AGE)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching provinces: {str(e)}")
 
 @router.get("/provinces/search", response_model=List[Province])
 async def search_provinces(
     q: str = Query(..., description="Search term for province name", min_length=1),
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     ค้นหาจังหวัดจากชื่อ (ORM)
     """
     try:
-        provinces = await search_provinces_by_name(db, q.strip())
+        provinces = await search_provinces_by_name(db, q.strip(), simplify, precision)
         return provinces
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching provinces: {str(e)}")
@@ -49,12 +58,17 @@ async def get_statistics(db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error fetching province statistics: {str(e)}")
 
 @router.get("/provinces/{province_id}", response_model=Province)
-async def read_province(province_id: int, db: AsyncSession = Depends(get_db)):
+async def read_province(
+    province_id: int,
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     ดึงข้อมูลจังหวัดตาม ID (ORM)
     """
     try:
-        province = await get_province_by_id(db, province_id)
+        province = await get_province_by_id(db, province_id, simplify, precision)
         if province is None:
             raise HTTPException(status_code=404, detail="Province not found")
         return province
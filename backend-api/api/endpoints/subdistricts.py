@@ -1,29 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from config.database import get_db
+from core.config import settings
+from core.geojson import MAX_GEOJSON_PRECISION
 from schemas.geography import Subdistrict
 from services.subdistrict_service import (
-    get_subdistricts, 
     get_subdistrict_by_id, 
     search_subdistricts_by_name
 )
+from services.geography_cache_service import get_cached_subdistricts, cached_response
 
 router = APIRouter(tags=["geography"])
 
 @router.get("/subdistricts", response_model=List[Subdistrict])
 async def read_subdistricts(
+    request: Request,
     district_id: Optional[int] = Query(None, description="Filter subdistricts by district ID"),
     province_id: Optional[int] = Query(None, description="Filter subdistricts by province ID"),
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    ดึงข้อมูลตำบลทั้งหมดหรือกรองตามอำเภอและ/หรือจังหวัด (ORM)
+    ดึงข้อมูลตำบลทั้งหมดหรือกรองตามอำเภอและ/หรือจังหวัด (serialize และ gzip ไว้ใน cache พร้อม ETag)
     """
     try:
-        subdistricts = await get_subdistricts(db, district_id, province_id)
+        payload = await get_cached_subdistricts(db, district_id, province_id, simplify, precision)
         
-        if (district_id or province_id) and not subdistricts:
+        if (district_id or province_id) and not payload.count:
             filter_desc = []
             if district_id:
                 filter_desc.append(f"district ID: {district_id}")
@@ -35,7 +40,7 @@ async def read_subdistricts(
                 detail=f"No subdistricts found for {' and '.join(filter_desc)}"
             )
             
-        return subdistricts
+        return cached_response(request, payload, settings.GEOGRAPHY_CACHE_MAX_AGE)
     except HTTPException:
         raise
     except Exception as e:
@@ -46,6 +51,8 @@ async def search_subdistricts(
     q: str = Query(..., description="Search term for subdistrict name", min_length=1),
     district_id: Optional[int] = Query(None, description="Filter by district ID"),
     province_id: Optional[int] = Query(None, description="Filter by province ID"),
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -53,19 +60,24 @@ async def search_subdistricts(
     """
     try:
         subdistricts = await search_subdistricts_by_name(
-            db, q.strip(), district_id, province_id
+            db, q.strip(), district_id, province_id, simplify, precision
         )
         return subdistricts
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching subdistricts: {str(e)}")
 
 @router.get("/subdistricts/{subdistrict_id}", response_model=Subdistrict)
-async def read_subdistrict(subdistrict_id: int, db: AsyncSession = Depends(get_db)):
+async def read_subdistrict(
+    subdistrict_id: int,
+    simplify: Optional[float] = Query(None, ge=0, description="Simplify tolerance for ST_SimplifyPreserveTopology (geometry units)"),
+    precision: Optional[int] = Query(None, ge=0, le=MAX_GEOJSON_PRECISION, description="Number of decimal digits in GeoJSON coordinates"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     ดึงข้อมูลตำบลตาม ID (ORM)
     """
     try:
-        subdistrict = await get_subdistrict_by_id(db, subdistrict_id)
+        subdistrict = await get_subdistrict_by_id(db, subdistrict_id, simplify, precision)
         if subdistrict is None:
             raise HTTPException(status_code=404, detail="Subdistrict not found")
         return subdistrict
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from config.database import get_db
+from core.config import settings
+from services.geography_cache_service import (
+    get_cached_tile,
+    cached_response,
+    TILE_LAYERS,
+    MAX_TILE_ZOOM
+)
+
+router = APIRouter(tags=["geography-tiles"])
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+async def read_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    layers: Optional[str] = Query(None, description="Comma-separated layers: provinces,districts,subdistricts"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    ดึงขอบเขตการปกครองเป็น Mapbox Vector Tile (ST_AsMVT) เฉพาะพื้นที่ที่แผนที่แสดงอยู่
+    """
+    if z < 0 or z > MAX_TILE_ZOOM or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail=f"Invalid tile coordinates: {z}/{x}/{y}")
+
+    requested_layers = None
+    if layers:
+        requested_layers = [layer.strip() for layer in layers.split(",") if layer.strip()]
+        unknown = [layer for layer in requested_layers if layer not in TILE_LAYERS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown tile layers: {', '.join(unknown)}")
+
+    try:
+        payload = await get_cached_tile(db, z, x, y, requested_layers)
+        return cached_response(request, payload, settings.GEOGRAPHY_CACHE_MAX_AGE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building tile: {str(e)}")
@@ -29,6 +29,15 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = Field(default="dev-jwt-secret-key", description="JWT secret")
     SECRET_KEY: Optional[str] = Field(default=None, description="General secret key")
     
+    # Narcotic image vector search (HNSW บน search_vector แล้ว re-rank ด้วย image_vector)
+    NARCOTIC_SEARCH_CANDIDATES: int = Field(default=100, description="Number of ANN candidates re-ranked with the full vector")
+    NARCOTIC_HNSW_EF_SEARCH: int = Field(default=200, description="hnsw.ef_search used for narcotic vector search")
+    
+    # Geography cache (provinces/districts/subdistricts เป็นข้อมูลอ้างอิงที่ไม่เปลี่ยน)
+    GEOGRAPHY_CACHE_MAX_BYTES: int = Field(default=256 * 1024 * 1024, description="Max gzipped bytes held by the geography cache")
+    GEOGRAPHY_CACHE_MAX_AGE: int = Field(default=86400, description="Cache-Control max-age for geography responses")
+    GEOGRAPHY_CACHE_WARMUP: bool = Field(default=False, description="Serialize all geography levels at startup")
+    
     # Cloudinary
     CLOUDINARY_CLOUD_NAME: Optional[str] = Field(default=None, description="Cloudinary cloud name")
     CLOUDINARY_API_KEY: Optional[str] = Field(default=None, description="Cloudinary API key")
@@ -0,0 +1,32 @@
+import json
+from typing import Any, Dict, Optional
+from sqlalchemy import func
+
+# ST_AsGeoJSON ใช้ทศนิยม 9 ตำแหน่งเป็นค่าเริ่มต้น (ละเอียดระดับมิลลิเมตร ซึ่งเกินความจำเป็นสำหรับแผนที่)
+MAX_GEOJSON_PRECISION = 15
+
+
+def geojson_column(geom, simplify: Optional[float] = None, precision: Optional[int] = None):
+    """
+    สร้าง column ST_AsGeoJSON สำหรับใช้ใน SELECT เดียวกับข้อมูลหลัก
+
+    simplify: tolerance (หน่วยเดียวกับ SRID ของ geometry) สำหรับ ST_SimplifyPreserveTopology
+    precision: จำนวนทศนิยมของพิกัดใน GeoJSON
+    """
+    expr = geom
+    if simplify:
+        expr = func.ST_SimplifyPreserveTopology(expr, simplify)
+
+    if precision is not None:
+        return func.ST_AsGeoJSON(expr, precision).label("geojson")
+    return func.ST_AsGeoJSON(expr).label("geojson")
+
+
+def parse_geojson(geojson: Optional[str]) -> Optional[Dict[str, Any]]:
+    """แปลงผลลัพธ์ของ ST_AsGeoJSON เป็น dict"""
+    if not geojson:
+        return None
+    try:
+        return json.loads(geojson)
+    except json.JSONDecodeError:
+        return None
@@ -19,6 +19,10 @@ from api.endpoints.case import router as case_router
 from api.endpoints.evidence import router as evidence_router
 from api.endpoints.defendant import router as defendant_router
 from api.endpoints.statistic import router as statistic_router
+from api.endpoints.tiles import router as tiles_router
+from config.database import async_session_factory
+from core.config import settings
+from services.geography_cache_service import warm_up_geography_cache
 from config.logging_config import setup_logging
 import os
 import logging
@@ -144,6 +148,17 @@ app.include_router(case_router, prefix="/api")
 app.include_router(evidence_router, prefix="/api")
 app.include_router(defendant_router, prefix="/api")
 app.include_router(statistic_router, prefix="/api")
+app.include_router(tiles_router, prefix="/api")
+
+@app.on_event("startup")
+async def warm_geography_cache():
+    if not settings.GEOGRAPHY_CACHE_WARMUP:
+        return
+    try:
+        async with async_session_factory() as db:
+            await warm_up_geography_cache(db)
+    except Exception as e:
+        logger.error(f"Failed to warm up geography cache: {str(e)}")
 
 @app.get("/api/health")
 async def health_check():
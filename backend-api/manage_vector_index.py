@@ -0,0 +1,80 @@
+"""
+จัดการ search index ของ narcotic image vectors
+
+    python manage_vector_index.py migrate
+    python manage_vector_index.py backfill --method auto --sample-size 4096
+    python manage_vector_index.py status
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import func, select
+
+from config.database import async_engine, async_session_factory
+from models.narcotic import NarcoticImageVector, NarcoticVectorProjection
+from services import vector_index_service
+
+
+async def run_migrate():
+    async with async_engine.begin() as conn:
+        await vector_index_service.migrate(conn)
+    print("✅ narcotic vector index migration applied")
+
+
+async def run_backfill(args):
+    async with async_session_factory() as db:
+        summary = await vector_index_service.backfill(
+            db,
+            method=args.method,
+            sample_size=args.sample_size,
+            batch_size=args.batch_size,
+            seed=args.seed,
+        )
+    print(
+        f"✅ projection #{summary['projection_id']} ({summary['method']}, "
+        f"{summary['sample_count']} samples) applied to {summary['updated']} vectors"
+    )
+
+
+async def run_status():
+    async with async_session_factory() as db:
+        total = (await db.execute(select(func.count(NarcoticImageVector.id)))).scalar_one()
+        indexed = (await db.execute(
+            select(func.count(NarcoticImageVector.id))
+            .join(NarcoticVectorProjection, NarcoticVectorProjection.id == NarcoticImageVector.projection_id)
+            .where(NarcoticVectorProjection.is_active.is_(True))
+        )).scalar_one()
+        projector = await vector_index_service.get_active_projector(db)
+    active = f"#{projector.projection_id}" if projector else "none"
+    print(f"vectors: {total}, indexed with active projection: {indexed}, active projection: {active}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Narcotic image vector index management")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate", help="Add search_vector column, projection table and HNSW index")
+
+    backfill_parser = subparsers.add_parser("backfill", help="Fit a projection and fill search_vector")
+    backfill_parser.add_argument("--method", choices=vector_index_service.PROJECTION_METHODS, default="auto")
+    backfill_parser.add_argument("--sample-size", type=int, default=4096)
+    backfill_parser.add_argument("--batch-size", type=int, default=256)
+    backfill_parser.add_argument("--seed", type=int, default=42)
+
+    subparsers.add_parser("status", help="Show how many vectors are indexed")
+
+    args = parser.parse_args()
+
+    # ไม่ต้อง echo SQL ที่มี vector ขนาดใหญ่
+    async_engine.echo = False
+
+    if args.command == "migrate":
+        asyncio.run(run_migrate())
+    elif args.command == "backfill":
+        asyncio.run(run_backfill(args))
+    else:
+        asyncio.run(run_status())
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,7 @@ from .narcotic import (
     NarcoticExampleImage,
     NarcoticChemicalCompound, 
     NarcoticImageVector, 
+    NarcoticVectorProjection,
     NarcoticPill
 )
 
@@ -41,7 +42,7 @@ __all__ = [
     'Exhibit',
     'ChemicalCompound', 'DrugForm', 'Narcotic', 
     'NarcoticExampleImage', 'NarcoticChemicalCompound',
-    'NarcoticImageVector', 'NarcoticPill',
+    'NarcoticImageVector', 'NarcoticVectorProjection', 'NarcoticPill',
     'Ammunition', 'Firearm', 'FirearmExampleImage', 'firearm_ammunitions',
     'User', 'UserPermission', 'Notification',
     'History'
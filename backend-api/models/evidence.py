@@ -10,7 +10,7 @@ class Evidence(Base):
     __tablename__ = 'evidence'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False)
+    case_id = Column(Integer, ForeignKey('cases.id', ondelete='CASCADE'), nullable=False, index=True)
     sequence_number = Column(Integer)
     quantity = Column(Integer)
     unit = Column(String(50))
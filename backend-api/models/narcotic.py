@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Numeric, Table, PrimaryKeyConstraint
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Numeric, Table, PrimaryKeyConstraint, Index, Boolean, DateTime, LargeBinary, func
 from sqlalchemy.orm import relationship
 from db.base import Base
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.dialects.postgresql import ARRAY
 
+# ขนาด vector เต็มที่ได้จาก AI service และขนาด vector แบบย่อที่ใช้ทำ HNSW index
+# (pgvector ทำ index ได้ไม่เกิน 2000 มิติ)
+IMAGE_VECTOR_DIM = 16000
+SEARCH_VECTOR_DIM = 1024
+
 class ChemicalCompound(Base):
     __tablename__ = "chemical_compounds"
     
@@ -75,12 +80,40 @@ class NarcoticImageVector(Base):
     id = Column(Integer, primary_key=True, index=True)
     narcotic_id = Column(Integer, ForeignKey("narcotics.id", ondelete="CASCADE"))
     image_id = Column(Integer, ForeignKey("narcotic_example_images.id", ondelete="CASCADE"))
-    image_vector = Column(Vector(16000))
+    image_vector = Column(Vector(IMAGE_VECTOR_DIM))
+    # vector แบบย่อ (projection ของ image_vector) สำหรับค้นหาผ่าน HNSW index
+    search_vector = Column(Vector(SEARCH_VECTOR_DIM), nullable=True)
+    projection_id = Column(Integer, ForeignKey("narcotic_vector_projections.id", ondelete="SET NULL"), nullable=True)
     
     # Relationships
     narcotic = relationship("Narcotic", back_populates="image_vectors")
     image = relationship("NarcoticExampleImage", back_populates="image_vectors")
 
+    __table_args__ = (
+        Index(
+            "ix_narcotics_image_vectors_search_vector_hnsw",
+            "search_vector",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"search_vector": "vector_cosine_ops"},
+        ),
+    )
+
+class NarcoticVectorProjection(Base):
+    """Projection ที่ใช้ย่อ image_vector ให้เป็น search_vector (fit จาก vector ที่เก็บไว้)"""
+    __tablename__ = "narcotic_vector_projections"
+
+    id = Column(Integer, primary_key=True, index=True)
+    method = Column(String(20), nullable=False)  # "pca" หรือ "random"
+    source_dim = Column(Integer, nullable=False)
+    target_dim = Column(Integer, nullable=False)
+    seed = Column(Integer, nullable=True)  # ใช้สร้าง random projection matrix ซ้ำได้
+    sample_count = Column(Integer, nullable=False, default=0)
+    mean = Column(LargeBinary, nullable=False)  # float32 (source_dim,)
+    components = Column(LargeBinary, nullable=True)  # float32 (source_dim, target_dim) สำหรับ pca
+    is_active = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, server_default=func.now())
+
 class NarcoticPill(Base):
     __tablename__ = "narcotics_pills"
     
@@ -126,6 +126,7 @@ class CaseListWithRelationshipsResponse(BaseModel):
     success: bool = True
     data: List[CaseWithRelationships]
     total: int
+    next_cursor: Optional[int] = Field(None, description="ส่งเป็น cursor เพื่อขอหน้าถัดไป (None = หน้าสุดท้าย)")
     message: Optional[str] = None
 
     class Config:
@@ -4,13 +4,15 @@ from models.case import Case
 from models.evidence import Evidence
 from models.defendant import Defendant
 from models.geography import Subdistrict, District, Province
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, select, distinct, false, true
 from datetime import datetime
 from config.database import get_db_session
-from services.evidence_service import EvidenceService
-from services.defendant_service import DefendantService
 import traceback
 
+# ค่าคงที่ของ summary (ตาราง cases ยังไม่มีคอลัมน์สถานะ/ประเภทคดี)
+CASE_STATUS_OPEN = 'open'
+CASE_TYPE_DRUG = 'drug'
+
 class CaseService:
     
     @staticmethod
@@ -363,191 +365,225 @@ class CaseService:
             db.close()
     
     @staticmethod
-    def get_cases_with_relationships(filters: Dict[str, Any] = None) -> Dict[str, Any]:
-        """ดึงรายการ Case พร้อมความสัมพันธ์ทั้งหมด โดยใช้ existing services"""
+    def _parse_filter_date(value: Optional[str]):
+        """แปลงวันที่ของ filter (YYYY-MM-DD) ค่าที่ผิดรูปแบบจะถูกข้ามเหมือนเดิม"""
+        if not value:
+            return None
         try:
-            print(f"🔍 Service received filters: {filters}")
-            
-            # ✅ เรียกใช้ existing service methods
-            print("🔍 Step 1: Getting cases...")
-            cases_result = CaseService.get_all_cases(0, 10000)
-            if not cases_result['success']:
-                print(f"❌ Failed to get cases: {cases_result['message']}")
-                return cases_result
-            
-            cases = cases_result['data']
-            print(f"🔍 Found {len(cases)} cases")
-            
-            print("🔍 Step 2: Getting evidences...")
-            evidences_result = EvidenceService.get_all_evidences(0, 50000)
-            if not evidences_result['success']:
-                print(f"❌ Failed to get evidences: {evidences_result['message']}")
-                evidences = []
-            else:
-                evidences = evidences_result['data']
-                print(f"🔍 Found {len(evidences)} evidences")
-            
-            print("🔍 Step 3: Getting defendants...")
-            defendants_result = DefendantService.get_all_defendants(0, 50000)
-            if not defendants_result['success']:
-                print(f"❌ Failed to get defendants: {defendants_result['message']}")
-                defendants = []
-            else:
-                defendants = defendants_result['data']
-                print(f"🔍 Found {len(defendants)} defendants")
-            
-            # ✅ สร้าง mapping สำหรับ performance
-            print("🔍 Step 4: Creating mappings...")
-            evidences_by_case = {}
-            for evidence in evidences:
-                case_id = evidence.get('case_id')
-                if case_id:
-                    if case_id not in evidences_by_case:
-                        evidences_by_case[case_id] = []
-                    evidences_by_case[case_id].append(evidence)
-            
-            defendants_by_id = {d.get('id'): d for d in defendants if d.get('id')}
-            
-            print(f"🔍 Evidences mapping: {len(evidences_by_case)} cases have evidences")
-            print(f"🔍 Defendants mapping: {len(defendants_by_id)} defendants available")
-            
-            # ✅ รวมข้อมูลเข้าด้วยกัน
-            print("🔍 Step 5: Combining data...")
-            enhanced_cases = []
-            
-            for case in cases:
-                try:
-                    case_id = case.get('id')
-                    case_evidences = evidences_by_case.get(case_id, [])
-                    
-                    # ✅ หา defendants ที่เกี่ยวข้องกับ case นี้
-                    case_defendants = []
-                    seen_defendant_ids = set()
-                    
-                    for evidence in case_evidences:
-                        defendant_id = evidence.get('defendant_id')
-                        if defendant_id and defendant_id not in seen_defendant_ids:
-                            defendant = defendants_by_id.get(defendant_id)
-                            if defendant:
-                                case_defendants.append(defendant)
-                                seen_defendant_ids.add(defendant_id)
-                    
-                    # ✅ **สำคัญ** - เพิ่มข้อมูล evidences และ defendants เข้าใน case
-                    case_copy = case.copy()  # สร้าง copy เพื่อไม่แก้ไข original
-                    case_copy['evidences'] = case_evidences
-                    case_copy['defendants'] = case_defendants
-                    
-                    # ✅ สร้าง summary
-                    case_copy['summary'] = {
-                        'evidence_count': len(case_evidences),
-                        'defendant_count': len(case_defendants),
-                        'drug_types': list(set([e.get('drug_type') for e in case_evidences if e.get('drug_type')])),
-                        'total_weight': sum([float(e.get('weight', 0) or 0) for e in case_evidences]),
-                        'status': 'open'
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _build_case_filters(filters: Dict[str, Any]) -> list:
+        """แปลง filters ของหน้า Drug Cases List เป็นเงื่อนไข SQL"""
+        conditions = []
+
+        search = (filters.get('search') or '').strip()
+        if search:
+            pattern = f'%{search}%'
+            defendant_match = select(Evidence.id).join(
+                Defendant, Evidence.defendant_id == Defendant.id
+            ).where(
+                Evidence.case_id == Case.id,
+                Defendant.fullname.ilike(pattern)
+            ).exists()
+            conditions.append(or_(
+                Case.case_id.ilike(pattern),
+                Case.seized_from.ilike(pattern),
+                Case.occurrence_place.ilike(pattern),
+                defendant_match
+            ))
+
+        drug_type = (filters.get('drug_type') or '').strip()
+        if drug_type:
+            conditions.append(select(Evidence.id).where(
+                Evidence.case_id == Case.id,
+                Evidence.drug_type.ilike(f'%{drug_type}%')
+            ).exists())
+
+        # คดีที่ไม่มีวันที่เกิดเหตุไม่ถูกตัดออกโดยช่วงวันที่ (เหมือนการกรองเดิม)
+        start_date = CaseService._parse_filter_date(filters.get('start_date'))
+        if start_date:
+            conditions.append(or_(Case.occurrence_date.is_(None), Case.occurrence_date >= start_date))
+
+        end_date = CaseService._parse_filter_date(filters.get('end_date'))
+        if end_date:
+            conditions.append(or_(Case.occurrence_date.is_(None), Case.occurrence_date <= end_date))
+
+        province = (filters.get('province') or '').strip()
+        if province:
+            conditions.append(Province.province_name.ilike(f'%{province}%'))
+
+        district = (filters.get('district') or '').strip()
+        if district:
+            conditions.append(District.district_name.ilike(f'%{district}%'))
+
+        # ตาราง cases ยังไม่มีคอลัมน์สถานะ/ประเภทคดี: ทุกคดีมีสถานะ CASE_STATUS_OPEN และเป็นคดียาเสพติด
+        case_status = (filters.get('status') or '').strip().lower()
+        if case_status and case_status not in ('all', CASE_STATUS_OPEN):
+            conditions.append(false())
+
+        case_type = (filters.get('case_type') or '').strip().lower()
+        if case_type and case_type not in ('all', CASE_TYPE_DRUG):
+            conditions.append(false())
+
+        return conditions
+
+    @staticmethod
+    def get_cases_with_relationships(
+        filters: Dict[str, Any] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        ดึงรายการ Case พร้อมความสัมพันธ์ทั้งหมด
+
+        กรองและสรุปข้อมูลใน SQL เดียว แบ่งหน้าแบบ keyset ด้วย id (เรียงจากใหม่ไปเก่า)
+        ส่ง next_cursor (id ของคดีสุดท้ายในหน้า) กลับไปเพื่อขอหน้าถัดไป
+        """
+        db: Session = get_db_session()
+
+        try:
+            conditions = CaseService._build_case_filters(filters or {})
+
+            # สรุปหลักฐานแบบ LATERAL: คำนวณเฉพาะคดีในหน้านี้ (ผ่าน index ของ case_id)
+            # ไม่ group ทั้งตาราง evidence ทุกครั้งที่ขอหน้า
+            summary = select(
+                func.count(Evidence.id).label('evidence_count'),
+                func.count(distinct(Evidence.defendant_id)).label('defendant_count'),
+                func.array_agg(distinct(Evidence.drug_type)).filter(
+                    Evidence.drug_type.isnot(None)
+                ).label('drug_types'),
+                func.coalesce(func.sum(Evidence.weight), 0).label('total_weight')
+            ).where(Evidence.case_id == Case.id).lateral('evidence_summary')
+
+            def with_geography(query):
+                return query.outerjoin(
+                    Subdistrict, Case.subdistrict == Subdistrict.id
+                ).outerjoin(
+                    District, Subdistrict.district_id == District.id
+                ).outerjoin(
+                    Province, District.province_id == Province.id
+                )
+
+            total = db.execute(
+                with_geography(select(func.count(Case.id)).select_from(Case)).where(*conditions)
+            ).scalar_one()
+
+            query = with_geography(
+                select(
+                    Case,
+                    Subdistrict.subdistrict_name,
+                    District.id.label('district_id'),
+                    District.district_name,
+                    Province.id.label('province_id'),
+                    Province.province_name,
+                    summary.c.evidence_count,
+                    summary.c.defendant_count,
+                    summary.c.drug_types,
+                    summary.c.total_weight
+                ).select_from(Case)
+            ).outerjoin(
+                summary, true()
+            ).where(*conditions)
+
+            if cursor is not None:
+                query = query.where(Case.id < cursor)
+            query = query.order_by(Case.id.desc())
+            if limit is not None:
+                query = query.limit(limit)
+
+            rows = db.execute(query).all()
+            case_ids = [row.Case.id for row in rows]
+
+            # โหลด evidences และ defendants เฉพาะคดีในหน้านี้
+            evidences_by_case: Dict[int, List[Dict[str, Any]]] = {case_id: [] for case_id in case_ids}
+            defendants_by_case: Dict[int, List[Dict[str, Any]]] = {case_id: [] for case_id in case_ids}
+
+            if case_ids:
+                evidences = db.execute(
+                    select(Evidence)
+                    .options(joinedload(Evidence.defendant))
+                    .where(Evidence.case_id.in_(case_ids))
+                    .order_by(Evidence.case_id, Evidence.sequence_number, Evidence.id)
+                ).scalars().all()
+
+                defendant_ids = {e.defendant_id for e in evidences if e.defendant_id}
+                defendant_evidence_counts = {}
+                if defendant_ids:
+                    defendant_evidence_counts = dict(db.execute(
+                        select(Evidence.defendant_id, func.count(Evidence.id))
+                        .where(Evidence.defendant_id.in_(defendant_ids))
+                        .group_by(Evidence.defendant_id)
+                    ).all())
+
+                seen_defendants = set()
+                for evidence in evidences:
+                    evidences_by_case[evidence.case_id].append(evidence.to_dict())
+
+                    defendant = evidence.defendant
+                    if defendant and (evidence.case_id, defendant.id) not in seen_defendants:
+                        seen_defendants.add((evidence.case_id, defendant.id))
+                        defendants_by_case[evidence.case_id].append({
+                            'id': defendant.id,
+                            'fullname': defendant.fullname,
+                            'evidence_count': defendant_evidence_counts.get(defendant.id, 0)
+                        })
+
+            cases = []
+            for row in rows:
+                case = row.Case
+                evidence_count = row.evidence_count or 0
+                cases.append({
+                    'id': case.id,
+                    'case_id': case.case_id,
+                    'seized_from': case.seized_from,
+                    'occurrence_date': case.occurrence_date.isoformat() if case.occurrence_date else None,
+                    'occurrence_place': case.occurrence_place,
+                    'house_number': case.house_number,
+                    'moo': case.moo,
+                    'soi': case.soi,
+                    'street': case.street,
+                    'subdistrict_id': case.subdistrict,
+                    'subdistrict_name': row.subdistrict_name,
+                    'district_id': row.district_id,
+                    'district_name': row.district_name,
+                    'province_id': row.province_id,
+                    'province_name': row.province_name,
+                    'inspection_number': case.inspection_number,
+                    'created_at': case.created_at.isoformat() if case.created_at else None,
+                    'updated_at': case.updated_at.isoformat() if case.updated_at else None,
+                    'evidence_count': evidence_count,
+                    'evidences': evidences_by_case[case.id],
+                    'defendants': defendants_by_case[case.id],
+                    'summary': {
+                        'evidence_count': evidence_count,
+                        'defendant_count': row.defendant_count or 0,
+                        'drug_types': list(row.drug_types or []),
+                        'total_weight': float(row.total_weight or 0),
+                        'status': CASE_STATUS_OPEN
                     }
-                    
-                    print(f"✅ Case {case.get('case_id')}: {len(case_evidences)} evidences, {len(case_defendants)} defendants")
-                    enhanced_cases.append(case_copy)
-                    
-                except Exception as case_error:
-                    print(f"❌ Error processing case {case.get('id', 'unknown')}: {case_error}")
-                    # เพิ่ม case ต้นฉบับถ้า error
-                    enhanced_cases.append(case)
-                    continue
-            
-            print(f"🔍 Step 6: Enhanced {len(enhanced_cases)} cases")
-            
-            # ✅ Apply filters
-            if filters:
-                print("🔍 Step 7: Applying filters...")
-                filtered_cases = []
-                for case in enhanced_cases:
-                    should_include = True
-                    
-                    # Search filter
-                    if filters.get('search'):
-                        search_term = filters['search'].lower()
-                        searchable_text = f"{case.get('case_id', '')} {case.get('seized_from', '')} {case.get('occurrence_place', '')}".lower()
-                        
-                        # เพิ่ม defendant names ใน search
-                        for defendant in case.get('defendants', []):
-                            searchable_text += f" {defendant.get('fullname', '')}".lower()
-                        
-                        if search_term not in searchable_text:
-                            should_include = False
-                    
-                    # Drug type filter
-                    if should_include and filters.get('drug_type'):
-                        drug_type = filters['drug_type'].lower()
-                        case_drug_types = [e.get('drug_type', '').lower() for e in case.get('evidences', [])]
-                        if not any(drug_type in dt for dt in case_drug_types if dt):
-                            should_include = False
-                    
-                    # Date filters
-                    if should_include and filters.get('start_date'):
-                        try:
-                            start_date = datetime.strptime(filters['start_date'], '%Y-%m-%d').date()
-                            case_date_str = case.get('occurrence_date')
-                            if case_date_str:
-                                case_date = datetime.strptime(case_date_str, '%Y-%m-%d').date()
-                                if case_date < start_date:
-                                    should_include = False
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    if should_include and filters.get('end_date'):
-                        try:
-                            end_date = datetime.strptime(filters['end_date'], '%Y-%m-%d').date()
-                            case_date_str = case.get('occurrence_date')
-                            if case_date_str:
-                                case_date = datetime.strptime(case_date_str, '%Y-%m-%d').date()
-                                if case_date > end_date:
-                                    should_include = False
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # Province/District filters
-                    if should_include and filters.get('province'):
-                        province_name = case.get('province_name', '').lower()
-                        if filters['province'].lower() not in province_name:
-                            should_include = False
-                    
-                    if should_include and filters.get('district'):
-                        district_name = case.get('district_name', '').lower()
-                        if filters['district'].lower() not in district_name:
-                            should_include = False
-                    
-                    if should_include:
-                        filtered_cases.append(case)
-                
-                enhanced_cases = filtered_cases
-                print(f"🔍 After filtering: {len(enhanced_cases)} cases")
-            
-            print(f"✅ Returning {len(enhanced_cases)} cases with relationships")
-            
-            # ✅ Debug: แสดง sample structure
-            if enhanced_cases:
-                sample = enhanced_cases[0]
-                print(f"📋 Sample structure keys: {list(sample.keys())}")
-                print(f"📋 Has evidences: {'evidences' in sample}")
-                print(f"📋 Has defendants: {'defendants' in sample}")
-                if 'evidences' in sample:
-                    print(f"📋 Evidences count: {len(sample['evidences'])}")
-                if 'defendants' in sample:
-                    print(f"📋 Defendants count: {len(sample['defendants'])}")
-            
+                })
+
+            next_cursor = None
+            if limit is not None and len(rows) == limit:
+                next_cursor = case_ids[-1]
+
             return {
                 'success': True,
-                'data': enhanced_cases,
-                'total': len(enhanced_cases)
+                'data': cases,
+                'total': total,
+                'next_cursor': next_cursor
             }
-            
+
         except Exception as e:
             print(f"❌ Error in get_cases_with_relationships: {str(e)}")
-            import traceback
             print(f"❌ Traceback: {traceback.format_exc()}")
             return {
                 'success': False,
                 'error': str(e),
                 'message': 'Failed to fetch cases with relationships'
-            }
\ No newline at end of file
+            }
+        finally:
+            db.close()
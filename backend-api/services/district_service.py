@@ -1,9 +1,9 @@
-import json
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, case
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, defer
 from typing import List, Dict, Any, Optional
+from core.geojson import geojson_column, parse_geojson
 from models.geography import District, Province
 
 # ✅ ปิด SQLAlchemy logs เฉพาะ district service
@@ -14,12 +14,21 @@ logging.getLogger('sqlalchemy.dialects').setLevel(logging.ERROR)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def get_districts(db: AsyncSession, province_id: Optional[int] = None) -> List[Dict[str, Any]]:
+async def get_districts(
+    db: AsyncSession,
+    province_id: Optional[int] = None,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     ดึงข้อมูลอำเภอตามจังหวัดหรือทั้งหมด (ORM)
     """
     try:
-        query = select(District).options(
+        query = select(
+            District,
+            geojson_column(District.geom, simplify, precision)
+        ).options(
+            defer(District.geom),
             selectinload(District.province)
         )
         
@@ -29,23 +38,11 @@ async def get_districts(db: AsyncSession, province_id: Optional[int] = None) ->
         query = query.order_by(District.province_id, District.district_name)
         
         result = await db.execute(query)
-        districts = result.scalars().all()
         
         districts_data = []
-        for district in districts:
+        for district, geojson in result.all():
             district_dict = district.to_dict()
-            
-            # ดึง geometry แยก
-            if district.geom:
-                geom_query = select(func.ST_AsGeoJSON(District.geom)).where(District.id == district.id)
-                geom_result = await db.execute(geom_query)
-                geom_json = geom_result.scalar()
-                if geom_json:
-                    try:
-                        district_dict["geometry"] = json.loads(geom_json)
-                    except json.JSONDecodeError:
-                        district_dict["geometry"] = None
-            
+            district_dict["geometry"] = parse_geojson(geojson)
             districts_data.append(district_dict)
         
         logger.info(f"Fetched {len(districts_data)} districts")
@@ -55,33 +52,33 @@ async def get_districts(db: AsyncSession, province_id: Optional[int] = None) ->
         logger.error(f"Error fetching districts: {str(e)}", exc_info=True)
         return []
 
-async def get_district_by_id(db: AsyncSession, district_id: int) -> Dict[str, Any]:
+async def get_district_by_id(
+    db: AsyncSession,
+    district_id: int,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> Dict[str, Any]:
     """
     ดึงข้อมูลอำเภอตาม ID (ORM)
     """
     try:
-        query = select(District).options(
+        query = select(
+            District,
+            geojson_column(District.geom, simplify, precision)
+        ).options(
+            defer(District.geom),
             selectinload(District.province)
         ).where(District.id == district_id)
         
         result = await db.execute(query)
-        district = result.scalar_one_or_none()
+        row = result.first()
         
-        if not district:
+        if not row:
             return None
             
+        district, geojson = row
         district_dict = district.to_dict()
-        
-        # ดึง geometry แยก
-        if district.geom:
-            geom_query = select(func.ST_AsGeoJSON(District.geom)).where(District.id == district.id)
-            geom_result = await db.execute(geom_query)
-            geom_json = geom_result.scalar()
-            if geom_json:
-                try:
-                    district_dict["geometry"] = json.loads(geom_json)
-                except json.JSONDecodeError:
-                    district_dict["geometry"] = None
+        district_dict["geometry"] = parse_geojson(geojson)
         
         return district_dict
         
@@ -92,14 +89,20 @@ async def get_district_by_id(db: AsyncSession, district_id: int) -> Dict[str, An
 async def search_districts_by_name(
     db: AsyncSession, 
     search_term: str,
-    province_id: Optional[int] = None
+    province_id: Optional[int] = None,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     ค้นหาอำเภอจากชื่อ (ORM)
     """
     try:
         # สร้าง query ด้วย ORM พร้อม join province
-        query = select(District).options(
+        query = select(
+            District,
+            geojson_column(District.geom, simplify, precision)
+        ).options(
+            defer(District.geom),
             selectinload(District.province)
         ).where(
             func.lower(District.district_name).like(func.lower(f"%{search_term}%"))
@@ -121,24 +124,12 @@ async def search_districts_by_name(
         )
         
         result = await db.execute(query)
-        districts = result.scalars().all()
         
         # แปลงเป็น dict และเพิ่ม geometry
         districts_data = []
-        for district in districts:
+        for district, geojson in result.all():
             district_dict = district.to_dict()
-            
-            # ดึง geometry แยก
-            if district.geom:
-                geom_query = select(func.ST_AsGeoJSON(District.geom)).where(District.id == district.id)
-                geom_result = await db.execute(geom_query)
-                geom_json = geom_result.scalar()
-                if geom_json:
-                    try:
-                        district_dict["geometry"] = json.loads(geom_json)
-                    except json.JSONDecodeError:
-                        district_dict["geometry"] = None
-            
+            district_dict["geometry"] = parse_geojson(geojson)
             districts_data.append(district_dict)
         
         logger.info(f"Found {len(districts_data)} districts for search term: {search_term}")
@@ -0,0 +1,263 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from schemas.geography import Province as ProvinceSchema, District as DistrictSchema, Subdistrict as SubdistrictSchema
+from services.province_service import get_provinces
+from services.district_service import get_districts
+from services.subdistrict_service import get_subdistricts
+
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = "application/json"
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+# SRID ของคอลัมน์ geom ในตาราง provinces/districts/subdistricts
+GEOGRAPHY_SRID = 4326
+MAX_TILE_ZOOM = 22
+
+# layer ใน vector tile และ zoom ต่ำสุดที่แสดง layer นั้น
+TILE_LAYERS = {
+    "provinces": {"table": "provinces", "name_column": "province_name", "min_zoom": 0},
+    "districts": {"table": "districts", "name_column": "district_name", "min_zoom": 7},
+    "subdistricts": {"table": "subdistricts", "name_column": "subdistrict_name", "min_zoom": 10},
+}
+
+
+class CachedPayload:
+    """ข้อมูลที่ serialize และ gzip ไว้แล้ว พร้อม ETag"""
+
+    __slots__ = ("body", "etag", "count", "media_type")
+
+    def __init__(self, raw: bytes, count: int, media_type: str):
+        self.body = gzip.compress(raw, compresslevel=6)
+        self.etag = '"' + hashlib.sha1(raw).hexdigest() + '"'
+        self.count = count
+        self.media_type = media_type
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+
+class GeographyCache:
+    """
+    LRU cache ของ payload ข้อมูลภูมิศาสตร์ (จำกัดตามขนาด byte)
+    สร้าง payload ครั้งเดียวต่อ key แม้มี request พร้อมกันหลายตัว
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, CachedPayload]" = OrderedDict()
+        # lock ต่อ key ที่กำลังสร้าง และจำนวน request ที่ใช้ lock นั้นอยู่ (ลบเมื่อไม่มีใครรอแล้ว)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        builder: Callable[[], Awaitable[Tuple[bytes, int]]],
+        media_type: str = JSON_MEDIA_TYPE,
+        cache_empty: bool = False,
+    ) -> CachedPayload:
+        payload = self._get(key)
+        if payload is not None:
+            return payload
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                payload = self._get(key)
+                if payload is not None:
+                    return payload
+
+                self.misses += 1
+                raw, count = await builder()
+                payload = CachedPayload(raw, count, media_type)
+                # service เดิมคืน list ว่างเมื่อเกิด error จึงไม่ cache ผลลัพธ์ว่าง (ยกเว้น tile ว่าง)
+                if count or cache_empty:
+                    self._put(key, payload)
+                return payload
+        finally:
+            # ลบ lock เมื่อไม่มี request อื่นรออยู่ (รวมกรณี builder ล้มเหลว)
+            # request ที่รออยู่จึงสร้างต่อกันทีละตัวด้วย lock เดิม ไม่สร้างพร้อมกัน
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    def _get(self, key: Hashable) -> Optional[CachedPayload]:
+        payload = self._entries.get(key)
+        if payload is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return payload
+
+    def _put(self, key: Hashable, payload: CachedPayload) -> None:
+        if payload.size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = payload
+        self._bytes += payload.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+geography_cache = GeographyCache(settings.GEOGRAPHY_CACHE_MAX_BYTES)
+
+
+def cached_response(request: Request, payload: CachedPayload, max_age: int) -> Response:
+    """สร้าง response จาก payload ที่ cache ไว้ รองรับ If-None-Match และ gzip"""
+    headers = {
+        "ETag": payload.etag,
+        "Cache-Control": f"public, max-age={max_age}",
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if payload.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload.body, media_type=payload.media_type, headers=headers)
+
+    return Response(content=gzip.decompress(payload.body), media_type=payload.media_type, headers=headers)
+
+
+def _serialize(rows, schema) -> Tuple[bytes, int]:
+    # ผ่าน schema เพื่อให้ได้ field เดียวกับ response_model ของ endpoint
+    data = [schema.model_validate(row).model_dump() for row in rows]
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return raw, len(data)
+
+
+async def get_cached_provinces(
+    db: AsyncSession,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> CachedPayload:
+    async def build():
+        return _serialize(await get_provinces(db, simplify, precision), ProvinceSchema)
+
+    return await geography_cache.get_or_build(("provinces", simplify, precision), build)
+
+
+async def get_cached_districts(
+    db: AsyncSession,
+    province_id: Optional[int] = None,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> CachedPayload:
+    async def build():
+        return _serialize(await get_districts(db, province_id, simplify, precision), DistrictSchema)
+
+    return await geography_cache.get_or_build(("districts", province_id, simplify, precision), build)
+
+
+async def get_cached_subdistricts(
+    db: AsyncSession,
+    district_id: Optional[int] = None,
+    province_id: Optional[int] = None,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> CachedPayload:
+    async def build():
+        return _serialize(
+            await get_subdistricts(db, district_id, province_id, simplify, precision),
+            SubdistrictSchema
+        )
+
+    return await geography_cache.get_or_build(
+        ("subdistricts", district_id, province_id, simplify, precision), build
+    )
+
+
+def tile_layers_for_zoom(z: int, layers: Optional[list] = None) -> list:
+    """layer ที่แสดงได้ที่ zoom นี้ (กรองตามที่ขอถ้าระบุ)"""
+    names = layers or list(TILE_LAYERS.keys())
+    return [name for name in names if name in TILE_LAYERS and z >= TILE_LAYERS[name]["min_zoom"]]
+
+
+async def build_tile(db: AsyncSession, z: int, x: int, y: int, layers: list) -> bytes:
+    """สร้าง Mapbox Vector Tile จากคอลัมน์ geom ด้วย ST_AsMVT"""
+    tile = b""
+    for name in layers:
+        layer = TILE_LAYERS[name]
+        query = text(f"""
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+            ),
+            features AS (
+                SELECT
+                    g.id,
+                    g.{layer['name_column']} AS name,
+                    ST_AsMVTGeom(ST_Transform(g.geom, 3857), bounds.geom, 4096, 64, true) AS geom
+                FROM {layer['table']} g, bounds
+                WHERE g.geom && ST_Transform(bounds.geom, {GEOGRAPHY_SRID})
+            )
+            SELECT ST_AsMVT(features, :layer, 4096, 'geom')
+            FROM features
+            WHERE geom IS NOT NULL
+        """)
+        result = await db.execute(query, {"z": z, "x": x, "y": y, "layer": name})
+        layer_tile = result.scalar()
+        if layer_tile:
+            # MVT layer ต่อกันเป็น tile เดียวได้โดยตรง
+            tile += bytes(layer_tile)
+    return tile
+
+
+async def get_cached_tile(
+    db: AsyncSession,
+    z: int,
+    x: int,
+    y: int,
+    layers: Optional[list] = None
+) -> CachedPayload:
+    tile_layers = tile_layers_for_zoom(z, layers)
+
+    async def build():
+        tile = await build_tile(db, z, x, y, tile_layers)
+        return tile, len(tile)
+
+    return await geography_cache.get_or_build(
+        ("tile", z, x, y, tuple(tile_layers)), build, media_type=MVT_MEDIA_TYPE, cache_empty=True
+    )
+
+
+async def warm_up_geography_cache(db: AsyncSession) -> None:
+    """Serialize ข้อมูลทุกระดับล่วงหน้า (เรียกตอน startup)"""
+    await get_cached_provinces(db)
+    await get_cached_districts(db)
+    await get_cached_subdistricts(db)
+    logger.info(f"Geography cache warmed up: {geography_cache.stats()}")
@@ -9,111 +9,105 @@ import re  # เพิ่มบรรทัดนี้ที่ด้านบ
 from models import history as models
 from models.exhibit import Exhibit
 from models.user import User
+from models.geography import Province, District, Subdistrict
 from schemas import history as schemas
 from services.image_service import upload_image_to_cloudinary
-from config.database import get_db_connection
 
-async def get_location_names(subdistrict_id: Optional[int]) -> Dict[str, str]:
-    """Get location names from subdistrict ID using direct PostgreSQL connection"""
-    location_info = {
-        "province_name": None,
-        "district_name": None,
-        "subdistrict_name": None
-    }
-    
-    if not subdistrict_id:
-        return location_info
+EMPTY_LOCATION_NAMES = {
+    "province_name": None,
+    "district_name": None,
+    "subdistrict_name": None
+}
+
+async def get_location_names_map(db: AsyncSession, subdistrict_ids) -> Dict[int, Dict[str, str]]:
+    """Resolve location names for many subdistrict IDs in one joined query"""
+    ids = {subdistrict_id for subdistrict_id in subdistrict_ids if subdistrict_id}
+    if not ids:
+        return {}
+    
+    stmt = select(
+        Subdistrict.id,
+        Subdistrict.subdistrict_name,
+        District.district_name,
+        Province.province_name
+    ).join(
+        District, Subdistrict.district_id == District.id
+    ).join(
+        Province, District.province_id == Province.id
+    ).where(Subdistrict.id.in_(ids))
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get subdistrict, district and province info
-        cursor.execute('''
-            SELECT s.subdistrict_name, d.district_name, p.province_name
-            FROM subdistricts s
-            JOIN districts d ON s.district_id = d.id
-            JOIN provinces p ON d.province_id = p.id
-            WHERE s.id = %s
-        ''', (subdistrict_id,))
-        
-        result = cursor.fetchone()
-        if result:
-            location_info["subdistrict_name"] = result[0]
-            location_info["district_name"] = result[1]
-            location_info["province_name"] = result[2]
-        
-        cursor.close()
-        conn.close()
-        
+        result = await db.execute(stmt)
     except Exception as e:
         print(f"Error fetching location names: {e}")
+        return {}
     
-    return location_info
-
-async def get_user_names(discovered_by: Optional[str], modified_by: Optional[str]) -> Dict[str, str]:
-    """Get user names from user IDs using direct PostgreSQL connection"""
-    user_info = {
-        "discoverer_name": None,
-        "modifier_name": None
+    return {
+        row.id: {
+            "province_name": row.province_name,
+            "district_name": row.district_name,
+            "subdistrict_name": row.subdistrict_name
+        }
+        for row in result.all()
     }
+
+async def get_user_names_map(db: AsyncSession, user_ids) -> Dict[str, str]:
+    """Resolve display names for many user IDs in one query"""
+    ids = {user_id for user_id in user_ids if user_id}
+    if not ids:
+        return {}
+    
+    stmt = select(User.user_id, User.firstname, User.lastname).where(User.user_id.in_(ids))
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get discoverer name
-        if discovered_by:
-            cursor.execute('SELECT name FROM users WHERE user_id = %s', (discovered_by,))
-            result = cursor.fetchone()
-            if result:
-                user_info["discoverer_name"] = result[0]
-        
-        # Get modifier name
-        if modified_by:
-            cursor.execute('SELECT name FROM users WHERE user_id = %s', (modified_by,))
-            result = cursor.fetchone()
-            if result:
-                user_info["modifier_name"] = result[0]
-        
-        cursor.close()
-        conn.close()
-        
+        result = await db.execute(stmt)
     except Exception as e:
         print(f"Error fetching user names: {e}")
+        return {}
     
-    return user_info
+    return {row.user_id: f"{row.firstname} {row.lastname}" for row in result.all()}
 
-async def get_user_names_async(db: AsyncSession, discovered_by: Optional[str], modified_by: Optional[str]) -> Dict[str, str]:
-    """Get user names from user IDs using SQLAlchemy async session"""
-    user_info = {
-        "discoverer_name": None,
-        "modifier_name": None
-    }
+class HistoryEnrichment:
+    """
+    Location and user names for a page of history records,
+    resolved with one batched query each instead of one lookup per row
+    """
     
-    try:
-        # Get discoverer name
-        if discovered_by:
-            discoverer_stmt = select(User.firstname, User.lastname).where(User.user_id == discovered_by)
-            discoverer_result = await db.execute(discoverer_stmt)
-            discoverer_data = discoverer_result.first()
-            
-            if discoverer_data:
-                user_info["discoverer_name"] = f"{discoverer_data[0]} {discoverer_data[1]}"
-        
-        # Get modifier name
-        if modified_by:
-            modifier_stmt = select(User.firstname, User.lastname).where(User.user_id == modified_by)
-            modifier_result = await db.execute(modifier_stmt)
-            modifier_data = modifier_result.first()
-            
-            if modifier_data:
-                user_info["modifier_name"] = f"{modifier_data[0]} {modifier_data[1]}"
-        
-    except Exception as e:
-        print(f"Error fetching user names: {e}")
+    def __init__(self, locations: Dict[int, Dict[str, str]], users: Dict[str, str]):
+        self.locations = locations
+        self.users = users
+    
+    @classmethod
+    async def load(cls, db: AsyncSession, histories) -> "HistoryEnrichment":
+        histories = list(histories)
+        locations = await get_location_names_map(db, (h.subdistrict_id for h in histories))
+        users = await get_user_names_map(
+            db,
+            [h.discovered_by for h in histories] + [h.modified_by for h in histories]
+        )
+        return cls(locations, users)
+    
+    def location_names(self, subdistrict_id: Optional[int]) -> Dict[str, str]:
+        return dict(self.locations.get(subdistrict_id, EMPTY_LOCATION_NAMES))
     
-    return user_info
+    def user_names(self, discovered_by: Optional[str], modified_by: Optional[str]) -> Dict[str, str]:
+        return {
+            "discoverer_name": self.users.get(discovered_by),
+            "modifier_name": self.users.get(modified_by)
+        }
+
+async def get_location_names(db: AsyncSession, subdistrict_id: Optional[int]) -> Dict[str, str]:
+    """Get location names from subdistrict ID"""
+    locations = await get_location_names_map(db, [subdistrict_id])
+    return dict(locations.get(subdistrict_id, EMPTY_LOCATION_NAMES))
+
+async def get_user_names(db: AsyncSession, discovered_by: Optional[str], modified_by: Optional[str]) -> Dict[str, str]:
+    """Get user names from user IDs"""
+    users = await get_user_names_map(db, [discovered_by, modified_by])
+    return {
+        "discoverer_name": users.get(discovered_by),
+        "modifier_name": users.get(modified_by)
+    }
 
 async def get_all_histories(db: AsyncSession, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
     """Get all history records with exhibit data and location names"""
@@ -134,6 +128,9 @@ async def get_all_histories(db: AsyncSession, user_id: Optional[int] = None) ->
     histories = result.unique().all()
     
     enhanced_histories = []
+    # Resolve location and user names for the whole page at once
+    enrichment = await HistoryEnrichment.load(db, (h for h, _ in histories))
+    
     for history, location_wkt in histories:
         # Convert ORM object to dict
         history_dict = {c.name: getattr(history, c.name) for c in history.__table__.columns}
@@ -189,10 +186,10 @@ async def get_all_histories(db: AsyncSession, user_id: Optional[int] = None) ->
             history_dict['exhibit'] = exhibit_dict
         
         # Get location names
-        location_names = await get_location_names(history.subdistrict_id)
+        location_names = enrichment.location_names(history.subdistrict_id)
         
         # Get user names
-        user_names = await get_user_names(history.discovered_by, history.modified_by)
+        user_names = enrichment.user_names(history.discovered_by, history.modified_by)
         
         # Merge additional info into history dict
         history_dict.update(location_names)
@@ -271,10 +268,10 @@ async def get_history_by_id(db: AsyncSession, history_id: int) -> Dict[str, Any]
         history_dict['exhibit'] = exhibit_dict
     
     # Get location names
-    location_names = await get_location_names(history.subdistrict_id)
+    location_names = await get_location_names(db, history.subdistrict_id)
     
     # Get user names
-    user_names = await get_user_names(history.discovered_by, history.modified_by)
+    user_names = await get_user_names(db, history.discovered_by, history.modified_by)
     
     # Merge additional info into history dict
     history_dict.update(location_names)
@@ -444,6 +441,9 @@ async def get_histories_by_exhibit_id(db: AsyncSession, exhibit_id: int) -> List
         return []
     
     enhanced_histories = []
+    # Resolve location and user names for the whole page at once
+    enrichment = await HistoryEnrichment.load(db, (h for h, _ in histories))
+    
     for history, location_wkt in histories:
         # Convert ORM object to dict
         history_dict = {c.name: getattr(history, c.name) for c in history.__table__.columns}
@@ -499,10 +499,10 @@ async def get_histories_by_exhibit_id(db: AsyncSession, exhibit_id: int) -> List
             history_dict['exhibit'] = exhibit_dict
         
         # Get location names
-        location_names = await get_location_names(history.subdistrict_id)
+        location_names = enrichment.location_names(history.subdistrict_id)
         
         # Get user names
-        user_names = await get_user_names(history.discovered_by, history.modified_by)
+        user_names = enrichment.user_names(history.discovered_by, history.modified_by)
         
         # Merge additional info into history dict
         history_dict.update(location_names)
@@ -526,6 +526,9 @@ async def get_unknown_firearms(db: AsyncSession) -> List[Dict[str, Any]]:
     histories = result.unique().all()
     
     unknown_firearms = []
+    # Resolve location and user names for the whole page at once
+    enrichment = await HistoryEnrichment.load(db, (h for h, _ in histories))
+    
     for history, location_wkt in histories:
         # สร้าง dict จาก ORM object
         history_dict = {c.name: getattr(history, c.name) for c in history.__table__.columns}
@@ -563,11 +566,11 @@ async def get_unknown_firearms(db: AsyncSession) -> List[Dict[str, Any]]:
             }
         
         # เพิ่มข้อมูลตำแหน่ง
-        location_names = await get_location_names(history.subdistrict_id)
+        location_names = enrichment.location_names(history.subdistrict_id)
         history_dict.update(location_names)
         
         # เพิ่มข้อมูลผู้ใช้งาน
-        user_names = await get_user_names(history.discovered_by, history.modified_by)
+        user_names = enrichment.user_names(history.discovered_by, history.modified_by)
         history_dict.update(user_names)
         
         unknown_firearms.append(history_dict)
@@ -708,6 +711,9 @@ async def get_histories_by_exhibit_and_user(db: AsyncSession, exhibit_id: int, u
             return []
         
         enhanced_histories = []
+        # Resolve location and user names for the whole page at once
+        enrichment = await HistoryEnrichment.load(db, (h for h, _ in histories))
+        
         for history, location_wkt in histories:
             # แทนที่จะใช้ format_history_with_location_names ให้ใช้โค้ดที่คล้ายกับใน get_histories_by_exhibit_id
             # สร้าง dictionary จาก ORM object
@@ -761,10 +767,10 @@ async def get_histories_by_exhibit_and_user(db: AsyncSession, exhibit_id: int, u
                 history_dict['exhibit'] = exhibit_dict
             
             # Get location names
-            location_names = await get_location_names(history.subdistrict_id)
+            location_names = enrichment.location_names(history.subdistrict_id)
             
             # Get user names
-            user_names = await get_user_names(history.discovered_by, history.modified_by)
+            user_names = enrichment.user_names(history.discovered_by, history.modified_by)
             
             # Merge additional info into history dict
             history_dict.update(location_names)
@@ -852,6 +858,9 @@ async def get_firearm_histories(db: AsyncSession) -> List[Dict[str, Any]]:
     histories = result.unique().all()
     
     enhanced_histories = []
+    # Resolve location and user names for the whole page at once
+    enrichment = await HistoryEnrichment.load(db, (h for h, _ in histories))
+    
     for history, location_wkt in histories:
         # Convert ORM object to dict
         history_dict = {c.name: getattr(history, c.name) for c in history.__table__.columns}
@@ -900,10 +909,10 @@ async def get_firearm_histories(db: AsyncSession) -> List[Dict[str, Any]]:
             history_dict['exhibit'] = exhibit_dict
         
         # Get location names
-        location_names = await get_location_names(history.subdistrict_id)
+        location_names = enrichment.location_names(history.subdistrict_id)
         
         # Get user names
-        user_names = await get_user_names(history.discovered_by, history.modified_by)
+        user_names = enrichment.user_names(history.discovered_by, history.modified_by)
         
         # Merge additional info into history dict
         history_dict.update(location_names)
@@ -984,10 +993,10 @@ async def get_firearm_history_by_id(db: AsyncSession, history_id: int) -> Option
         history_dict['exhibit'] = exhibit_dict
     
     # Get location names
-    location_names = await get_location_names(history.subdistrict_id)
+    location_names = await get_location_names(db, history.subdistrict_id)
     
     # Get user names ด้วย discovered_by และ modified_by ที่เป็น user_id
-    user_names = await get_user_names_async(db, history.discovered_by, history.modified_by)
+    user_names = await get_user_names(db, history.discovered_by, history.modified_by)
     
     # Merge additional info into history dict
     history_dict.update(location_names)
@@ -1010,6 +1019,9 @@ async def get_narcotic_histories(db: AsyncSession) -> List[Dict[str, Any]]:
     histories = result.unique().all()
     
     enhanced_histories = []
+    # Resolve location and user names for the whole page at once
+    enrichment = await HistoryEnrichment.load(db, (h for h, _ in histories))
+    
     for history, location_wkt in histories:
         # Process location data
         latitude, longitude = None, None
@@ -1024,10 +1036,10 @@ async def get_narcotic_histories(db: AsyncSession) -> List[Dict[str, Any]]:
                 print(f"Error parsing location: {e}")
         
         # Get location names
-        location_info = await get_location_names(history.subdistrict_id)
+        location_info = enrichment.location_names(history.subdistrict_id)
         
         # Get user names
-        user_info = await get_user_names_async(db, history.discovered_by, history.modified_by)
+        user_info = enrichment.user_names(history.discovered_by, history.modified_by)
         
         # Format exhibit data with narcotic information
         exhibit_dict = None
@@ -1119,10 +1131,10 @@ async def get_narcotic_history_by_id(db: AsyncSession, history_id: int) -> Optio
             print(f"Error parsing location: {e}")
     
     # Get location names
-    location_info = await get_location_names(history.subdistrict_id)
+    location_info = await get_location_names(db, history.subdistrict_id)
     
     # Get user names
-    user_info = await get_user_names_async(db, history.discovered_by, history.modified_by)
+    user_info = await get_user_names(db, history.discovered_by, history.modified_by)
     
     # Format exhibit data with narcotic information
     exhibit_dict = None
@@ -2,7 +2,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from sqlalchemy import update, delete, or_, text
+from sqlalchemy import update, delete, or_
 from decimal import Decimal
 
 from models.narcotic import (
@@ -21,6 +21,7 @@ from schemas.narcotic import (
     NarcoticPillBase,
     NarcoticChemicalCompoundBase
 )
+from services import vector_index_service
 
 
 class NarcoticService:
@@ -260,10 +261,13 @@ class NarcoticService:
     @staticmethod
     async def add_image_vector(db: AsyncSession, narcotic_id: int, image_id: int, vector_data: List[float]) -> NarcoticImageVector:
         """Add a new image vector"""
+        projection = await vector_index_service.project_vector(db, vector_data)
         db_vector = NarcoticImageVector(
             narcotic_id=narcotic_id,
             image_id=image_id,
-            image_vector=vector_data
+            image_vector=vector_data,
+            search_vector=projection["search_vector"],
+            projection_id=projection["projection_id"]
         )
         db.add(db_vector)
         await db.commit()
@@ -291,7 +295,10 @@ class NarcoticService:
         result = await db.execute(select(NarcoticImageVector).filter(NarcoticImageVector.id == vector_id))
         db_vector = result.scalars().first()
         if db_vector:
+            projection = await vector_index_service.project_vector(db, vector_data)
             db_vector.image_vector = vector_data
+            db_vector.search_vector = projection["search_vector"]
+            db_vector.projection_id = projection["projection_id"]
             await db.commit()
             await db.refresh(db_vector)
         return db_vector
@@ -355,38 +362,19 @@ class NarcoticService:
         return False
     
     @staticmethod
-    async def search_similar_narcotics(db: AsyncSession, vector_str: str, top_k: int = 10):
-        """Search for narcotics with similar image vectors"""
-        # ลบเงื่อนไข WHERE ออกเพื่อดูทุกรายการ (เปลี่ยนแปลงชั่วคราวเพื่อการทดสอบ)
-        query = text(f"""
-            WITH query_vector AS (
-                SELECT '{vector_str}'::vector AS v
-            )
-            SELECT 
-                n.id as narcotic_id,
-                n.drug_type as drug_type,
-                n.drug_category as drug_category,
-                n.effect as description,
-                1 - (niv.image_vector <=> (SELECT v FROM query_vector)) as similarity
-            FROM 
-                narcotics_image_vectors niv
-            JOIN 
-                narcotics n ON niv.narcotic_id = n.id
-            ORDER BY 
-                niv.image_vector <=> (SELECT v FROM query_vector)
-            LIMIT :top_k
-        """)
-
-        # ลอง print ค่า similarity ของผลลัพธ์ที่ได้ออกมาดู
-        result = await db.execute(query, {"top_k": 10})
-        rows = result.mappings().all()
-        # เพิ่มการตรวจสอบข้อมูลในฟังก์ชัน search_similar_narcotics
-        check_query = text("SELECT COUNT(*) FROM narcotics_image_vectors")
-        count_result = await db.execute(check_query)
-        count = count_result.scalar_one()
-        print(f"Database has {count} vectors stored")
-        
-        return rows
+    async def search_similar_narcotics(
+        db: AsyncSession,
+        vector: List[float],
+        top_k: int = 10,
+        similarity_threshold: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for narcotics with similar image vectors (HNSW candidates re-ranked with the full vector)"""
+        return await vector_index_service.search_similar_vectors(
+            db,
+            vector,
+            top_k=top_k,
+            similarity_threshold=similarity_threshold
+        )
 
 async def format_narcotic(narcotic):
     """Format a narcotic object to a dictionary"""
@@ -1,9 +1,9 @@
-import json
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_, case
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, defer
 from typing import List, Dict, Any, Optional
+from core.geojson import geojson_column, parse_geojson
 from models.geography import Province
 
 # ✅ ปิด SQLAlchemy logs เฉพาะ province service
@@ -14,30 +14,25 @@ logging.getLogger('sqlalchemy.dialects').setLevel(logging.ERROR)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def get_provinces(db: AsyncSession) -> List[Dict[str, Any]]:
+async def get_provinces(
+    db: AsyncSession,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> List[Dict[str, Any]]:
     """
     ดึงข้อมูลจังหวัดทั้งหมด (ORM)
     """
     try:
-        query = select(Province).order_by(Province.province_name)
+        query = select(
+            Province,
+            geojson_column(Province.geom, simplify, precision)
+        ).options(defer(Province.geom)).order_by(Province.province_name)
         result = await db.execute(query)
-        provinces = result.scalars().all()
         
         provinces_data = []
-        for province in provinces:
+        for province, geojson in result.all():
             province_dict = province.to_dict()
-            
-            # ดึง geometry แยก
-            if province.geom:
-                geom_query = select(func.ST_AsGeoJSON(Province.geom)).where(Province.id == province.id)
-                geom_result = await db.execute(geom_query)
-                geom_json = geom_result.scalar()
-                if geom_json:
-                    try:
-                        province_dict["geometry"] = json.loads(geom_json)
-                    except json.JSONDecodeError:
-                        province_dict["geometry"] = None
-            
+            province_dict["geometry"] = parse_geojson(geojson)
             provinces_data.append(province_dict)
         
         logger.info(f"Fetched {len(provinces_data)} provinces")
@@ -47,30 +42,29 @@ async def get_provinces(db: AsyncSession) -> List[Dict[str, Any]]:
         logger.error(f"Error fetching provinces: {str(e)}", exc_info=True)
         return []
 
-async def get_province_by_id(db: AsyncSession, province_id: int) -> Dict[str, Any]:
+async def get_province_by_id(
+    db: AsyncSession,
+    province_id: int,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> Dict[str, Any]:
     """
     ดึงข้อมูลจังหวัดตาม ID (ORM)
     """
     try:
-        query = select(Province).where(Province.id == province_id)
+        query = select(
+            Province,
+            geojson_column(Province.geom, simplify, precision)
+        ).options(defer(Province.geom)).where(Province.id == province_id)
         result = await db.execute(query)
-        province = result.scalar_one_or_none()
+        row = result.first()
         
-        if not province:
+        if not row:
             return None
             
+        province, geojson = row
         province_dict = province.to_dict()
-        
-        # ดึง geometry แยก
-        if province.geom:
-            geom_query = select(func.ST_AsGeoJSON(Province.geom)).where(Province.id == province.id)
-            geom_result = await db.execute(geom_query)
-            geom_json = geom_result.scalar()
-            if geom_json:
-                try:
-                    province_dict["geometry"] = json.loads(geom_json)
-                except json.JSONDecodeError:
-                    province_dict["geometry"] = None
+        province_dict["geometry"] = parse_geojson(geojson)
         
         return province_dict
         
@@ -80,14 +74,19 @@ async def get_province_by_id(db: AsyncSession, province_id: int) -> Dict[str, An
 
 async def search_provinces_by_name(
     db: AsyncSession, 
-    search_term: str
+    search_term: str,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     ค้นหาจังหวัดจากชื่อ (ORM)
     """
     try:
         # สร้าง query ด้วย ORM
-        query = select(Province).where(
+        query = select(
+            Province,
+            geojson_column(Province.geom, simplify, precision)
+        ).options(defer(Province.geom)).where(
             or_(
                 func.lower(Province.province_name).like(func.lower(f"%{search_term}%")),
                 func.lower(Province.reg_nesdb).like(func.lower(f"%{search_term}%")),
@@ -104,24 +103,12 @@ async def search_provinces_by_name(
         )
         
         result = await db.execute(query)
-        provinces = result.scalars().all()
         
         # แปลงเป็น dict และเพิ่ม geometry
         provinces_data = []
-        for province in provinces:
+        for province, geojson in result.all():
             province_dict = province.to_dict()
-            
-            # ดึง geometry แยก
-            if province.geom:
-                geom_query = select(func.ST_AsGeoJSON(Province.geom)).where(Province.id == province.id)
-                geom_result = await db.execute(geom_query)
-                geom_json = geom_result.scalar()
-                if geom_json:
-                    try:
-                        province_dict["geometry"] = json.loads(geom_json)
-                    except json.JSONDecodeError:
-                        province_dict["geometry"] = None
-            
+            province_dict["geometry"] = parse_geojson(geojson)
             provinces_data.append(province_dict)
         
         logger.info(f"Found {len(provinces_data)} provinces for search term: {search_term}")
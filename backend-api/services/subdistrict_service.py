@@ -1,9 +1,9 @@
-import json
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, case
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, defer
 from typing import List, Dict, Any, Optional
+from core.geojson import geojson_column, parse_geojson
 from models.geography import Subdistrict, District, Province
 
 # ✅ ปิด SQLAlchemy logs เฉพาะ subdistrict service (นี้คือต้นตอหลัก)
@@ -17,13 +17,19 @@ logger = logging.getLogger(__name__)
 async def get_subdistricts(
     db: AsyncSession, 
     district_id: Optional[int] = None,
-    province_id: Optional[int] = None
+    province_id: Optional[int] = None,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     ดึงข้อมูลตำบลตามอำเภอและ/หรือจังหวัด (ORM)
     """
     try:
-        query = select(Subdistrict).options(
+        query = select(
+            Subdistrict,
+            geojson_column(Subdistrict.geom, simplify, precision)
+        ).options(
+            defer(Subdistrict.geom),
             selectinload(Subdistrict.district).selectinload(District.province)
         )
         
@@ -38,23 +44,11 @@ async def get_subdistricts(
         )
         
         result = await db.execute(query)
-        subdistricts = result.scalars().all()
         
         subdistricts_data = []
-        for subdistrict in subdistricts:
+        for subdistrict, geojson in result.all():
             subdistrict_dict = subdistrict.to_dict()
-            
-            # ดึง geometry แยก
-            if subdistrict.geom:
-                geom_query = select(func.ST_AsGeoJSON(Subdistrict.geom)).where(Subdistrict.id == subdistrict.id)
-                geom_result = await db.execute(geom_query)
-                geom_json = geom_result.scalar()
-                if geom_json:
-                    try:
-                        subdistrict_dict["geometry"] = json.loads(geom_json)
-                    except json.JSONDecodeError:
-                        subdistrict_dict["geometry"] = None
-            
+            subdistrict_dict["geometry"] = parse_geojson(geojson)
             subdistricts_data.append(subdistrict_dict)
         
         logger.info(f"Fetched {len(subdistricts_data)} subdistricts")
@@ -64,33 +58,33 @@ async def get_subdistricts(
         logger.error(f"Error fetching subdistricts: {str(e)}", exc_info=True)
         return []
 
-async def get_subdistrict_by_id(db: AsyncSession, subdistrict_id: int) -> Dict[str, Any]:
+async def get_subdistrict_by_id(
+    db: AsyncSession,
+    subdistrict_id: int,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
+) -> Dict[str, Any]:
     """
     ดึงข้อมูลตำบลตาม ID (ORM)
     """
     try:
-        query = select(Subdistrict).options(
+        query = select(
+            Subdistrict,
+            geojson_column(Subdistrict.geom, simplify, precision)
+        ).options(
+            defer(Subdistrict.geom),
             selectinload(Subdistrict.district).selectinload(District.province)
         ).where(Subdistrict.id == subdistrict_id)
         
         result = await db.execute(query)
-        subdistrict = result.scalar_one_or_none()
+        row = result.first()
         
-        if not subdistrict:
+        if not row:
             return None
         
+        subdistrict, geojson = row
         subdistrict_dict = subdistrict.to_dict()
-        
-        # ดึง geometry แยก
-        if subdistrict.geom:
-            geom_query = select(func.ST_AsGeoJSON(Subdistrict.geom)).where(Subdistrict.id == subdistrict.id)
-            geom_result = await db.execute(geom_query)
-            geom_json = geom_result.scalar()
-            if geom_json:
-                try:
-                    subdistrict_dict["geometry"] = json.loads(geom_json)
-                except json.JSONDecodeError:
-                    subdistrict_dict["geometry"] = None
+        subdistrict_dict["geometry"] = parse_geojson(geojson)
         
         return subdistrict_dict
         
@@ -102,14 +96,20 @@ async def search_subdistricts_by_name(
     db: AsyncSession, 
     search_term: str,
     district_id: Optional[int] = None,
-    province_id: Optional[int] = None
+    province_id: Optional[int] = None,
+    simplify: Optional[float] = None,
+    precision: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     ค้นหาตำบลจากชื่อ (ORM)
     """
     try:
         # สร้าง query ด้วย ORM พร้อม join district และ province
-        query = select(Subdistrict).options(
+        query = select(
+            Subdistrict,
+            geojson_column(Subdistrict.geom, simplify, precision)
+        ).options(
+            defer(Subdistrict.geom),
             selectinload(Subdistrict.district).selectinload(District.province)
         ).where(
             func.lower(Subdistrict.subdistrict_name).like(func.lower(f"%{search_term}%"))
@@ -135,24 +135,12 @@ async def search_subdistricts_by_name(
         )
         
         result = await db.execute(query)
-        subdistricts = result.scalars().all()
         
         # แปลงเป็น dict และเพิ่ม geometry
         subdistricts_data = []
-        for subdistrict in subdistricts:
+        for subdistrict, geojson in result.all():
             subdistrict_dict = subdistrict.to_dict()
-            
-            # ดึง geometry แยก
-            if subdistrict.geom:
-                geom_query = select(func.ST_AsGeoJSON(Subdistrict.geom)).where(Subdistrict.id == subdistrict.id)
-                geom_result = await db.execute(geom_query)
-                geom_json = geom_result.scalar()
-                if geom_json:
-                    try:
-                        subdistrict_dict["geometry"] = json.loads(geom_json)
-                    except json.JSONDecodeError:
-                        subdistrict_dict["geometry"] = None
-            
+            subdistrict_dict["geometry"] = parse_geojson(geojson)
             subdistricts_data.append(subdistrict_dict)
         
         logger.info(f"Found {len(subdistricts_data)} subdistricts for search term: {search_term}")
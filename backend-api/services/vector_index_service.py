@@ -0,0 +1,361 @@
+"""
+Compact search index for narcotic image vectors.
+
+image_vector (16000 มิติ) ใหญ่เกินกว่าที่ pgvector จะทำ HNSW/IVFFlat index ได้ (สูงสุด 2000 มิติ)
+จึงเก็บ search_vector ที่ย่อด้วย projection (PCA หรือ random projection ที่ fit จาก vector ในฐานข้อมูล)
+แล้วค้นหา 2 ขั้น: ดึง candidates จาก HNSW index บน search_vector แล้ว re-rank ด้วย image_vector เต็ม
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import or_, select, text, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from models.narcotic import (
+    Narcotic,
+    NarcoticExampleImage,
+    NarcoticImageVector,
+    NarcoticVectorProjection,
+    IMAGE_VECTOR_DIM,
+    SEARCH_VECTOR_DIM,
+)
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_METHODS = ("auto", "pca", "random")
+
+# SQL สำหรับ migrate ฐานข้อมูลเดิม (ตารางใหม่สร้างผ่าน metadata)
+MIGRATION_STATEMENTS = [
+    f"ALTER TABLE narcotics_image_vectors ADD COLUMN IF NOT EXISTS search_vector vector({SEARCH_VECTOR_DIM})",
+    "ALTER TABLE narcotics_image_vectors ADD COLUMN IF NOT EXISTS projection_id integer "
+    "REFERENCES narcotic_vector_projections(id) ON DELETE SET NULL",
+    "CREATE INDEX IF NOT EXISTS ix_narcotics_image_vectors_search_vector_hnsw "
+    "ON narcotics_image_vectors USING hnsw (search_vector vector_cosine_ops) "
+    "WITH (m = 16, ef_construction = 64)",
+]
+
+
+class VectorProjector:
+    """แปลง image_vector (source_dim) เป็น search_vector (target_dim)"""
+
+    def __init__(self, projection_id: int, mean: np.ndarray, matrix: np.ndarray):
+        self.projection_id = projection_id
+        self.mean = mean.astype(np.float32, copy=False)
+        self.matrix = matrix.astype(np.float32, copy=False)
+
+    @property
+    def source_dim(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def target_dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def project(self, vectors) -> np.ndarray:
+        """Project vector เดียว (1D) หรือหลาย vector (2D) แล้ว L2-normalize"""
+        array = np.asarray(vectors, dtype=np.float32)
+        single = array.ndim == 1
+        if single:
+            array = array[None, :]
+        if array.shape[1] != self.source_dim:
+            raise ValueError(
+                f"Expected vectors of dimension {self.source_dim}, got {array.shape[1]}"
+            )
+
+        projected = (array - self.mean) @ self.matrix
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        projected = projected / np.maximum(norms, 1e-12)
+        return projected[0] if single else projected
+
+
+def random_projection_matrix(source_dim: int, target_dim: int, seed: int) -> np.ndarray:
+    """Gaussian random projection (Johnson-Lindenstrauss) ที่สร้างซ้ำได้จาก seed"""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((source_dim, target_dim), dtype=np.float32)
+    return matrix / np.float32(np.sqrt(target_dim))
+
+
+def fit_projection(
+    vectors: np.ndarray,
+    method: str = "auto",
+    target_dim: int = SEARCH_VECTOR_DIM,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    Fit projection จากตัวอย่าง vector
+
+    - pca: ใช้ principal components ของตัวอย่าง (ถ้าตัวอย่างน้อยกว่า target_dim ส่วนที่เหลือเติมศูนย์)
+    - random: ใช้ random projection จาก seed โดยลบค่าเฉลี่ยของตัวอย่างก่อน
+    - auto: ใช้ pca เมื่อมีตัวอย่างอย่างน้อย target_dim รายการ ไม่เช่นนั้นใช้ random
+    """
+    if method not in PROJECTION_METHODS:
+        raise ValueError(f"Unknown projection method: {method}")
+
+    samples = np.asarray(vectors, dtype=np.float32)
+    if samples.ndim != 2 or samples.shape[0] == 0:
+        raise ValueError("At least one stored vector is required to fit a projection")
+
+    sample_count, source_dim = samples.shape
+    if method == "auto":
+        method = "pca" if sample_count >= target_dim else "random"
+
+    mean = samples.mean(axis=0)
+    components = None
+
+    if method == "pca":
+        centered = samples - mean
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        components = np.zeros((source_dim, target_dim), dtype=np.float32)
+        k = min(target_dim, vt.shape[0])
+        components[:, :k] = vt[:k].T
+        matrix = components
+    else:
+        matrix = random_projection_matrix(source_dim, target_dim, seed)
+
+    return {
+        "method": method,
+        "source_dim": source_dim,
+        "target_dim": target_dim,
+        "seed": seed if method == "random" else None,
+        "sample_count": sample_count,
+        "mean": mean.astype(np.float32),
+        "components": components,
+        "matrix": matrix,
+    }
+
+
+def build_projector(projection: NarcoticVectorProjection) -> VectorProjector:
+    """สร้าง VectorProjector จากแถวใน narcotic_vector_projections"""
+    mean = np.frombuffer(projection.mean, dtype=np.float32)
+    if projection.method == "pca":
+        matrix = np.frombuffer(projection.components, dtype=np.float32).reshape(
+            projection.source_dim, projection.target_dim
+        )
+    else:
+        matrix = random_projection_matrix(projection.source_dim, projection.target_dim, projection.seed)
+    return VectorProjector(projection.id, mean, matrix)
+
+
+# cache projector ของ process นี้ (matrix ใหญ่ จึงโหลดใหม่เฉพาะเมื่อ projection ที่ active เปลี่ยน)
+_projector_cache: Dict[str, Optional[VectorProjector]] = {"projector": None}
+
+
+async def get_active_projector(db: AsyncSession) -> Optional[VectorProjector]:
+    """คืน projector ที่ active อยู่ หรือ None ถ้ายังไม่เคย backfill"""
+    result = await db.execute(
+        select(NarcoticVectorProjection.id)
+        .where(NarcoticVectorProjection.is_active.is_(True))
+        .order_by(NarcoticVectorProjection.id.desc())
+        .limit(1)
+    )
+    active_id = result.scalar_one_or_none()
+    if active_id is None:
+        return None
+
+    cached = _projector_cache["projector"]
+    if cached is not None and cached.projection_id == active_id:
+        return cached
+
+    result = await db.execute(
+        select(NarcoticVectorProjection).where(NarcoticVectorProjection.id == active_id)
+    )
+    projector = build_projector(result.scalar_one())
+    _projector_cache["projector"] = projector
+    logger.info(f"Loaded narcotic vector projection #{active_id}")
+    return projector
+
+
+async def project_vector(db: AsyncSession, vector: Sequence[float]) -> Dict[str, Any]:
+    """คืนค่า search_vector และ projection_id สำหรับบันทึกคู่กับ image_vector"""
+    projector = await get_active_projector(db)
+    if projector is None or len(vector) != projector.source_dim:
+        return {"search_vector": None, "projection_id": None}
+    return {
+        "search_vector": projector.project(vector).tolist(),
+        "projection_id": projector.projection_id,
+    }
+
+
+async def search_similar_vectors(
+    db: AsyncSession,
+    vector: Sequence[float],
+    top_k: int = 5,
+    similarity_threshold: Optional[float] = None,
+    candidates: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    ค้นหา narcotic image vectors ที่คล้ายกับ vector ที่ให้มา
+
+    ขั้นแรกดึง candidates จาก HNSW index บน search_vector แล้ว re-rank ด้วย cosine similarity
+    ของ image_vector เต็ม แถวที่ยังไม่ได้ project ด้วย projection ที่ active (projection_id เป็น NULL
+    หรือเป็น projection เก่า) ค้นหาแบบ exact บน image_vector ถ้ายังไม่มี projection จะค้นหาแบบ
+    sequential scan บน image_vector ทั้งหมด
+    """
+    query_vector = np.asarray(vector, dtype=np.float32)
+    projector = await get_active_projector(db)
+    distance = NarcoticImageVector.image_vector.cosine_distance(query_vector)
+    columns = (
+        NarcoticImageVector.id.label("vector_id"),
+        NarcoticImageVector.narcotic_id,
+        NarcoticImageVector.image_id,
+        distance.label("distance"),
+    )
+
+    if projector is not None and query_vector.shape[0] == projector.source_dim:
+        candidate_count = max(candidates or settings.NARCOTIC_SEARCH_CANDIDATES, top_k)
+        ef_search = max(settings.NARCOTIC_HNSW_EF_SEARCH, candidate_count)
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+
+        compact_vector = projector.project(query_vector)
+        indexed = (
+            select(*columns)
+            .where(NarcoticImageVector.projection_id == projector.projection_id)
+            .order_by(NarcoticImageVector.search_vector.cosine_distance(compact_vector))
+            .limit(candidate_count)
+            .subquery()
+        )
+        # แถวที่ยังไม่มี search_vector ของ projection นี้ (เพิ่มระหว่าง backfill หรือ backfill ไม่ครบ)
+        # ค้นหาแบบ exact บน image_vector เพื่อไม่ให้หายไปจากผลลัพธ์
+        unindexed = (
+            select(*columns)
+            .where(or_(
+                NarcoticImageVector.projection_id.is_(None),
+                NarcoticImageVector.projection_id != projector.projection_id,
+            ))
+            .order_by(distance)
+            .limit(top_k)
+            .subquery()
+        )
+        candidate_query = union_all(select(indexed), select(unindexed)).subquery()
+    else:
+        logger.warning("No narcotic vector projection available, falling back to exact search")
+        candidate_query = select(*columns).order_by(distance).limit(top_k).subquery()
+
+    similarity = (1 - candidate_query.c.distance).label("similarity")
+    query = (
+        select(
+            candidate_query.c.vector_id,
+            Narcotic.id.label("narcotic_id"),
+            Narcotic.drug_type,
+            Narcotic.drug_category,
+            Narcotic.characteristics,
+            Narcotic.effect.label("description"),
+            NarcoticExampleImage.id.label("image_id"),
+            NarcoticExampleImage.image_url,
+            NarcoticExampleImage.description.label("image_description"),
+            similarity,
+        )
+        .join(Narcotic, Narcotic.id == candidate_query.c.narcotic_id)
+        .outerjoin(NarcoticExampleImage, NarcoticExampleImage.id == candidate_query.c.image_id)
+        .order_by(candidate_query.c.distance)
+        .limit(top_k)
+    )
+    if similarity_threshold is not None:
+        query = query.where(1 - candidate_query.c.distance > similarity_threshold)
+
+    result = await db.execute(query)
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def migrate(conn) -> None:
+    """เพิ่มตาราง projection, คอลัมน์ search_vector และ HNSW index ให้ฐานข้อมูลเดิม"""
+    await conn.run_sync(NarcoticVectorProjection.__table__.create, checkfirst=True)
+    for statement in MIGRATION_STATEMENTS:
+        await conn.execute(text(statement))
+
+
+async def backfill(
+    db: AsyncSession,
+    method: str = "auto",
+    sample_size: int = 4096,
+    batch_size: int = 256,
+    seed: int = 42,
+) -> Dict[str, Any]:
+    """
+    Fit projection ใหม่จาก vector ที่เก็บไว้ คำนวณ search_vector ของทุกแถว แล้วจึงตั้งให้เป็น active
+    """
+    result = await db.execute(
+        select(NarcoticImageVector.image_vector)
+        .where(NarcoticImageVector.image_vector.isnot(None))
+        .order_by(text("random()"))
+        .limit(sample_size)
+    )
+    samples = [np.asarray(v, dtype=np.float32) for v in result.scalars().all()]
+    samples = [v for v in samples if v.shape[0] == IMAGE_VECTOR_DIM]
+    if not samples:
+        raise ValueError("No stored narcotic image vectors to fit a projection from")
+
+    fitted = fit_projection(np.stack(samples), method=method, seed=seed)
+    del samples
+
+    # projection ใหม่ยังไม่ active จนกว่า backfill เสร็จ: ระหว่างนี้การค้นหายังใช้ projection เดิม
+    projection = NarcoticVectorProjection(
+        method=fitted["method"],
+        source_dim=fitted["source_dim"],
+        target_dim=fitted["target_dim"],
+        seed=fitted["seed"],
+        sample_count=fitted["sample_count"],
+        mean=fitted["mean"].tobytes(),
+        components=fitted["components"].tobytes() if fitted["components"] is not None else None,
+        is_active=False,
+    )
+    db.add(projection)
+    await db.commit()
+    await db.refresh(projection)
+
+    projector = VectorProjector(projection.id, fitted["mean"], fitted["matrix"])
+
+    updated = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(NarcoticImageVector.id, NarcoticImageVector.image_vector)
+            .where(NarcoticImageVector.id > last_id)
+            .order_by(NarcoticImageVector.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        rows = [
+            row for row in rows
+            if row.image_vector is not None and len(row.image_vector) == projector.source_dim
+        ]
+        if rows:
+            projected = projector.project(np.stack([np.asarray(row.image_vector) for row in rows]))
+            await db.execute(
+                update(NarcoticImageVector),
+                [
+                    {"id": row.id, "search_vector": projected[i].tolist(), "projection_id": projection.id}
+                    for i, row in enumerate(rows)
+                ],
+            )
+            await db.commit()
+            updated += len(rows)
+            logger.info(f"Backfilled {updated} narcotic search vectors")
+
+    # สลับ projection ที่ active ใน transaction เดียว (แถวที่เพิ่มระหว่าง backfill ยังถูกค้นหาแบบ exact)
+    await db.execute(
+        update(NarcoticVectorProjection)
+        .where(NarcoticVectorProjection.is_active.is_(True))
+        .values(is_active=False)
+    )
+    await db.execute(
+        update(NarcoticVectorProjection)
+        .where(NarcoticVectorProjection.id == projection.id)
+        .values(is_active=True)
+    )
+    await db.commit()
+    _projector_cache["projector"] = projector
+    logger.info(f"Activated narcotic vector projection #{projection.id}")
+
+    return {
+        "projection_id": projection.id,
+        "method": projection.method,
+        "sample_count": projection.sample_count,
+        "updated": updated,
+    }